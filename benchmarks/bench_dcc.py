@@ -0,0 +1,254 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Benchmark für den Hot Path der DCC-Paketerzeugung (Refresh-Zyklus)
+# rebuild:              kompletter Rebuild aller Slots (alle ungültig, relayout(), buffering())
+# buffering_one_loco:   buffering() nach einem Fahrbefehl an eine Lok (nur deren Slot ungültig)
+# rebuild_continuous:   kompletter Rebuild mit ELECTRICAL.PACKING = "continuous"
+# rebuild_byte:         kompletter Rebuild mit ELECTRICAL.PACKING = "byte"
+#
+# Läuft unter CPython und auf dem MicroPython-Unix-Port (mit der Host-Emulation):
+#
+#   python3 benchmarks/bench_dcc.py              Messung, Vergleich mit gespeicherter Baseline
+#   python3 benchmarks/bench_dcc.py --save       Messung als neue Baseline speichern
+#   python3 benchmarks/bench_dcc.py --check      Exit-Code 1 bei Regression
+#   python3 benchmarks/bench_dcc.py --quick      nur Flottengrößen 1 und 10
+#   python3 benchmarks/bench_dcc.py rebuild      nur Fälle, deren Name "rebuild" enthält
+#   micropython benchmarks/bench_dcc.py
+#
+# Ausgabe je Fall: µs pro Aufruf (bei Flotten: pro Rebuild), Bytes Heap-Allokation
+# pro Aufruf und Anzahl der erzeugten 32-Bit-Worte.
+#   CPython:     Allokation = Spitzenwert lt. tracemalloc während des Aufrufs
+#   MicroPython: Allokation = gc.mem_alloc()-Zuwachs bei abgeschaltetem GC
+#
+# Die Baselines liegen in benchmarks/baseline-<implementation>.json. Ändert sich, was
+# ein Fall misst, bekommt er einen neuen Namen; ändert sich das Ergebnis (z.B. die
+# Anzahl der Worte), wird die Baseline im selben Commit neu gespeichert (--save).
+#
+# ----------------------------------------------------------------------
+
+import sys
+import gc
+import json
+
+_here = __file__.replace("\\", "/")
+_root = _here[:_here.rfind("/benchmarks/")] if "/benchmarks/" in _here else "."
+if _root not in sys.path:
+    sys.path.insert(0, _root)
+
+import host
+host.install()
+
+from classes.operationmode import OPERATIONS as OP
+from classes.packetencoder import BITPACKER as bitpacker, BYTEPACKER as bytepacker
+
+IMPLEMENTATION = sys.implementation.name
+BASELINE = _root + "/benchmarks/baseline-" + IMPLEMENTATION + ".json"
+
+FLEETS = (1, 10, 50, 200)
+QUICK_FLEETS = (1, 10)
+SPEEDSTEPS = (14, 28, 128)
+FUNCTION_GROUPS = (0, 3)         # Anzahl Funktionsgruppen mit eingeschalteter Funktion
+GROUP_FUNCTIONS = (0, 5, 9)      # je Gruppe eine Funktion
+MIN_TIME_US = 200000             # Messdauer je Fall
+TOLERANCE = 0.25                 # zulässige Verlangsamung gegenüber Baseline
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+if hasattr(sys, "getrefcount"):  # CPython
+    import time
+
+    def now_us():
+        return time.perf_counter_ns() // 1000
+
+    def elapsed_us(start):
+        return now_us() - start
+else:
+    import time
+
+    def now_us():
+        return time.ticks_us()
+
+    def elapsed_us(start):
+        return time.ticks_diff(time.ticks_us(), start)
+
+
+# Heap-Allokation eines Aufrufs in Bytes
+def allocation(function):
+    if tracemalloc is not None:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak - before
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    function()
+    allocated = gc.mem_alloc() - before
+    gc.enable()
+    return allocated
+
+
+# µs pro Aufruf (Minimum über mehrere Durchgänge)
+def timing(function):
+    number = 1
+    while True:
+        start = now_us()
+        for i in range(number):
+            function()
+        duration = elapsed_us(start)
+        if duration >= MIN_TIME_US // 10:
+            break
+        number *= 4
+    best = duration / number
+    total = duration
+    while total < MIN_TIME_US:
+        start = now_us()
+        for i in range(number):
+            function()
+        duration = elapsed_us(start)
+        total += duration
+        best = min(best, duration / number)
+    return best
+
+
+# Flotte aufbauen: Adressen abwechselnd kurz und lang, Fahrstufen verteilt
+def setup_fleet(size, speedsteps, function_groups):
+    OP.__init__()
+    OP.begin()
+    for i in range(size):
+        address = 3 + i if i % 2 == 0 else 1000 + i
+        OP.ctrl_loco(address, address > 127, speedsteps)
+        for g in range(function_groups):
+            OP.set_function(GROUP_FUNCTIONS[g])
+        OP.drive(i % 2, 1 + (i * 7) % min(speedsteps, 126))
+    OP.buffering()
+
+
+# kompletter Rebuild: alle Slots aller Loks ungültig
+def rebuild():
+    for loco in OP.locos:
+        OP.invalidate(loco)
+    OP.relayout()
+    return OP.buffering()
+
+
+# Fahrbefehl an eine Lok: nur deren Fahrstufen-Slot ist ungültig
+def rebuild_one():
+    OP.invalidate(OP.locos[-1], OP.SLOT_SPEED)
+    return OP.buffering()
+
+
+def fleet_cases(fleets):
+    for size in fleets:
+        for speedsteps in SPEEDSTEPS:
+            for function_groups in FUNCTION_GROUPS:
+                yield size, speedsteps, function_groups
+
+
+def run(pattern="", fleets=FLEETS):
+    results = {}
+
+    def record(name, function, words):
+        if pattern and pattern not in name:
+            return
+        function()  # aufwärmen
+        us = timing(function)
+        alloc = allocation(function)
+        results[name] = {"us": round(us, 2), "alloc": alloc, "words": words}
+        report(name, results[name])
+
+    # Einzelfunktionen
+    setup_fleet(1, 128, 0)
+    packets = [[3, 0b01110100], [0xc3, 0xe8, 0b00111111, 0b10010000], [0x80, 0xf1, 0x07]]
+    for packet in packets:
+        name = "prepare/%d_bytes" % len(packet)
+        record(name, lambda p=packet: OP.prepare(list(p)), OP.prepare(list(packet))[0])
+    record("to_bin/256_values", lambda: [OP.to_bin(b) for b in range(256)], 0)
+
+    for size, speedsteps, function_groups in fleet_cases(fleets):
+        setup_fleet(size, speedsteps, function_groups)
+        key = "%d_locos/%d_steps/%d_fgroups" % (size, speedsteps, function_groups)
+        words = len(OP.buffering())
+        lengths, streams = OP.generate_instructions()
+        record("generate_address/" + key, lambda: [OP.generate_address(l) for l in OP.locos], 0)
+        record("generate_instructions/" + key, OP.generate_instructions, words)
+        record("make_buffer/" + key, lambda: OP.make_buffer(list(lengths), streams), words)
+        record("rebuild/" + key, rebuild, words)
+        record("buffering_one_loco/" + key, rebuild_one, words)
+        OP.PACKING = "continuous"
+        record("rebuild_continuous/" + key, rebuild, len(rebuild()))
+        OP.PACKING = "byte"
+        OP.packer = bytepacker(OP.PREAMBLE)
+        record("rebuild_byte/" + key, rebuild, len(rebuild()))
+        OP.PACKING = "word"
+        OP.packer = bitpacker(OP.PREAMBLE)
+    OP.power_off()
+    return results
+
+
+def report(name, result, baseline=None):
+    line = "%-48s %10.1f µs %9d B %6d words" % (name, result["us"], result["alloc"], result["words"])
+    print(line)
+
+
+def load_baseline():
+    try:
+        with open(BASELINE) as f:
+            return json.load(f)
+    except OSError:
+        return None
+
+
+def compare(results, baseline):
+    regressions = 0
+    print()
+    print("Vergleich mit %s (Toleranz %d %%):" % (BASELINE, TOLERANCE * 100))
+    for name in results:
+        if name not in baseline:
+            continue
+        now = results[name]
+        base = baseline[name]
+        ratio = now["us"] / base["us"] if base["us"] else 1.0
+        flag = ""
+        if ratio > 1 + TOLERANCE:
+            flag = "  << LANGSAMER"
+            regressions += 1
+        if now["words"] != base["words"]:
+            flag += "  << WORTE %d -> %d" % (base["words"], now["words"])
+        print("%-48s %7.2fx  %9d -> %9d B%s" % (name, ratio, base["alloc"], now["alloc"], flag))
+    return regressions
+
+
+def main(args):
+    pattern = ""
+    for a in args:
+        if not a.startswith("--"):
+            pattern = a
+    results = run(pattern, QUICK_FLEETS if "--quick" in args else FLEETS)
+    if "--save" in args:
+        with open(BASELINE, "w") as f:
+            json.dump(results, f)
+        print("Baseline gespeichert:", BASELINE)
+        return 0
+    baseline = load_baseline()
+    if baseline is None:
+        print("Keine Baseline für", IMPLEMENTATION, "- mit --save anlegen")
+        return 0
+    regressions = compare(results, baseline)
+    if regressions and "--check" in args:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
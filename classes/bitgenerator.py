@@ -18,6 +18,15 @@ import machine
 #  H  |  L  |   H   | A2, B2 -> Brake (Motor kurzgeschlossen über GND
 #  L  |  X  |   H   | None   -> Power off
 #
+# Programme:
+# program="bit":  dccbit / dccbit_2_pwm, jedes Bit der FIFO ist ein DCC-Bit (Präambel, Trenn- und Endbits
+#                 werden von der CPU in die Worte gepackt). Ist die FIFO an einer Wortgrenze leer, sendet
+#                 die StateMachine ein IDLE-Paket und meldet es mit irq(rel(0)) (BITGENERATOR.idle_packets).
+# program="byte": dccbyte / dccbyte_2_pwm, die FIFO enthält je Paket ein Längenbyte N und N Bytes (Daten + XOR),
+#                 Präambel (14 Einsen), '0'-Trennbits und '1'-Endbit erzeugt die StateMachine selbst.
+#                 Ein Längenbyte 0 ist ein Füllbyte und erzeugt eine zusätzliche '1' (Auffüllen bis zur Wortgrenze).
+#                 Bei leerer FIFO zwischen zwei Paketen werden Einsen gesendet (pull noblock kopiert x = 0 ins OSR).
+#
 # DRV8871 Logiktabelle:
 # IN1 | IN2 | Output
 # ----+-----+-------
@@ -31,22 +40,67 @@ import machine
 class BITGENERATOR():
     # Ausgangszustand = nix!
     statemachine = None
+    sm_id = 0       # StateMachine 0 (PIO0), auch für den DMA-Refresh
+    # IDLE-Paket ohne die ersten 10 Präambel-Einsen: 1111 0 11111111 0 00000000 0 11111111 1
+    IDLE_WORD = 0b11110111111110000000000111111111
+    WORD_MAX_US = 32 * 200  # längstes Wort der Bit-Programme: 32 '0'-Bits
+    idle_packets = 0    # von den Bit-Programmen bei leerer FIFO selbst erzeugte IDLE-Pakete (bzw. 42 Einsen)
     
-    def __init__(cls, base_pin=None, model="LMD18200T"):
+    def __init__(cls, base_pin=None, model="LMD18200T", program="bit"):
         if base_pin == None:
             raise(ValueError("Kein Basis-Pin für die Ausgabe"))
-        if model == "DRV8871":
-            cls.statemachine = rp2.StateMachine(0, cls.dccbit_2_pwm, freq=500000, set_base=machine.Pin(base_pin))
-        elif model == "LMD18200T":
-            cls.statemachine = rp2.StateMachine(0, cls.dccbit, freq=500000, set_base=machine.Pin(base_pin))
+        if program == "bit":
+            programs = {"DRV8871": cls.dccbit_2_pwm, "LMD18200T": cls.dccbit}
+        elif program == "byte":
+            programs = {"DRV8871": cls.dccbyte_2_pwm, "LMD18200T": cls.dccbyte}
         else:
+            raise(ValueError(f"Programm {program} unbekannt"))
+        if model not in programs:
             raise(ValueError(f"{model} unbekannt"))
+        cls.statemachine = rp2.StateMachine(cls.sm_id, programs[model], freq=500000, set_base=machine.Pin(base_pin))
         cls.model = model
+        cls.program = program
+        cls.fifo_depth = 8 if program == "byte" else 4   # Byte-Programme: FIFO_JOIN_TX
+        cls.idle_packets = 0
         
-    def begin(cls):
+    # idle = False: bei leerer FIFO nur Einsen senden (Servicemode)
+    def begin(cls, idle=True):
+        if cls.program == "byte":
+            cls.statemachine.exec('set(x, 0)')   # x = 0: bei leerer FIFO liefert pull noblock ein Füllbyte
+        else:
+            # IDLE-Wort ins ISR laden, das OSR bleibt leer
+            cls.statemachine.put(cls.IDLE_WORD if idle else 0xffffffff)
+            cls.statemachine.exec('pull()')
+            cls.statemachine.exec('mov(isr, osr)')
+            cls.statemachine.exec('out(null, 32)')
+            cls.statemachine.irq(cls.count_idle)
         cls.statemachine.active(1)
         if (cls.model == 'DRV8871'):
             cls.statemachine.exec('set(pins, 0b11)')
+
+    # TX-FIFO leeren (z.B. für den Nothalt), wie pio_sm_drain_tx_fifo() im SDK: mit Autopull holt
+    # jedes out(null, 32) das nächste Wort. War die FIFO schon leer, wird das laufende Wort (bei
+    # PACKING = "word" das laufende Paket) noch fertig gesendet. Die StateMachine läuft dabei weiter,
+    # damit das Gleissignal nicht steht; das Byte-Programm beginnt neu (das laufende Bit wird gekürzt).
+    # Liefert die längste Zeit in µs, bis die StateMachine das nächste Wort aus der FIFO übernimmt.
+    def flush(cls):
+        sm = cls.statemachine
+        drained = False
+        while sm.tx_fifo():
+            sm.exec('out(null, 32)')
+            drained = True
+        if cls.program == "byte":
+            sm.restart()                # Schiebezähler 0: OSR gilt als voll, blockiert also nicht
+            sm.exec('out(null, 32)')
+            sm.exec('set(x, 0)')
+            return 0
+        if drained:
+            sm.exec('out(null, 32)')    # letztes Wort der FIFO verwerfen
+        return cls.WORD_MAX_US          # Rest des laufenden Wortes
+
+    # irq(rel(0)) der Bit-Programme: ein IDLE-Paket erzeugt
+    def count_idle(cls, sm=None):
+        cls.idle_packets += 1
         
     def end(cls):
         if cls.model == "DRV8871":
@@ -56,49 +110,175 @@ class BITGENERATOR():
     def put(cls, word):
         cls.statemachine.put(word)
 
+    # belegte Plätze in der TX-FIFO
+    def tx_fifo(cls):
+        return cls.statemachine.tx_fifo()
+
 # 0 = 100µs = 50 Takte, 1 = 58µs = 29 Takte
+# Bit-Programme: leert sich die FIFO, sendet die StateMachine selbst IDLE-Pakete: 10 Einsen,
+# dann das IDLE-Wort aus dem ISR (4 Einsen + 0 11111111 0 00000000 0 11111111 1), je Paket irq(rel(0))
 # für DDRV8871 H-Bridge-Modul
-# mit Leerlauf ==> IDLE?         cycles
     @rp2.asm_pio(set_init=(rp2.PIO.OUT_LOW, rp2.PIO.OUT_LOW), out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True)
     def dccbit_2_pwm():
+        wrap_target()
         label("bitstart")        # _–
         set(pins, 0b10)[24]      # 25     1
         jmp(not_osre, "next")    # 26     2
-        # default: Einsen
-        mov(x, 0)                # 27     3
-        jmp("check")             # 28     4
+        jmp("idle")              # 27     3  FIFO leer
         
         label("next")            # --      
-        out(x, 1)[1]             # 28     5
-        label("check")
-        jmp(not_x, "is_zero")    # 29     6
-        set(pins, 0b01)[27]      # 28     7
-        jmp("bitstart")          # 29     8
+        out(x, 1)[1]             # 28     4
+        jmp(not_x, "is_zero")    # 29     5
+        set(pins, 0b01)[27]      # 28     6
+        jmp("bitstart")          # 29     7
         label("is_zero")       
-        nop()[20]                # 50      9
-        set(pins, 0b01)[28]      # 29     10 
-        nop()[20]                # 50     11
+        nop()[20]                # 50     8
+        set(pins, 0b01)[28]      # 29     9
+        nop()[19]                # 49    10
+        jmp("bitstart")          # 50    11
 
-# für LM18200D H-Bridge-Module mit Einsen als Leerlauf
+        label("idle")            # IDLE-Paket, dies ist die 1. Eins
+        mov(x, isr)              # 28    12  IDLE-Wort
+        set(y, 8)                # 29    13  9 weitere Einsen
+        set(pins, 0b01)[27]      # 28    14
+        irq(rel(0))              # 29    15  IDLE-Paket zählen
+        label("idle_one")
+        set(pins, 0b10)[28]      # 29    16
+        set(pins, 0b01)[26]      # 27    17
+        jmp(y_dec, "idle_next")  # 28    18
+        pull(ifempty, noblock)   # 29    19  FIFO leer: OSR = x = IDLE-Wort
+        wrap()
+        label("idle_next")
+        jmp("idle_one")          # 29    20
+
+# für LM18200D H-Bridge-Module
     @rp2.asm_pio(set_init=(rp2.PIO.OUT_HIGH), out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True)
     def dccbit():
+        wrap_target()
         label("bitstart")        # _–
         set(pins, 1)[24]         # 25     1
         jmp(not_osre, "next")    # 26     2
-        # default: Einsen
-        mov(x, 0)                # 27     3  
-        jmp("check")             # 28     4
+        jmp("idle")              # 27     3  FIFO leer
         
         label("next")            # --      
-        out(x, 1)[1]             # 28     5
-        label("check")
-        jmp(not_x, "is_zero")    # 29     6
-        set(pins, 0)[27]         # 28     7
-        jmp("bitstart")          # 29     8
+        out(x, 1)[1]             # 28     4
+        jmp(not_x, "is_zero")    # 29     5
+        set(pins, 0)[27]         # 28     6
+        jmp("bitstart")          # 29     7
         label("is_zero")       
-        nop()[20]                # 50      9
-        set(pins, 0)[28]         # 29     10 
-        nop()[20]                # 50     11
+        nop()[20]                # 50     8
+        set(pins, 0)[28]         # 29     9
+        nop()[19]                # 49    10
+        jmp("bitstart")          # 50    11
+
+        label("idle")            # IDLE-Paket, dies ist die 1. Eins
+        mov(x, isr)              # 28    12  IDLE-Wort
+        set(y, 8)                # 29    13  9 weitere Einsen
+        set(pins, 0)[27]         # 28    14
+        irq(rel(0))              # 29    15  IDLE-Paket zählen
+        label("idle_one")
+        set(pins, 1)[28]         # 29    16
+        set(pins, 0)[26]         # 27    17
+        jmp(y_dec, "idle_next")  # 28    18
+        pull(ifempty, noblock)   # 29    19  FIFO leer: OSR = x = IDLE-Wort
+        wrap()
+        label("idle_next")
+        jmp("idle_one")          # 29    20
+
+# Byte-Programme: Längenbyte N, dann N Bytes (Daten + XOR), Präambel und Trennbits erzeugt die StateMachine
+# x muss beim Sprung nach "packet" 0 sein (pull noblock bei leerer FIFO kopiert x ins OSR)
+# Das OSR leert sich nur an Bytegrenzen: vor dem Längenbyte holt pull noblock ein Füllbyte, vor jedem
+# weiteren Byte prüft jmp(not_osre), ob Daten da sind - sonst Einsen statt out() mit Pegel high (Gleichspannung)
+# Takte je Halbbit: 1 = 29 + 29, 0 = 50 + 50
+# für LM18200D H-Bridge-Module
+    @rp2.asm_pio(set_init=(rp2.PIO.OUT_HIGH), out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=32, fifo_join=rp2.PIO.JOIN_TX)
+    def dccbyte():
+        label("packet")          # _-  1. Präambelbit, Länge holen
+        set(pins, 1)             # 1      1
+        pull(ifempty, noblock)   # 2      2  FIFO leer: OSR = x = 0
+        out(x, 8)                # 3      3  N
+        mov(isr, x)              # 4      4  Restlänge in isr
+        set(y, 12)               # 5      5  13 weitere Präambelbits
+        jmp(not_x, "end_low")[23] # 29    6  Füllbyte: nur diese '1'
+        set(pins, 0)[28]         # 29     7
+        label("preamble")
+        set(pins, 1)[28]         # 29     8
+        set(pins, 0)[27]         # 28     9
+        jmp(y_dec, "preamble")   # 29    10
+        wrap_target()
+        label("next")            # _-  Trennbit '0' oder Endbit '1'
+        set(pins, 1)             # 1     11
+        mov(x, isr)              # 2     12
+        jmp(x_dec, "separator")  # 3     13
+        set(x, 0)[25]            # 29    14  Endbit, x = 0 für pull noblock
+        label("end_low")
+        set(pins, 0)[27]         # 28    15
+        jmp("packet")            # 29    16
+        label("separator")
+        jmp(not_osre, "byte")    # 4     17  nächstes Byte im OSR
+        nop()[24]                # 29    18  FIFO mitten im Paket leer: '1' senden,
+        set(pins, 0)[27]         # 28    19  bis Daten kommen (isr unverändert)
+        jmp("next")              # 29    20
+        label("byte")
+        mov(isr, x)[30]          # 35    21
+        set(y, 7)[14]            # 50    22  8 Datenbits
+        set(pins, 0)[31]         # 32    23
+        nop()[17]                # 50    24
+        label("bit")             # _-
+        set(pins, 1)[26]         # 27    25
+        out(x, 1)                # 28    26
+        jmp(x_dec, "one_low")    # 29    27  '1'
+        nop()[20]                # 50    28  '0'
+        set(pins, 0)[20]         # 21    29
+        label("one_low")
+        set(pins, 0)[27]         # 28    30  '0': 49
+        jmp(y_dec, "bit")        # 29    31  '0': 50
+        wrap()
+
+# für DDRV8871 H-Bridge-Modul
+    @rp2.asm_pio(set_init=(rp2.PIO.OUT_LOW, rp2.PIO.OUT_LOW), out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=32, fifo_join=rp2.PIO.JOIN_TX)
+    def dccbyte_2_pwm():
+        label("packet")          # _-  1. Präambelbit, Länge holen
+        set(pins, 0b10)          # 1      1
+        pull(ifempty, noblock)   # 2      2  FIFO leer: OSR = x = 0
+        out(x, 8)                # 3      3  N
+        mov(isr, x)              # 4      4  Restlänge in isr
+        set(y, 12)               # 5      5  13 weitere Präambelbits
+        jmp(not_x, "end_low")[23] # 29    6  Füllbyte: nur diese '1'
+        set(pins, 0b01)[28]      # 29     7
+        label("preamble")
+        set(pins, 0b10)[28]      # 29     8
+        set(pins, 0b01)[27]      # 28     9
+        jmp(y_dec, "preamble")   # 29    10
+        wrap_target()
+        label("next")            # _-  Trennbit '0' oder Endbit '1'
+        set(pins, 0b10)          # 1     11
+        mov(x, isr)              # 2     12
+        jmp(x_dec, "separator")  # 3     13
+        set(x, 0)[25]            # 29    14  Endbit, x = 0 für pull noblock
+        label("end_low")
+        set(pins, 0b01)[27]      # 28    15
+        jmp("packet")            # 29    16
+        label("separator")
+        jmp(not_osre, "byte")    # 4     17  nächstes Byte im OSR
+        nop()[24]                # 29    18  FIFO mitten im Paket leer: '1' senden,
+        set(pins, 0b01)[27]      # 28    19  bis Daten kommen (isr unverändert)
+        jmp("next")              # 29    20
+        label("byte")
+        mov(isr, x)[30]          # 35    21
+        set(y, 7)[14]            # 50    22  8 Datenbits
+        set(pins, 0b01)[31]      # 32    23
+        nop()[17]                # 50    24
+        label("bit")             # _-
+        set(pins, 0b10)[26]      # 27    25
+        out(x, 1)                # 28    26
+        jmp(x_dec, "one_low")    # 29    27  '1'
+        nop()[20]                # 50    28  '0'
+        set(pins, 0b01)[20]      # 21    29
+        label("one_low")
+        set(pins, 0b01)[27]      # 28    30  '0': 49
+        jmp(y_dec, "bit")        # 29    31  '0': 50
+        wrap()
 
         
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Ringpuffer für genau einen Erzeuger (Core 0) und einen Verbraucher (Core 1)
+# ohne Lock: head schreibt nur der Erzeuger, tail nur der Verbraucher. Ein Platz
+# bleibt immer frei, damit head == tail eindeutig "leer" bedeutet.
+#
+# posted / done zählen übergebene bzw. ausgeführte Befehle, damit der Erzeuger
+# auf die Ausführung eines bestimmten Befehls warten kann.
+#
+# ----------------------------------------------------------------------
+
+
+class COMMANDQUEUE:
+
+    def __init__(self, size=32):
+        self.slots = [None] * size
+        self.size = size
+        self.head = 0       # nächster freier Platz (Erzeuger)
+        self.tail = 0       # nächster zu lesender Platz (Verbraucher)
+        self.posted = 0     # übergebene Befehle (Erzeuger)
+        self.done = 0       # ausgeführte Befehle (Verbraucher)
+
+    # Eintrag anhängen, False wenn der Puffer voll ist
+    def put(self, item):
+        head = self.head
+        following = (head + 1) % self.size
+        if following == self.tail:
+            return False
+        self.slots[head] = item
+        self.head = following   # erst nach dem Schreiben des Eintrags weiterschalten
+        self.posted += 1
+        return True
+
+    # ältesten Eintrag holen, None wenn der Puffer leer ist
+    def get(self):
+        tail = self.tail
+        if tail == self.head:
+            return None
+        item = self.slots[tail]
+        self.slots[tail] = None
+        self.tail = (tail + 1) % self.size
+        return item
+
+    def __len__(self):
+        return (self.head - self.tail) % self.size
@@ -0,0 +1,265 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Strommessung im Hintergrund: der ADC misst frei laufend (START_MANY) in seine
+# FIFO, zwei verkettete DMA-Kanäle schreiben abwechselnd je 'block' Messwerte in
+# zwei Puffer. Am Ende eines Blocks stellt ein harter IRQ (hard=True) den eben
+# fertigen Kanal wieder auf den Anfang seines Puffers, glättet die Messwerte und
+# merkt sich Spitzenwert und Summe des Blocks in Ringen über 'window' Blöcke;
+# peak, average und 'telemetry' (CURRENTTELEMETRY, Spitzenwert jedes Blocks)
+# aktualisiert ein mit micropython.schedule() eingeplanter Callback. Abfragen
+# (latest, peak, average) kosten so keine Messzeit mehr.
+# Der andere Kanal misst währenddessen den nächsten Block: sind IRQs länger als
+# einen Block (block / rate s) gesperrt, startet die Kette den Kanal mit der
+# alten Schreibadresse hinter seinem Puffer. Der harte Handler legt deshalb
+# nichts auf dem Heap an (keine floats, keine neuen Objekte).
+#
+# Ohne rp2.DMA / machine.mem32 (z.B. Host) misst ein machine.Timer je Block
+# 'block' Werte mit read_u16().
+#
+# Glättung und Umrechnung in mA nur mit Ganzzahlen (floats belegen Heap):
+#   v' = (x * k + v * k1) >> FILTER_SHIFT, k = smoothing, k1 = 1 - 2 * k wie bisher
+#   mA aus einer Tabelle je Motortreiber (table()), linear zwischen den Stützstellen
+#
+# Kurzschluss (set_trip()): liegt der geglättete Wert 'samples' Messungen in Folge
+# über 'trip' (nach dem ersten Überschreiten genügt 'hold'), ruft der harte
+# IRQ-Handler sofort den trip_handler auf: spätestens einen Block + 'samples'
+# Messungen + die Zeit, in der IRQs gesperrt sind, nach dem Anstieg. delay_us
+# misst ab der ersten Messung über der Schwelle, die Verzögerung des IRQs nach
+# dem Ende des Blocks eingeschlossen (Zähler des anderen DMA-Kanals). Mit dem
+# Timer ist der Block eben erst gemessen, delay_us = 0.
+#
+# ----------------------------------------------------------------------
+
+import machine
+import rp2
+import utime
+from array import array
+from micropython import const, schedule, alloc_emergency_exception_buf
+
+alloc_emergency_exception_buf(100)     # Fehlermeldungen aus dem harten IRQ
+
+
+class CURRENTSAMPLER:
+
+    ADC_BASE = const(0x4004c000)
+    ADC_CS = const(0x00)                # EN Bit 0, START_MANY Bit 3, AINSEL Bits 12..14
+    ADC_FCS = const(0x08)               # EN Bit 0, DREQ_EN Bit 3, UNDER/OVER Bit 10/11, LEVEL Bits 16..19, THRESH Bits 24..27
+    ADC_FIFO = const(0x0c)
+    ADC_DIV = const(0x10)               # Abstand der Messungen: 1 + INT (Bits 8..23) Takte
+    ADC_CLOCK = const(48000000)
+    ADC_GPIO0 = const(26)               # GPIO von Kanal 0
+    DREQ_ADC = const(36)
+    FILTER_SHIFT = const(12)            # Gewichte der Glättung in 1/4096
+    TABLE_SHIFT = const(6)              # Stützstellen der mA-Tabelle alle 64 Rohwerte
+    TABLE_SCALE = const(4)              # Tabellenwerte in 1/16 mA
+
+    # pin: GPIO 26..29, rate: Messungen / s, window: Blöcke für peak und average
+    def __init__(self, pin=27, rate=4000, block=40, window=5, smoothing=0.175):
+        self.pin = pin
+        self.rate = rate
+        self.block = block
+        self.window = window
+        self.k, self.k1 = self.weights(smoothing)
+        self.buffers = [array('H', [0] * block), array('H', [0] * block)]
+        self.peaks = array('H', [0] * window)  # Spitzenwert des Filters je Block
+        self.sums = array('I', [0] * window)   # Summe der Messwerte je Block
+        self.slot = 0               # nächster Block im Ring
+        self.value = 0              # Zustand des Filters
+        self.latest = 0             # letzter gefilterter Wert (0..65535 wie read_u16)
+        self.peak = 0               # Spitzenwert im Fenster
+        self.average = 0            # Mittelwert der Messwerte im Fenster
+        self.blocks = 0             # verarbeitete Blöcke
+        self.mode = None            # "dma", "timer" oder None (gestoppt)
+        self.trip = 0x10000         # Kurzschluss: Schwelle (Rohwert), 0x10000 = aus
+        self.hold = 0x10000         # Kurzschluss: Schwelle nach dem ersten Überschreiten
+        self.trip_samples = 1       # Kurzschluss: Messungen über der Schwelle bis zum Auslösen
+        self.trip_handler = None    # trip_handler(sampler, delay_us), delay_us = Alter der ersten Messung über der Schwelle
+        self.trip_count = 0         # Messungen in Folge über der Schwelle
+        self.tripped = False        # ausgelöst, bis rearm()
+        self.process_us = 0         # Beginn der Auswertung des aktuellen Blocks (ticks_us, nach 'late' in _done())
+        self.telemetry = None       # CURRENTTELEMETRY: Spitzenwert je Block aufzeichnen
+        self.pending = False        # _summary() eingeplant, aber noch nicht gelaufen
+        self.summary = self._summary    # gebundene Methode einmal anlegen, nicht im harten IRQ
+        self.dma = None
+        self.timer = None
+        self.adc = machine.ADC(machine.Pin(pin))   # Pin als Analogeingang
+
+    def start(self):
+        if self.mode is not None:
+            return self.mode
+        try:
+            self._start_dma()
+            self.mode = "dma"
+        except (AttributeError, OSError, ValueError, TypeError):
+            self._close_dma()
+            self.timer = machine.Timer(mode=machine.Timer.PERIODIC, freq=max(1, self.rate // self.block),
+                                       callback=self._tick)
+            self.mode = "timer"
+        return self.mode
+
+    def _start_dma(self):
+        self.dma = [rp2.DMA(), rp2.DMA()]
+        fifo = self.ADC_BASE + self.ADC_FIFO
+        for i in range(2):
+            ctrl = self.dma[i].pack_ctrl(size=1, inc_read=False, inc_write=True, treq_sel=self.DREQ_ADC,
+                                         chain_to=self.dma[i ^ 1].channel, irq_quiet=False)
+            self.dma[i].config(read=fifo, write=self.buffers[i], count=self.block, ctrl=ctrl)
+            self.dma[i].irq(self._done, hard=True)
+        mem32 = machine.mem32
+        base = self.ADC_BASE
+        mem32[base + self.ADC_CS] = (self.pin - self.ADC_GPIO0) << 12 | 1
+        mem32[base + self.ADC_FCS] = 0
+        while (mem32[base + self.ADC_FCS] >> 16) & 0xf:
+            mem32[base + self.ADC_FIFO]
+        mem32[base + self.ADC_DIV] = (self.ADC_CLOCK // self.rate - 1) << 8
+        mem32[base + self.ADC_FCS] = 1 << 24 | 1 << 11 | 1 << 10 | 1 << 3 | 1
+        self.dma[0].active(1)
+        mem32[base + self.ADC_CS] = (self.pin - self.ADC_GPIO0) << 12 | 1 << 3 | 1
+
+    def _close_dma(self):
+        if self.dma is not None:
+            for dma in self.dma:
+                dma.close()
+            self.dma = None
+
+    # harter IRQ am Ende eines Blocks: Kanal für den übernächsten Block vorbereiten, Block auswerten,
+    # den Rest einplanen (ein Block ohne _summary() fehlt nur in telemetry); seit dem Ende des Blocks
+    # hat der andere Kanal 'late' Messungen geschrieben (Verzögerung des IRQs, auf eine Messung genau)
+    def _done(self, dma):
+        index = 0 if dma is self.dma[0] else 1
+        late = self.block - self.dma[index ^ 1].count
+        dma.config(write=self.buffers[index], count=self.block)
+        peak = self._scan(self.buffers[index], True, late)
+        if not self.pending:
+            self.pending = True
+            schedule(self.summary, peak)
+
+    # Timer: einen Block direkt messen
+    def _tick(self, timer):
+        buffer = self.buffers[0]
+        adc = self.adc
+        for i in range(self.block):
+            buffer[i] = adc.read_u16()
+        self._process(buffer, False)
+
+    # Gewichte (k, k1) der Glättung als Festkomma
+    @classmethod
+    def weights(cls, smoothing):
+        k = int(smoothing * (1 << cls.FILTER_SHIFT) + 0.5)
+        return k, (1 << cls.FILTER_SHIFT) - 2 * k
+
+    # Tabelle Rohwert -> 1/16 mA aus der Umrechnung raw2mA(Rohwert) eines Motortreibers (einmalig, mit floats)
+    @classmethod
+    def table(cls, raw2mA):
+        return array('i', [round(raw2mA(i << cls.TABLE_SHIFT) * (1 << cls.TABLE_SCALE))
+                           for i in range((65536 >> cls.TABLE_SHIFT) + 1)])
+
+    # Rohwert (0..65535) -> mA
+    @classmethod
+    def to_mA(cls, table, raw):
+        i = raw >> cls.TABLE_SHIFT
+        low = table[i]
+        low += (table[i + 1] - low) * (raw & ((1 << cls.TABLE_SHIFT) - 1)) >> cls.TABLE_SHIFT
+        return (low + (1 << (cls.TABLE_SCALE - 1))) >> cls.TABLE_SCALE
+
+    # Rohwert, ab dem to_mA(table, Rohwert) > mA ist (0x10000: nicht erreichbar)
+    @classmethod
+    def to_raw(cls, table, mA):
+        low = 0
+        high = 0x10000
+        while low < high:
+            middle = (low + high) >> 1
+            if cls.to_mA(table, middle) > mA:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    # Kurzschluss-Abschaltung einstellen, Schwellen als Rohwerte des geglätteten Stroms
+    def set_trip(self, trip, hold, samples, handler):
+        self.trip = trip
+        self.hold = min(hold, trip)
+        self.trip_samples = max(1, samples)
+        self.trip_handler = handler
+        self.rearm()
+
+    # nach einem Kurzschluss wieder scharf schalten
+    def rearm(self):
+        self.trip_count = 0
+        self.tripped = False
+
+    # Block auswerten, raw12 = 12-Bit-Werte aus der FIFO
+    def _process(self, buffer, raw12):
+        self._summary(self._scan(buffer, raw12))
+
+    # Glättung wie bisher in ELECTRICAL.get_current() und Kurzschluss, liefert den Spitzenwert des Blocks;
+    # läuft im harten IRQ: nur Ganzzahlen, nichts auf dem Heap; late = Messungen seit dem Ende des Blocks
+    def _scan(self, buffer, raw12, late=0):
+        self.process_us = utime.ticks_us()
+        k = self.k
+        k1 = self.k1
+        shift = self.FILTER_SHIFT
+        half = 1 << (shift - 1)
+        trip = self.trip
+        hold = self.hold
+        count = self.trip_count
+        value = self.value
+        peak = 0
+        total = 0
+        left = len(buffer) + late   # Messungen nach der aktuellen (+ 1) bis zum Beginn der Auswertung
+        for sample in buffer:
+            if raw12:
+                sample = sample << 4 | sample >> 8     # wie read_u16()
+            total += sample
+            value = (sample * k + value * k1 + half) >> shift
+            if value > peak:
+                peak = value
+            left -= 1
+            if value > trip or (count and value > hold):
+                count += 1
+                if count == self.trip_samples and not self.tripped and self.trip_handler is not None:
+                    self.tripped = True
+                    self.value = value
+                    # Timer: der Block wurde eben erst gemessen
+                    self.trip_handler(self, (count + left) * 1000000 // self.rate if raw12 else 0)
+            else:
+                count = 0
+        self.trip_count = count
+        self.value = value
+        slot = self.slot
+        self.peaks[slot] = peak
+        self.sums[slot] = total
+        self.slot = slot + 1 if slot + 1 < self.window else 0
+        self.latest = value
+        self.blocks += 1
+        return peak
+
+    # Fenster und Telemetrie nach _scan(), im Hauptprogramm
+    def _summary(self, peak):
+        self.pending = False
+        self.peak = max(self.peaks)
+        self.average = sum(self.sums) // (self.window * self.block)
+        if self.telemetry is not None:
+            self.telemetry.record(peak)
+
+    # True: das Fenster ist einmal gefüllt
+    def ready(self):
+        return self.blocks >= self.window
+
+    def stop(self):
+        if self.mode == "dma":
+            mem32 = machine.mem32
+            base = self.ADC_BASE
+            mem32[base + self.ADC_CS] = (self.pin - self.ADC_GPIO0) << 12 | 1   # read_u16() wieder möglich
+            mem32[base + self.ADC_FCS] = 0
+            self._close_dma()
+            while (mem32[base + self.ADC_FCS] >> 16) & 0xf:
+                mem32[base + self.ADC_FIFO]
+        elif self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+        self.mode = None
@@ -0,0 +1,120 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Verlauf des Gleisstroms: der CURRENTSAMPLER trägt je Block einen Messwert
+# (Spitzenwert des geglätteten Stroms, Rohwert wie read_u16) mit Zeitstempel
+# (ticks_ms) in einen Ring ein, zusätzlich je Sekunde Minimum, Maximum und
+# Mittelwert in einen zweiten Ring. Alle Puffer werden einmal angelegt,
+# record() belegt keinen Heap und darf im IRQ-Handler laufen.
+#
+# Auswertung (stats(), history()) in Rohwerten, die Umrechnung in mA macht
+# ELECTRICAL (monoton, daher auch für Perzentile richtig).
+#
+# ----------------------------------------------------------------------
+
+import utime
+from array import array
+
+
+class CURRENTTELEMETRY:
+
+    # size: Messwerte im Ring, seconds: Sekunden im Ring der Sekundenwerte
+    def __init__(self, size=1000, seconds=300):
+        self.times = array('I', [0] * size)         # ticks_ms je Messwert
+        self.values = array('H', [0] * size)
+        self.pos = 0                                # nächster Eintrag
+        self.count = 0                              # belegte Einträge
+        self.second_times = array('I', [0] * seconds)   # Sekunde (ticks_ms // 1000)
+        self.second_min = array('H', [0] * seconds)
+        self.second_max = array('H', [0] * seconds)
+        self.second_mean = array('H', [0] * seconds)
+        self.second_pos = 0
+        self.second_count = 0
+        self.second = None                          # laufende Sekunde
+        self.low = 0                                # laufende Sekunde: Minimum, Maximum, Summe, Anzahl
+        self.high = 0
+        self.total = 0
+        self.samples = 0
+
+    def record(self, value):
+        now = utime.ticks_ms()
+        pos = self.pos
+        self.times[pos] = now
+        self.values[pos] = value
+        pos += 1
+        self.pos = pos if pos < len(self.values) else 0
+        if self.count < len(self.values):
+            self.count += 1
+        second = now // 1000
+        if second != self.second:
+            if self.samples:
+                self._close_second()
+            self.second = second
+            self.low = value
+            self.high = value
+            self.total = 0
+            self.samples = 0
+        if value < self.low:
+            self.low = value
+        if value > self.high:
+            self.high = value
+        self.total += value
+        self.samples += 1
+
+    # Werte der abgelaufenen Sekunde in den Sekundenring
+    def _close_second(self):
+        pos = self.second_pos
+        self.second_times[pos] = self.second
+        self.second_min[pos] = self.low
+        self.second_max[pos] = self.high
+        self.second_mean[pos] = self.total // self.samples
+        pos += 1
+        self.second_pos = pos if pos < len(self.second_times) else 0
+        if self.second_count < len(self.second_times):
+            self.second_count += 1
+
+    # Messwerte der letzten window_ms ms, neueste zuletzt
+    def window(self, window_ms):
+        now = utime.ticks_ms()
+        size = len(self.values)
+        result = []
+        for i in range(self.count):
+            pos = (self.pos - 1 - i) % size
+            if utime.ticks_diff(now, self.times[pos]) > window_ms:
+                break
+            result.append(self.values[pos])
+        result.reverse()
+        return result
+
+    # Anzahl, Minimum, Maximum, Mittelwert und Perzentile (Rohwerte) der letzten window_ms ms, None ohne Messwerte
+    def stats(self, window_ms=1000, percentiles=(50, 90, 99)):
+        values = self.window(window_ms)
+        if not values:
+            return None
+        values.sort()
+        count = len(values)
+        result = {"count": count, "min": values[0], "max": values[-1], "mean": sum(values) // count}
+        for p in percentiles:
+            result["p" + str(p)] = values[min(count - 1, (count * p + 99) // 100 - 1 if p else 0)]
+        return result
+
+    # Sekundenwerte der letzten 'seconds' abgeschlossenen Sekunden: [(Sekunde, Minimum, Maximum, Mittelwert), ...]
+    def history(self, seconds=60):
+        size = len(self.second_times)
+        result = []
+        for i in range(min(seconds, self.second_count)):
+            pos = (self.second_pos - 1 - i) % size
+            result.append((self.second_times[pos], self.second_min[pos], self.second_max[pos], self.second_mean[pos]))
+        result.reverse()
+        return result
+
+    def clear(self):
+        self.pos = 0
+        self.count = 0
+        self.second_pos = 0
+        self.second_count = 0
+        self.second = None
+        self.samples = 0
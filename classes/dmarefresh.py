@@ -0,0 +1,142 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Refresh per DMA: ein DMA-Kanal schreibt den Refresh-Zyklus in die TX-FIFO
+# der StateMachine des BITGENERATORs, getaktet vom DREQ der FIFO. Am Ende
+# eines Zyklus startet ein harter IRQ (hard=True) den Kanal neu, die CPU muss
+# nur bei Änderungen einen neuen Zyklus bereitstellen (submit()).
+# Der Handler legt nichts auf dem Heap an: _fill() hält je Puffer fertige
+# memoryviews für den ersten Durchlauf (mit einmaligen Paketen) und für den
+# Refresh bereit, GC und lange Python-Abschnitte verzögern den Neustart nicht.
+# Die Zähler cycles und swaps laufen nach 2**30 über (bleiben kleine ints).
+#
+# Doppelpuffer: der DMA liest immer aus buffers[front], submit() schreibt in
+# den anderen Puffer; der Handler wechselt am Zyklusende auf den neuen Puffer.
+# Einmalige Pakete (Zubehör, POM) stehen vor dem Refresh-Zyklus und werden
+# nur beim ersten Durchlauf gesendet, danach beginnt der DMA bei starts[front].
+#
+# benötigt rp2.DMA (MicroPython >= 1.21)
+#
+# ----------------------------------------------------------------------
+
+import rp2
+from array import array
+from micropython import const
+
+
+class DMAREFRESH:
+
+    PIO0_BASE = const(0x50200000)
+    PIO1_BASE = const(0x50300000)
+    TXF0 = const(0x010)                 # TX-FIFO der StateMachine 0, je StateMachine + 4
+    DREQ_PIO0_TX0 = const(0)            # DREQ der TX-FIFO, je StateMachine + 1
+    DREQ_PIO1_TX0 = const(8)
+
+    # sm_id: 0..3 PIO0, 4..7 PIO1
+    def __init__(self, sm_id=0, size=64):
+        pio = sm_id >> 2
+        sm = sm_id & 3
+        self.write = (self.PIO1_BASE if pio else self.PIO0_BASE) + self.TXF0 + 4 * sm
+        self.dma = rp2.DMA()
+        self.ctrl = self.dma.pack_ctrl(size=2, inc_read=True, inc_write=False, irq_quiet=False,
+                                       treq_sel=(self.DREQ_PIO1_TX0 if pio else self.DREQ_PIO0_TX0) + sm)
+        self.buffers = [array('I', [0] * size), array('I', [0] * size)]
+        self.counts = [0, 0]        # belegte Worte je Puffer
+        self.starts = [0, 0]        # Beginn des Refresh-Zyklus (davor einmalige Pakete)
+        self.firsts = [None, None]  # je Puffer: memoryview ab Wort 0 (erster Durchlauf)
+        self.cycleviews = [None, None]  # je Puffer: memoryview ab starts[] (Refresh)
+        self.front = 0              # Puffer, aus dem der DMA liest
+        self.pending = False        # anderer Puffer bereit zur Übernahme
+        self.extra = []             # einmalige Worte, noch nicht übernommen
+        self.extra_swaps = 0        # swaps beim Bereitstellen von extra: danach übernommen
+        self.running = False
+        self.first = False          # Kanal läuft im ersten Durchlauf von buffers[front] (mit einmaligen Worten)
+        self.cycles = 0             # gestartete Zyklen
+        self.swaps = 0              # übernommene Puffer
+        self.dma.irq(self._rearm, hard=True)
+
+    # Worte ab Position start in den Puffer 'index' kopieren (Puffer ggf. vergrößern)
+    def _fill(self, index, extra, refresh):
+        size = len(extra) + len(refresh)
+        buffer = self.buffers[index]
+        if len(buffer) < size:
+            buffer = array('I', [0] * size)
+            self.buffers[index] = buffer
+        pos = 0
+        for word in extra:
+            buffer[pos] = word
+            pos += 1
+        for word in refresh:
+            buffer[pos] = word
+            pos += 1
+        self.counts[index] = size
+        self.starts[index] = len(extra)
+        view = memoryview(buffer)
+        self.firsts[index] = view[:size]
+        self.cycleviews[index] = view[len(extra):size]
+
+    # Kanal mit einer der fertigen memoryviews starten (auch im harten IRQ)
+    def _arm(self, view):
+        self.dma.config(read=view, count=len(view), trigger=True)
+
+    # harter IRQ am Ende eines Zyklus: neuen Puffer übernehmen oder Refresh wiederholen
+    def _rearm(self, dma=None):
+        if not self.running:
+            return
+        if self.pending:
+            self.front ^= 1
+            self.pending = False
+            self.swaps = (self.swaps + 1) & 0x3fffffff
+            view = self.firsts[self.front]
+            self.first = True
+        else:
+            view = self.cycleviews[self.front]
+            self.first = False
+        self.cycles = (self.cycles + 1) & 0x3fffffff
+        self._arm(view)
+
+    # Refresh starten, refresh = Worte eines Zyklus (nicht leer), extra = einmalig davor zu sendende Worte
+    def start(self, refresh, extra=()):
+        self.front = 0
+        self.pending = False
+        self.extra = []
+        self.extra_swaps = self.swaps
+        self._fill(0, extra, refresh)
+        self.dma.config(write=self.write, ctrl=self.ctrl)
+        self.running = True
+        self.cycles = (self.cycles + 1) & 0x3fffffff
+        self.first = True
+        self._arm(self.firsts[0])
+
+    # neuen Zyklus bereitstellen, extra = einmalig davor zu sendende Worte
+    def submit(self, refresh, extra=()):
+        self.pending = False        # Handler übernimmt den Puffer erst nach dem Kopieren
+        if self.swaps != self.extra_swaps:
+            self.extra = []         # der Handler hat den letzten Puffer samt extra übernommen
+        if extra:
+            self.extra = self.extra + list(extra)
+        self._fill(self.front ^ 1, self.extra, refresh)
+        self.extra_swaps = self.swaps
+        self.pending = True
+
+    # nach stop(): einmalige Worte, die noch nicht sicher auf dem Gleis sind (queued = Worte, die
+    # noch in FIFO und OSR standen), jeweils der ganze Block, damit keine Pakete zerschnitten werden
+    def unsent(self, queued=0):
+        words = []
+        start = self.starts[self.front]
+        if self.first and start and len(self.firsts[self.front]) - self.dma.count - queued < start:
+            words += self.buffers[self.front][:start]
+        if self.pending:
+            words += self.extra
+        return words
+
+    def stop(self):
+        self.running = False
+        self.dma.active(0)
+
+    def close(self):
+        self.stop()
+        self.dma.close()
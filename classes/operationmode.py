@@ -30,10 +30,10 @@
 #                    111 Ack anfordern
 #                    {instruction byte} = 00001111
 #
-#  @TODO
 #              Consist Control (GTTTT=1TTTT)
 #                    {instruction bytes} = 0001TTTT 0 0AAAAAAA
-#  /@TODO
+#              Mehrfachtraktion hier über CV19 (POM, ctrl_consist()): Bit 0-6 Traktionsadresse,
+#              Bit 7 = 1: Lok fährt in der Traktion umgekehrt
 #
 #         001: Advanced Operation Instructions 001GGGGG
 #                    {instruction bytes} = 001GGGGG 0 DDDDDDDD
@@ -58,6 +58,12 @@
 #         100DDDDD Funktionen Gruppe 0 u. FL
 #            DDDDD: 10000 FL, 01000 F4 ... 00001 F1
 #
+#         110: Feature Expansion Instruction
+#
+#         110CCCCC 0 DDDDDDDD  Funktionen F13-F68, je 8 in einem Datenbyte (Bit 0 = niedrigste Funktion)
+#            CCCCC: 11110 F13-F20, 11111 F21-F28, 11000 F29-F36, 11001 F37-F44,
+#                   11010 F45-F52, 11011 F53-F60, 11100 F61-F68
+#
 # ----------------- ACCESSORIES --------------------
 # erzeugen von DCC-Signal für Zubehördekoder
 # Basic format:
@@ -300,6 +306,15 @@ class OPERATIONS(ELECTRICAL):
     # update active loco speedsteps property
     def update_speedsteps(cls, speedsteps=28):
 
+    # allow combined speed/direction/functions instruction for the active loco (128 speedsteps)
+    def update_combined(cls, combined=True):
+
+    # advanced consist (CV19): drive members with one speed packet to the consist address
+    def ctrl_consist(cls, address, members, speedsteps=28, name=""):
+
+    # dissolve consist, members take over the consist speed
+    def dissolve_consist(cls, address):
+
     # test if loco address exists, returns array index
     def search(cls, address):
 
@@ -372,10 +387,26 @@ class LOCO:
 
 import machine
 from classes.bitgenerator import BITGENERATOR as bitgenerator
+from classes.packetencoder import PACKETENCODER as encoder, BITPACKER as bitpacker, BYTEPACKER as bytepacker
+from classes.speedcodec import SPEEDCODEC as speedcodec
+from classes.dmarefresh import DMAREFRESH as dmarefresh
+from classes.currentsampler import CURRENTSAMPLER as currentsampler
+from classes.currenttelemetry import CURRENTTELEMETRY as currenttelemetry
+from classes.commandqueue import COMMANDQUEUE as commandqueue
 from micropython import const
 import utime
+import _thread
 
 
+# Funktionsgruppen: Befehlsbyte, erste Funktion, Anzahl Funktionen
+# F0-F4, F5-F8, F9-F12 (Function Group One/Two), F13-F68 (Feature Expansion, zwei Bytes)
+_FUNCTION_GROUPS = ((0b10000000, 0, 5), (0b10110000, 5, 4), (0b10100000, 9, 4),
+                    (0b11011110, 13, 8), (0b11011111, 21, 8), (0b11011000, 29, 8), (0b11011001, 37, 8),
+                    (0b11011010, 45, 8), (0b11011011, 53, 8), (0b11011100, 61, 8))
+# Index = Funktionsnummer: Gruppe, Bit im Datenbyte der Gruppe (F0 = FL: Bit 4)
+_FUNCTION_GROUP = bytes([g for g in range(len(_FUNCTION_GROUPS)) for f in range(_FUNCTION_GROUPS[g][2])])
+_FUNCTION_SHIFT = bytes([4, 0, 1, 2, 3] + [f - _FUNCTION_GROUPS[_FUNCTION_GROUP[f]][1] for f in range(5, 69)])
+
 DEBUG = False
 # DEBUG = True
 motordriver = "LMD18200T"
@@ -402,6 +433,49 @@ class ELECTRICAL:
     PREAMBLE = const(14)                              # Präambel f. Servicemode
     ACK_TRESHOLD = const(40)                          # Hub f. Ack
     CURRENT_SMOOTHING = const(0.175)                  # Glättung der Messergebnisse versuchen
+    WORDBUFFER_RESERVE = const(64)                    # Reserve beim Vergrößern des Wortpuffers
+    PACKING = "word"                                  # "word": Pakete auf Wortgrenzen, "continuous": lückenlos,
+                                                      # "byte": Längen- und Datenbytes für BITGENERATOR.dccbyte
+    REFRESH = "put"                                   # "put": send2track() füllt die FIFO nach, "dma": DMA-Kanal (rp2.DMA)
+    SLOT_SPEED = const(0)                             # Paket-Slot je Lok: 0 = Fahrstufe, 1..3 = Funktionsgruppen
+    ALL_SLOTS = const(-1)
+    SPEED_TABLE_BUDGET = const(8192)                  # max. Bytes für vorkodierte Fahrstufentabellen
+    LOCO_POOL = const(16)                             # max. freie LOCO-Objekte zur Wiederverwendung
+    SCHEDULER = "cycle"                               # "cycle": Refresh in Listenreihenfolge, "edf": Änderungen zuerst,
+                                                      # dann das Paket mit dem frühesten Refresh-Termin
+    URGENT_REPEATS = const(3)                         # "edf": geänderte Pakete so oft sofort senden
+    REFRESH_SPEED_MS = const(200)                     # "edf": Refresh-Intervall Fahrstufe
+    REFRESH_FUNCTION_MS = const(1000)                 # "edf": Refresh-Intervall Funktionsgruppen
+    EPOCH_SHIFT_MS = const(1 << 22)                   # "edf": Termine spätestens nach ~70 min auf eine neue epoch beziehen
+    FUNCTION_REFRESH = "always"                       # "always": Funktionsgruppen in jedem Zyklus, "decay": nach einer
+                                                      # Änderung FUNCTION_FULL_REPEATS mal, danach mit wachsendem Intervall
+    FUNCTION_FULL_REPEATS = const(4)                  # "decay": Zyklen mit voller Wiederholung nach einer Änderung
+    FUNCTION_PERIOD_MAX = const(8)                    # "decay": max. Intervall (Zyklen) einer Gruppe mit eingeschalteten Funktionen
+    FUNCTION_PERIOD_OFF = const(32)                   # "decay": max. Intervall einer Gruppe, in der alle Funktionen aus sind
+    ESTOP_REPEATS = const(5)                          # Nothalt: Broadcast-Pakete vor allen anderen
+    ESTOP_BROADCAST = (0b00000000, 0b01000001)        # Broadcast (Adresse 0), 01DC0001 = Nothalt
+    THREADED = False                                  # True: Refresh und Befehle laufen auf Core 1 (_thread)
+    QUEUE_SIZE = const(32)                            # Befehle in der Warteschlange für Core 1
+    FUNCTION_PERIOD_HIGH = const(32)                  # Intervall (Zyklen) der Gruppen ab F13, wenn eine Funktion an ist
+    FUNCTION_GROUPS = _FUNCTION_GROUPS                # Funktionsgruppen (Slot = Gruppe + 1)
+    FUNCTION_MAX = const(68)
+    SLOT_HIGH = const(4)                              # erster Slot der Feature Expansion (F13-F20)
+    FUNCTION_GROUP = _FUNCTION_GROUP                  # Gruppe je Funktionsnummer
+    FUNCTION_SHIFT = _FUNCTION_SHIFT                  # Bit im Datenbyte der Gruppe je Funktionsnummer
+    SAMPLER = False                                   # True: Strom im Hintergrund messen (CURRENTSAMPLER, 2 DMA-Kanäle, ADC frei laufend)
+    SAMPLE_HZ = const(4000)                           # Sampler: Messungen / s
+    SAMPLE_BLOCK = const(20)                          # Sampler: Messungen je Block (Fenster = DENOISE_SAMPLES)
+    SHORT_TRIP = const(1000)                          # Sampler: Kurzschluss ab diesem geglätteten Strom in mA
+    SHORT_HOLD = const(800)                           # Sampler: ... solange er danach über diesem Strom bleibt
+    SHORT_SAMPLES = const(8)                          # Sampler: ... für so viele Messungen in Folge
+    TELEMETRY = False                                 # True: Verlauf des Stroms aufzeichnen (CURRENTTELEMETRY, nur mit SAMPLER)
+    TELEMETRY_SAMPLES = const(1000)                   # Telemetrie: Messwerte (je Block des Samplers, 5 s bei 5 ms)
+    TELEMETRY_SECONDS = const(300)                    # Telemetrie: Sekundenwerte
+    SHORT_RETRY = False                               # True: nach Kurzschluss Gleis selbst wieder einschalten
+    SHORT_RETRY_MS = const(250)                       # erste Wartezeit bis zum Wiedereinschalten
+    SHORT_RETRY_MAX_MS = const(4000)                  # Wartezeit verdoppelt sich bis hierher
+    SHORT_RETRIES = const(6)                          # Versuche in Folge, danach power_off() und RuntimeError
+    SHORT_STABLE_MS = const(2000)                     # so lange ohne Kurzschluss: Wartezeit und Versuche zurücksetzen
     
     # IDLE: preamble 0 11111111 0 00000000 0 11111111 1
     IDLE =      [ const(0b11111111111111111111111111111111), const(0b11110111111110000000000111111111) ]
@@ -410,29 +484,86 @@ class ELECTRICAL:
     
     locos = []
     devices = []
+    feeder = None    # DMAREFRESH bei REFRESH = "dma"
+    sampler = None   # CURRENTSAMPLER bei SAMPLER = True
+    telemetry = None # CURRENTTELEMETRY bei TELEMETRY = True, bleibt über power_off()/power_on() erhalten
+    current_tables = {}  # Motortreiber -> Tabelle Rohwert -> mA (CURRENTSAMPLER.table)
+    queue = None     # COMMANDQUEUE an Core 1 bei THREADED = True
+    core1 = None     # Thread-Ident des Refresh auf Core 1
+    thread_running = False
+    thread_error = None
     
     # DCC- und H-Bridge-LMD18200T-Modul elektrische Steuerung
     #
-#    @classmethod
+    @classmethod
     def __init__(cls):   
-        cls.brake = machine.Pin(BRAKE_PIN, machine.Pin.OUT)
-        cls.pwm = machine.Pin(PWM_PIN, machine.Pin.OUT)
-        cls.power = machine.Pin(POWER_PIN, machine.Pin.OUT)
-        cls.dir_pin = machine.Pin(DIR_PIN, machine.Pin.OUT)
-        cls.ack = machine.ADC(machine.Pin(ACK_PIN))
+        cls.stop_dma()
+        cls.stop_sampler()
+        cls.brake = machine.Pin(cls.BRAKE_PIN, machine.Pin.OUT)
+        cls.pwm = machine.Pin(cls.PWM_PIN, machine.Pin.OUT)
+        cls.power = machine.Pin(cls.POWER_PIN, machine.Pin.OUT)
+        cls.dir_pin = machine.Pin(cls.DIR_PIN, machine.Pin.OUT)
+        cls.ack = machine.ADC(machine.Pin(cls.ACK_PIN))
+        cls.current_table = cls.get_current_table()
+        cls.current_weights = currentsampler.weights(cls.CURRENT_SMOOTHING)
         cls.power_state = cls.power.value()
         cls.buffer_dirty = False
         cls.emergency = False
         cls.ringbuffer = []
+        cls.feed_words = [] # Worte, die send2track() gerade in die FIFO schreibt (einmalige Worte + Zyklus)
+        cls.feed_pos = 0 # nächstes Wort in feed_words
+        cls.feed_source = None # Wortpuffer bzw. Slot-Worte, die feed_words sind (sonst None, z.B. Kopie)
+        cls.put_count = 0 # alle von feed() in die FIFO geschriebenen Worte
+        cls.last_oneshot = [] # zuletzt in feed_words übernommene einmalige Worte ...
+        cls.oneshot_end = 0 # ... und put_count nach ihrem letzten Wort (Nothalt: ggf. noch einmal senden)
+        cls.irq_off_max_us = 0 # längste Zeit mit gesperrten Interrupts in send2track()
+        cls.wordbuffer = encoder.wordbuffer(cls.WORDBUFFER_RESERVE) # Worte für den Refresh-Zyklus
+        cls.wordview = encoder.halves(cls.wordbuffer) # 16-Bit-Sicht auf wordbuffer (packer.begin)
+        cls.packer = bytepacker(cls.PREAMBLE) if cls.PACKING == "byte" else bitpacker(cls.PREAMBLE)
+        cls.urgent = [] # "edf": [Lok, Slot, Wiederholungen, Zeitpunkt der Änderung]
+        cls.packet_buffer = encoder.wordbuffer(2) # "edf" mit PACKING = "byte": Worte des aktuellen Pakets
+        cls.packet_view = encoder.halves(cls.packet_buffer)
+        cls.epoch = utime.ticks_ms() # "edf": Bezug für die Termine in LOCO.deadlines
+        cls.schedule_report = {"packets": 0, "urgent": 0, "latency_max_ms": 0, "late_max_ms": 0}
+        cls.estop_report = {"flush_us": None, "first_packet_max_us": None} # letzter Nothalt
+        cls.short_report = {"trips": 0, "latency_us": None, "mA": None, # Kurzschlüsse über den Sampler
+                            "retries": 0, "resume_ms": None, "replay_us": None} # SHORT_RETRY: Wiedereinschalten
+        cls.short_tripped = False # Sampler hat abgeschaltet, send2track() meldet den Kurzschluss
+        cls.trip_us = 0 # Zeitpunkt der Abschaltung (ticks_us)
+        cls.retry_at = None # SHORT_RETRY: Zeitpunkt des nächsten Versuchs (ticks_ms), None = Gleis nicht wegen Kurzschluss aus
+        cls.retry_delay_ms = cls.SHORT_RETRY_MS
+        cls.retry_count = 0 # Versuche in Folge
+        cls.resumed_at = None # letztes Wiedereinschalten (ticks_ms), bis SHORT_STABLE_MS vergangen sind
+        cls.dma_cycles = 0 # REFRESH = "dma": zuletzt gesehene DMAREFRESH.cycles (refresh_tick)
+        cls.bit_report = {"packets": 0, "words": 0, "bits": 0, "packet_bits": 0, "padding_bits": 0}
+        cls.wordcount = 0 # belegte Worte im Wortpuffer
+        cls.spare_wordbuffer = None # zweiter Wortpuffer, falls feed() gerade aus wordbuffer sendet
+        cls.spare_wordview = None
+        cls.dirty_locos = [] # Loks mit ungültigen Slots
+        cls.layout_dirty = True # Lage der Slots im Wortpuffer hat sich geändert
+        cls.speed_tables = [] # Loks mit Fahrstufentabelle, zuletzt gesteuerte am Ende
+        cls.speed_table_bytes = 0
         cls.accessory_buffer = [] # Accessory-Commands
         cls.pom_buffer = [] # POM-Commands
-        cls.locos = [] # active Locos
+        cls.locos = [] # active Locos (Reihenfolge = Refresh-Reihenfolge)
         cls.accessories = [] # active Accessoires
+        cls.loco_index = {} # Adresse -> LOCO
+        cls.loco_pool = [] # entfernte Loks zur Wiederverwendung
+        cls.accessory_index = {} # Adresse -> ACCESSORY
+        cls.consists = {} # Traktionsadresse -> CONSIST
         
-        cls.statemachine = bitgenerator(cls.dir_pin, model=motordriver)
+        cls.statemachine = bitgenerator(cls.dir_pin, model=motordriver, program="byte" if cls.PACKING == "byte" else "bit")
 #        cls.statemachine.begin()
+        if cls.PACKING == "byte":
+            cls.idle_words = cls.packet_words([0b11111111, 0b00000000])
+            cls.reset_words = cls.packet_words([0b00000000, 0b00000000])
+        else:
+            cls.idle_words = cls.IDLE
+            cls.reset_words = cls.RESET
 
         cls.messtimer = utime.ticks_ms()
+        if cls.SAMPLER:
+            cls.start_sampler()
         
          
     # LMD18200T
@@ -448,12 +579,15 @@ class ELECTRICAL:
     #
     @classmethod
     def power_off(cls):
+        cls.stop_thread()
         cls.brake.value(1)  
         cls.pwm.value(0)
+        cls.stop_dma()
         cls.statemachine.end()
         cls.power.value(False)
         cls.power_state = False
         cls.emergency = False
+        cls.retry_at = None
 
     #
     @classmethod
@@ -462,15 +596,14 @@ class ELECTRICAL:
         # The system has not saved the last state of the layout, therefor it must
         # send 20 x RESET and 10 x IDLE immediately after power-on
         for i in range(20):
-            cls.ringbuffer.append(cls.RESET[0])
-            cls.ringbuffer.append(cls.RESET[1])
+            cls.ringbuffer += cls.reset_words
         for i in range(10):
-            cls.ringbuffer.append(cls.IDLE[0])
-            cls.ringbuffer.append(cls.IDLE[1])
+            cls.ringbuffer += cls.idle_words
         if DEBUG:
             for p in cls.ringbuffer:
                 print(f"{cls.to_bin(p)} ", end="")
             print()
+        cls.feed_sequence()
         cls.brake.value(0)  
         cls.pwm.value(1)
         cls.power_time = utime.ticks_ms()
@@ -479,94 +612,400 @@ class ELECTRICAL:
         cls.statemachine.begin()
         cls.chk_short()
         cls.send2track()
+        if cls.REFRESH == "dma":
+            cls.start_dma()
+
+    # Refresh per DMA starten, ohne rp2.DMA weiter mit send2track()
+    @classmethod
+    def start_dma(cls):
+        if cls.SCHEDULER == "edf":
+            print("SCHEDULER = \"edf\" mit REFRESH = \"dma\" nicht möglich, der DMA-Kanal sendet den ganzen Zyklus")
+        try:
+            cls.feeder = dmarefresh(cls.statemachine.sm_id, len(cls.wordbuffer))
+        except (AttributeError, OSError) as e:
+            print("DMA-Refresh nicht möglich:", e)
+            cls.feeder = None
+            return False
+        cls.feeder.start(cls.buffering(), cls.feed_words[cls.feed_pos:])   # Rest der Einschaltsequenz zuerst
+        cls.feed_words = []
+        cls.feed_pos = 0
         cls.ringbuffer = []
+        cls.buffer_dirty = False
+        return True
+
+    #
+    @classmethod
+    def stop_dma(cls):
+        if cls.feeder is not None:
+            cls.feeder.close()
+            cls.feeder = None
+
+    # Refresh und Befehle auf Core 1: die API stellt ihre Aufrufe in die Warteschlange,
+    # Core 1 führt sie aus und füllt zwischendurch die FIFO (send2track)
+    @classmethod
+    def start_thread(cls):
+        if cls.queue is not None:
+            return
+        cls.queue = commandqueue(cls.QUEUE_SIZE)
+        cls.thread_error = None
+        cls.thread_running = True
+        _thread.start_new_thread(cls.core1_loop, ())
+        while cls.core1 is None and cls.thread_error is None:
+            utime.sleep_ms(1)
 
     #
     @classmethod
+    def stop_thread(cls):
+        if cls.queue is None:
+            return
+        cls.thread_running = False
+        if _thread.get_ident() != cls.core1:
+            while cls.core1 is not None:
+                utime.sleep_ms(1)
+        cls.queue = None
+
+    # Hauptschleife auf Core 1
+    @classmethod
+    def core1_loop(cls):
+        cls.core1 = _thread.get_ident()
+        queue = cls.queue
+        try:
+            while cls.thread_running:
+                cls.run_commands(queue)
+                cls.send2track()
+            cls.run_commands(queue)     # restliche Befehle (z.B. emergency_stop vor power_off)
+        except Exception as e:
+            cls.thread_error = e    # z.B. Kurzschluss, wird auf Core 0 beim nächsten Aufruf gemeldet
+        cls.core1 = None
+
+    # Befehle aus der Warteschlange ausführen (Core 1)
+    @classmethod
+    def run_commands(cls, queue):
+        command = queue.get()
+        while command is not None:
+            command[0](*command[1])
+            queue.done += 1
+            command = queue.get()
+
+    # True: Aufruf auf Core 0, während Core 1 den Refresh übernimmt; meldet Fehler von Core 1
+    @classmethod
+    def threaded(cls):
+        if cls.thread_error is not None:
+            error = cls.thread_error
+            cls.thread_error = None
+            cls.queue = None
+            raise error
+        return cls.queue is not None and _thread.get_ident() != cls.core1
+
+    # Aufruf an Core 1 übergeben, False: selbst ausführen (kein Thread oder schon auf Core 1)
+    # wait = True: warten, bis Core 1 den Aufruf ausgeführt hat
+    @classmethod
+    def post(cls, function, args=(), wait=False):
+        if not cls.threaded():
+            return False
+        queue = cls.queue
+        while not queue.put((function, args)):
+            utime.sleep_us(100)
+        if wait:
+            cls.wait_done(queue)
+        return True
+
+    # warten, bis Core 1 alle bisher übergebenen Aufrufe ausgeführt hat
+    @classmethod
+    def wait_done(cls, queue):
+        posted = queue.posted
+        while queue.done < posted and cls.core1 is not None:
+            utime.sleep_us(100)
+
+    # vor Abfragen auf Core 0 (speed(), direction(), get_function()): erst die eigenen Aufrufe ausführen
+    # lassen, sonst liefert z.B. drive(); speed() noch die alte Fahrstufe
+    @classmethod
+    def sync(cls):
+        if cls.threaded():
+            cls.wait_done(cls.queue)
+
+    # Strommessung im Hintergrund starten, Fenster wie bisher DENOISE_SAMPLES Messungen
+    @classmethod
+    def start_sampler(cls):
+        cls.sampler = currentsampler(cls.ACK_PIN, cls.SAMPLE_HZ, cls.SAMPLE_BLOCK,
+                                     max(1, cls.DENOISE_SAMPLES // cls.SAMPLE_BLOCK), cls.CURRENT_SMOOTHING)
+        cls.sampler.set_trip(currentsampler.to_raw(cls.current_table, cls.SHORT_TRIP),
+                             currentsampler.to_raw(cls.current_table, cls.SHORT_HOLD), cls.SHORT_SAMPLES, cls.short_trip)
+        if cls.TELEMETRY:
+            if cls.telemetry is None:
+                cls.telemetry = currenttelemetry(cls.TELEMETRY_SAMPLES, cls.TELEMETRY_SECONDS)
+            cls.sampler.telemetry = cls.telemetry
+        return cls.sampler.start()
+
+    # Kurzschluss, aufgerufen im (harten) IRQ-Handler des Samplers: H-Brücke sofort abschalten, den Rest
+    # erledigt send2track(); nichts auf dem Heap anlegen; latency_us = erste Messung über der Schwelle bis zur Abschaltung
+    @classmethod
+    def short_trip(cls, sampler, delay_us):
+        cls.cut_power()
+        cls.trip_us = utime.ticks_us()
+        report = cls.short_report
+        report["latency_us"] = delay_us + utime.ticks_diff(utime.ticks_us(), sampler.process_us)
+        report["mA"] = cls.raw2mA(sampler.value)
+        report["trips"] += 1
+        cls.short_tripped = True
+
+    #
+    @classmethod
+    def stop_sampler(cls):
+        if cls.sampler is not None:
+            cls.sampler.stop()
+            cls.sampler = None
+
+    # Rohwert (0..65535) -> mA, ganzzahlig aus der Tabelle des Motortreibers
+    @classmethod
     def raw2mA(cls, analog_value):
+        return currentsampler.to_mA(cls.current_table, analog_value)
+
+    # Tabelle Rohwert -> mA für motordriver, einmal je Motortreiber berechnet
+    @classmethod
+    def get_current_table(cls):
+        table = cls.current_tables.get(motordriver)
+        if table is None:
+            table = currentsampler.table(cls.calibration)
+            cls.current_tables[motordriver] = table
+        return table
+
+    # Kalibrierung: Rohwert -> mA (float), nur für get_current_table()
+    @classmethod
+    def calibration(cls, analog_value):
         analog_value = analog_value * cls.AREF_VOLT / 65535  # ADC mappt auf 0..65535
         if motordriver == "DRV8871":
             return analog_value - cls.DRV8871_QUIESCENT_CURRENT
         analog_value /= cls.LMD18200_SENS_SHUNT  # Rsense
         return (analog_value / cls.LMD18200_SENS_AMPERE_PER_AMPERE) - cls.LMD18200_QUIESCENT_CURRENT  # lt. Datenblatt 377 µA / A +/- 10 %
 
-    #
+    # Spitzenwert des Samplers, bis sein Fenster gefüllt ist (oder ohne Sampler) direkt messen
     @classmethod
     def get_current(cls):
+        sampler = cls.sampler
+        if sampler is not None and sampler.ready():
+            return cls.raw2mA(sampler.peak)
+        k, k1 = cls.current_weights
+        shift = currentsampler.FILTER_SHIFT
+        half = 1 << (shift - 1)
+        read = cls.ack.read_u16
         analog_value = 0
         max_value = 0
         for i in range(0, cls.DENOISE_SAMPLES):
-            analog_value = (cls.ack.read_u16() - analog_value) * cls.CURRENT_SMOOTHING + analog_value * (1 - cls.CURRENT_SMOOTHING)
-            max_value = max(analog_value, max_value)
-        return round(cls.raw2mA(max_value))
+            analog_value = (read() * k + analog_value * k1 + half) >> shift
+            if analog_value > max_value:
+                max_value = analog_value
+        return cls.raw2mA(max_value)
     
+    # letzter gefilterter Wert, Spitzenwert und Mittelwert im Fenster in mA (None ohne Sampler)
+    @classmethod
+    def current_stats(cls):
+        sampler = cls.sampler
+        if sampler is None:
+            return None
+        return {"latest": cls.raw2mA(sampler.latest), "peak": cls.raw2mA(sampler.peak),
+                "average": cls.raw2mA(sampler.average), "mode": sampler.mode}
+
+    # H-Brücke abschalten (Power off lt. Logiktabelle), sonst nichts: auch im IRQ-Handler möglich
+    @classmethod
+    def cut_power(cls):
+        cls.brake.value(1)
+        cls.pwm.value(0)
+        cls.power.value(False)
+
+    # Telemetrie der letzten window_ms ms in mA: Anzahl, min, max, mean, p50/p90/p99 (None ohne Messwerte)
+    @classmethod
+    def current_telemetry(cls, window_ms=1000, percentiles=(50, 90, 99)):
+        if cls.telemetry is None:
+            return None
+        stats = cls.telemetry.stats(window_ms, percentiles)
+        if stats is not None:
+            for key in stats:
+                if key != "count":
+                    stats[key] = cls.raw2mA(stats[key])
+        return stats
+
+    # Sekundenwerte der letzten 'seconds' Sekunden in mA: [(Sekunde, min, max, mean), ...]
+    @classmethod
+    def current_history(cls, seconds=60):
+        if cls.telemetry is None:
+            return []
+        return [(t, cls.raw2mA(low), cls.raw2mA(high), cls.raw2mA(mean))
+                for t, low, high, mean in cls.telemetry.history(seconds)]
+
     #
     @classmethod
     def chk_short(cls):
         if cls.get_current() > cls.SHORT: # Kurzschluss (ggf. im Servicemode
+            if cls.SHORT_RETRY and cls.power_state:
+                cls.cut_power()
+                cls.trip_us = utime.ticks_us()
+                cls.short_report["trips"] += 1
+                cls.short_tripped = True
+                return
+            raise(RuntimeError("!!! KURZSCHLUSS !!!"))
+
+    # SHORT_RETRY: nach einem Kurzschluss mit wachsender Wartezeit wieder einschalten,
+    # nach SHORT_RETRIES Versuchen in Folge aufgeben
+    @classmethod
+    def short_backoff(cls):
+        if cls.retry_count >= cls.SHORT_RETRIES:
+            cls.retry_at = None
+            cls.retry_count = 0
+            cls.retry_delay_ms = cls.SHORT_RETRY_MS
+            cls.power_off()
             raise(RuntimeError("!!! KURZSCHLUSS !!!"))
+        cls.retry_count += 1
+        cls.retry_at = utime.ticks_add(utime.ticks_ms(), cls.retry_delay_ms)
+        cls.retry_delay_ms = min(cls.retry_delay_ms * 2, cls.SHORT_RETRY_MAX_MS)
+        cls.resumed_at = None
+
+    # Gleis wieder einschalten, ohne __init__ und RESET, und sofort den letzten Zustand senden
+    # (die Präambel des ersten Pakets liegt so schon am Gleis); resume_ms = Abschaltung bis Zustand in der FIFO
+    @classmethod
+    def resume_power(cls):
+        cls.retry_at = None
+        if cls.sampler is not None:
+            cls.sampler.rearm()
+        cls.brake.value(0)
+        cls.pwm.value(1)
+        cls.power.value(True)
+        start = utime.ticks_us()
+        cls.replay_state()
+        if cls.feeder is None:
+            cls.feed()
+        cls.short_report["replay_us"] = utime.ticks_diff(utime.ticks_us(), start)
+        cls.resumed_at = utime.ticks_ms()
+        cls.messtimer = cls.resumed_at
+        cls.short_report["retries"] += 1
+        cls.short_report["resume_ms"] = utime.ticks_diff(utime.ticks_us(), cls.trip_us) // 1000
+
+    # letzten Zustand sofort wieder senden: alle Loks (Fahrstufe, Funktionen), CV19 der Traktionen und Zubehör
+    # vor dem Refresh, Reste des alten Zyklus in der FIFO verwerfen. Basic-Zubehör nur mit D = 0, D = 1 würde
+    # Spulen (Weichen, Entkuppler) noch einmal einschalten; Signalbegriffe (Extended) immer
+    @classmethod
+    def replay_state(cls):
+        for loco in cls.locos:
+            cls.invalidate(loco)
+        words = []
+        for device in cls.accessories:
+            if device.signal or not device.D:
+                words += cls.packet_words(cls.accessory_packet(device))
+        for consist in cls.consists.values():
+            for member, reverse in consist.members:
+                pom = cls.packet_words(cls.pom_multi_packet(member, 19, consist.address | (0x80 if reverse else 0)))
+                words += pom + pom      # POM zweimal, aber ohne die RESET-Pakete aus oneshot_words()
+        cls.accessory_buffer = cls.accessory_buffer + words
+        if cls.feeder is not None:
+            cls.feeder.stop()
+            cls.statemachine.flush()
+            cls.ringbuffer = cls.buffering()
+            cls.feeder.start(cls.ringbuffer if len(cls.ringbuffer) else cls.idle_words, cls.oneshot_words())
+            cls.buffer_dirty = False
+        else:
+            cls.statemachine.flush()
+            cls.feed_words = []
+            cls.feed_pos = 0
+
+    # Zubehör-Befehl (Bytes ohne XOR) für den Zustand von device: Basic (R, D) oder Extended (aspect)
+    @classmethod
+    def accessory_packet(cls, device):
+        address = device.address + 3 & 0b0000011111111111
+        if device.signal:
+            byte1 = ((address >> 2) & 0x3f) | 0b10000000
+            byte2 = ~(address >> 3) & 0b01110000 | 0b01110001 | (address << 1) & 0b00000110
+            return [byte1, byte2, device.aspect & 0xff]  # set aspects
+        byte2 = 0b10000000
+        byte1 = ((address >> 2) & 0x3f) | byte2
+        byte2 |= (address & 0b11) << 1
+        byte2 |= ~(address & 0b11100000000) >> 4 & 0b11110000
+        byte2 |= (device.D << 3)
+        byte2 |= device.R
+        return [byte1, byte2]
 
     #
     @classmethod
     def emergency_stop(cls):
+        if cls.post(cls.emergency_stop):
+            return
         for l in cls.locos:
-            l.current_speed["FS"] = -1
+            l.set_speed(l.direction, -1)
+            cls.invalidate(l, cls.SLOT_SPEED)
         cls.buffer_dirty = True
-        
+        if cls.power_state == True:
+            cls.broadcast_stop()
+
+    # Nothalt sofort: FIFO leeren, dann ESTOP_REPEATS Broadcast-Nothalt-Pakete vor allem anderen,
+    # danach einmalige Worte (Zubehör, POM), die noch nicht sicher aus der FIFO waren, noch einmal ganz
+    # estop_report: flush_us = bis die Pakete in der FIFO stehen,
+    #               first_packet_max_us = spätester Beginn des ersten Pakets auf dem Gleis (flush_us + Rest
+    #               des Wortes, das die StateMachine gerade sendet, sh. BITGENERATOR.flush())
+    @classmethod
+    def broadcast_stop(cls):
+        start = utime.ticks_us()
+        words = cls.packet_words(list(cls.ESTOP_BROADCAST)) * cls.ESTOP_REPEATS
+        if cls.feeder is not None:
+            cls.feeder.stop()
+            queued = cls.statemachine.tx_fifo()
+            ahead_us = cls.statemachine.flush()
+            cls.feeder.start(cls.buffering(), words + cls.feeder.unsent(queued + 1))
+            cls.buffer_dirty = False
+        else:
+            queued = cls.statemachine.tx_fifo()
+            ahead_us = cls.statemachine.flush()
+            if cls.put_count - queued - 1 < cls.oneshot_end:   # + 1: Wort im OSR, flush() verwirft es
+                words = words + cls.last_oneshot
+            cls.feed_words = words
+            cls.feed_source = None
+            cls.feed_pos = 0
+            cls.feed()
+        flushed = utime.ticks_diff(utime.ticks_us(), start)
+        cls.estop_report = {"flush_us": flushed, "first_packet_max_us": flushed + ahead_us}
+
     # sends "Reset all"
     @classmethod
     def reset(cls):
         cls.__init__()
         for i in range(20):
-            cls.ringbuffer.append(cls.RESET[0])
-            cls.ringbuffer.append(cls.RESET[1])
+            cls.ringbuffer += cls.reset_words
         for i in range(10):
-            cls.ringbuffer.append(cls.IDLE[0])
-            cls.ringbuffer.append(cls.IDLE[1])
+            cls.ringbuffer += cls.idle_words
+        cls.feed_sequence()
         cls.send2track()
         
-    # Geschwindigkeitscode 14 Fahrstufen
+    # Geschwindigkeitscode 14 Fahrstufen, fl = Licht (F0)
     #
     @classmethod
-    def speed_control_14steps(cls, direction, speed):
-        pass
+    def speed_control_14steps(cls, direction, speed, fl=0):
+        return speedcodec.encode14(direction, speed, fl)
     
     # Geschwindigkeitscode 128 Fahrstufen
     #
     @classmethod
     def speed_control_128steps(cls, direction, speed):
-        if speed == -1:
-            speed = 1
-        elif speed == 0:
-            speed = 0
-        else:
-            if speed <= 126:
-                speed += 2
-            else:
-                speed = 127
-            speed &= 0xfe
-        speed |= (direction << 7)
-        speed &= 0xff
-        return speed
+        return speedcodec.encode128(direction, speed)
 
     # Geschwindigkeitscode 28 Fahrstufen
     #
     @classmethod
     def speed_control_28steps(cls, direction, speed):
-        cssss = 0
-        speed = min(speed, 28)
-        if speed == -1:                  # Notstop
-           cssss = 0b00000
-        elif 0 <= speed <= 28:
-           if speed == 0:
-               cssss = 0b00000
-           else:
-               temp = speed + 3
-               c = (temp & 0b1) << 4
-               ssss = temp >> 1
-               cssss = c | ssss
-
-        return (0b01000000 | direction << 5 | cssss) & 0xff
+        return speedcodec.encode28(direction, speed)
+
+    # Licht (F0) einer Lok, bei 14 Fahrstufen Teil des Fahrbefehls
+    @classmethod
+    def headlight(cls, loco):
+        return loco.functions & 1
+
+    # Befehlsbyte(s) einer Funktionsgruppe (FUNCTION_GROUPS) aus der Bitmaske
+    @classmethod
+    def function_instruction(cls, functions, group):
+        prefix, first, count = cls.FUNCTION_GROUPS[group]
+        if group == 0:
+            return [prefix | (functions & 1) << 4 | (functions >> 1) & 0x0f]
+        bits = (functions >> first) & ((1 << count) - 1)
+        if count == 4:
+            return [prefix | bits]
+        return [prefix, bits]   # Feature Expansion
         
    
     #
@@ -626,61 +1065,391 @@ class ELECTRICAL:
             instruction.append(loco.address)
         return instruction
         
+    # Paket (Bytes ohne XOR) für einen Slot der Lok
+    # Slot 0: Richtung und Fahrstufe, Slot 1..3: Funktionsgruppen
+    @classmethod
+    def slot_packet(cls, loco, slot):
+        # lange oder kurze Adresse
+        instruction = cls.generate_address(loco)
+        if slot == cls.SLOT_SPEED:
+            if loco.consist:
+                return []   # Lok in einer Traktion: Fahrbefehl an die Traktionsadresse
+            # Richtung, Geschwindigkeit
+            richtung = loco.direction
+            fahrstufe = loco.fs
+            if cls.uses_combined(loco):
+                # Fahrstufe und Funktionen in einem Paket
+                instruction += speedcodec.instruction_combined(richtung, fahrstufe, loco.functions,
+                                                               cls.combined_functions(loco) // 8)
+            else:
+                fl = cls.headlight(loco) if loco.speedsteps == 14 else 0
+                instruction += speedcodec.instruction(loco.speedsteps, richtung, fahrstufe, fl)
+        elif cls.combined_covers(loco, slot):
+            return []   # im kombinierten Befehl enthalten, Slot entfällt
+        elif (slot >= cls.SLOT_HIGH or loco.address in cls.consists) and not loco.extended & (1 << slot):
+            return []   # Gruppe ab F13 bzw. Funktion der Traktionsadresse (CV21/22) nie benutzt, Slot entfällt
+        else:
+            # Funktionen
+            instruction += cls.function_instruction(loco.functions, slot - 1)
+        return instruction
+
+    # kombinierter Befehl (Fahrstufe, Richtung, Funktionen) für diese Lok? Nur bei 128 Fahrstufen
+    @classmethod
+    def uses_combined(cls, loco):
+        return loco.combined and loco.speedsteps == 128 and not loco.consist
+
+    # Anzahl Funktionen im kombinierten Befehl: F0-F15 bei kurzer Adresse, F0-F7 bei langer
+    # (das Paket darf höchstens 5 Bytes ohne XOR haben)
+    @classmethod
+    def combined_functions(cls, loco):
+        return 8 if loco.use_long_address else 16
+
+    # Funktionsgruppe (Slot 1..3) vollständig im kombinierten Befehl enthalten?
+    @classmethod
+    def combined_covers(cls, loco, slot):
+        if not cls.uses_combined(loco):
+            return False
+        return cls.group_mask(slot - 1) >> cls.combined_functions(loco) == 0
+
+    # Pakete (Bytes ohne XOR) für alle aktiven Loks
+    @classmethod
+    def generate_packets(cls):
+        packets = []
+        for loco in cls.locos:
+            for slot in range(len(loco.slots)):
+                packet = cls.slot_packet(loco, slot)
+                if packet != []:
+                    packets.append(packet)
+        return packets
+
     #
     @classmethod
     def generate_instructions(cls):
         words  = []
         lengths = []
-        for loco in cls.locos:
-            # lange oder kurze Adresse
-            instruction = cls.generate_address(loco)
-            # Richtung, Geschwindigkeit
-            richtung = loco.current_speed["Dir"]
-            fahrstufe = loco.current_speed["FS"]
-            if loco.speedsteps == 128:
-                speed = cls.speed_control_128steps(richtung, fahrstufe)
-                instruction.append(0b00111111)
-                instruction.append(speed)
-            elif loco.speedsteps == 28:
-                speed = cls.speed_control_28steps(richtung, fahrstufe)
-                instruction.append(speed)
-            elif loco.speedsteps == 14: # @TODO
-                speed = cls.speed_control_14steps(richtung, fahrstufe)
-                pass
-            else:
-                pass
-
+        for instruction in cls.generate_packets():
             l, w = cls.prepare(instruction)
             words.append(w)
             lengths.append(l)
-        
-            # Funktionen
-            for f in loco.functions:
-                instruction = []
-                if loco.use_long_address:
-                    instruction.append(192 | (loco.address // 256))
-                    instruction.append(loco.address & 0xff)
-                else:
-                    instruction.append(loco.address)
-                    
-                instruction.append(f)
-
-                l, w = cls.prepare(instruction)
-                words.append(w)
-                lengths.append(l)
-                
         return lengths, words
             
+    # Slot(s) einer Lok ungültig machen, sie werden beim nächsten buffering() neu kodiert
+    @classmethod
+    def invalidate(cls, loco, slot=ALL_SLOTS):
+        if loco.dirty == 0:
+            cls.dirty_locos.append(loco)
+        if slot == cls.ALL_SLOTS:
+            loco.dirty = (1 << len(loco.slots)) - 1
+        else:
+            loco.dirty |= 1 << slot
+        cls.buffer_dirty = True
+        cls.refresh_fully(loco, slot)
+        if cls.SCHEDULER == "edf":
+            if slot == cls.ALL_SLOTS:
+                for slot in range(len(loco.deadlines)):
+                    loco.deadlines[slot] = cls.clock_ms()   # neue Lok: alle Slots sofort fällig
+            else:
+                cls.urge(loco, slot)
+
+    # geänderte Funktionsgruppe(n) wieder in jedem Zyklus senden ("decay" und Gruppen ab F13)
+    @classmethod
+    def refresh_fully(cls, loco, slot=ALL_SLOTS):
+        for s in range(1, len(loco.slots)):
+            if slot == cls.ALL_SLOTS or slot == s:
+                loco.ages[s] = 0
+                loco.skips[s] = 0
+                if loco.skipped & (1 << s):
+                    loco.skipped &= ~(1 << s)
+                    cls.relayout()
+
+    # Bitmaske der Funktionen einer Gruppe (FUNCTION_GROUPS)
+    @classmethod
+    def group_mask(cls, group):
+        prefix, first, count = cls.FUNCTION_GROUPS[group]
+        return ((1 << count) - 1) << first
+
+    # Intervall bis zum nächsten Senden eines Funktions-Slots (in Zyklen bzw. Vielfachen von
+    # REFRESH_FUNCTION_MS), 0 = erst nach der nächsten Änderung wieder senden
+    # "decay": nach FUNCTION_FULL_REPEATS verdoppelt es sich bei jedem Senden bis FUNCTION_PERIOD_MAX,
+    #          bzw. FUNCTION_PERIOD_OFF, wenn alle Funktionen aus sind
+    # ab F13 (immer): nach FUNCTION_FULL_REPEATS nur noch alle FUNCTION_PERIOD_HIGH, wenn alle aus: nicht mehr
+    @classmethod
+    def function_period(cls, loco, slot):
+        age = loco.ages[slot]
+        if age < 255:
+            loco.ages[slot] = age + 1
+        if age < cls.FUNCTION_FULL_REPEATS:
+            return 1
+        on = loco.functions & cls.group_mask(slot - 1)
+        if slot >= cls.SLOT_HIGH:
+            return cls.FUNCTION_PERIOD_HIGH if on else 0
+        if on:
+            limit = cls.FUNCTION_PERIOD_MAX
+        else:
+            limit = cls.FUNCTION_PERIOD_OFF
+        return min(1 << min(age - cls.FUNCTION_FULL_REPEATS + 1, 8), limit)
+
+    # SCHEDULER = "cycle": zu Beginn eines Zyklus festlegen, welche Funktions-Slots er enthält
+    # (LOCO.skipped, "decay" und Gruppen ab F13); ändert sich die Auswahl, wird der Wortpuffer
+    # neu aufgebaut. LOCO.skips = 255: Slot ruht bis zur nächsten Änderung
+    @classmethod
+    def refresh_tick(cls):
+        first = 1 if cls.FUNCTION_REFRESH == "decay" else cls.SLOT_HIGH
+        for loco in cls.locos:
+            if first == cls.SLOT_HIGH and not loco.extended >> cls.SLOT_HIGH:
+                continue
+            skipped = 0
+            for slot in range(first, len(loco.slots)):
+                if loco.slots[slot] is None:
+                    continue
+                skips = loco.skips[slot]
+                if skips == 255:
+                    skipped |= 1 << slot
+                elif skips:
+                    loco.skips[slot] = skips - 1
+                    skipped |= 1 << slot
+                else:
+                    period = cls.function_period(loco, slot)
+                    loco.skips[slot] = 255 if period == 0 else period - 1
+            if skipped != loco.skipped:
+                loco.skipped = skipped
+                cls.relayout()
+
+    # Lokliste geändert: Wortpuffer beim nächsten buffering() komplett neu aufbauen
+    @classmethod
+    def relayout(cls):
+        cls.layout_dirty = True
+        cls.buffer_dirty = True
+
+    # ungültige Slots einer Lok neu kodieren; bleibt die Lage im Wortpuffer
+    # gleich, werden die Worte direkt im Wortpuffer ersetzt (sendet feed() gerade
+    # daraus, hat buffering() vorher auf den zweiten Wortpuffer gewechselt)
+    @classmethod
+    def encode_slots(cls, loco):
+        slots = loco.slots
+        for slot in range(len(slots)):
+            if loco.dirty & (1 << slot):
+                if slot == cls.SLOT_SPEED and cls.speed_from_table(loco):
+                    continue
+                packet = cls.slot_packet(loco, slot)
+                loco.packets[slot] = packet
+                words = slots[slot]
+                if 2 <= len(packet) <= 5:
+                    size = encoder.words(len(packet), cls.PREAMBLE)
+                    if words is None or len(words) != size:
+                        slots[slot] = words = encoder.wordbuffer(size)
+                        loco.views[slot] = encoder.halves(words)
+                        cls.layout_dirty = True
+                    elif cls.streaming(words):
+                        slots[slot] = words = encoder.wordbuffer(size)   # "edf": alte Worte zu Ende senden
+                        loco.views[slot] = encoder.halves(words)
+                    encoder.encode(packet, words, 0, cls.PREAMBLE, loco.views[slot])
+                    if not cls.layout_dirty and cls.PACKING == "word" and not loco.skipped & (1 << slot):
+                        pos = loco.offsets[slot]
+                        for i in range(size):
+                            cls.wordbuffer[pos + i] = words[i]
+                elif words is not None:
+                    slots[slot] = None
+                    loco.views[slot] = None
+                    cls.layout_dirty = True
+        loco.dirty = 0
+
+    # Fahrstufentabelle für eine Lok anlegen (lazy: Einträge werden erst beim
+    # ersten Gebrauch kodiert). Tabellen zuletzt gesteuerter Loks bleiben
+    # erhalten, solange SPEED_TABLE_BUDGET nicht überschritten wird.
+    @classmethod
+    def attach_speed_table(cls, loco):
+        if loco.speed_table is not None:
+            cls.speed_tables.remove(loco)
+            cls.speed_tables.append(loco)
+            return
+        if cls.uses_combined(loco) or loco.consist:
+            return      # Funktionen im Fahrbefehl bzw. kein eigener Fahrbefehl, Tabelle nicht möglich
+        length = len(cls.slot_packet(loco, cls.SLOT_SPEED))
+        if not 2 <= length <= 5:
+            return
+        size = encoder.words(length, cls.PREAMBLE)
+        entries = cls.speed_variants(loco) * (cls.speed_top(loco) + 2)   # je Richtung (und Licht) Notstop, 0 .. höchste Fahrstufe
+        need = entries * (size * 4 + 1)
+        if need > cls.SPEED_TABLE_BUDGET:
+            return
+        while cls.speed_table_bytes + need > cls.SPEED_TABLE_BUDGET:
+            cls.drop_speed_table(cls.speed_tables[0])
+        loco.speed_table = encoder.wordbuffer(entries * size)
+        loco.speed_view = encoder.halves(loco.speed_table)
+        loco.speed_filled = bytearray(entries)
+        loco.speed_size = size
+        cls.speed_tables.append(loco)
+        cls.speed_table_bytes += need
+
     #
     @classmethod
+    def drop_speed_table(cls, loco):
+        if loco.speed_table is not None:
+            cls.speed_table_bytes -= len(loco.speed_filled) * (loco.speed_size * 4 + 1)
+            cls.speed_tables.remove(loco)
+            loco.speed_table = None
+            loco.speed_view = None
+            loco.speed_filled = None
+
+    # höchster Fahrstufenwert, der im Fahrstufen-Code unterschieden wird
+    @classmethod
+    def speed_top(cls, loco):
+        return speedcodec.top(loco.speedsteps)
+
+    # Anzahl Teiltabellen: Richtung, bei 14 Fahrstufen zusätzlich Licht (F0)
+    @classmethod
+    def speed_variants(cls, loco):
+        return 4 if loco.speedsteps == 14 else 2
+
+    # Fahrstufen-Slot aus der Tabelle übernehmen, False: nicht möglich
+    @classmethod
+    def speed_from_table(cls, loco):
+        if loco.speed_table is None or cls.PACKING != "word" or cls.uses_combined(loco):
+            return False
+        words = loco.slots[cls.SLOT_SPEED]
+        size = loco.speed_size
+        fs = loco.fs
+        if words is None or len(words) != size or fs < -1:
+            return False
+        top = cls.speed_top(loco)
+        variant = loco.direction
+        if loco.speedsteps == 14:
+            variant = variant << 1 | cls.headlight(loco)
+        index = variant * (top + 2) + min(fs, top) + 1
+        table = loco.speed_table
+        base = index * size
+        if not loco.speed_filled[index]:
+            encoder.encode(cls.slot_packet(loco, cls.SLOT_SPEED), table, base, cls.PREAMBLE, loco.speed_view)
+            loco.speed_filled[index] = 1
+        if cls.streaming(words):
+            loco.slots[cls.SLOT_SPEED] = words = encoder.wordbuffer(size)   # "edf": alte Worte zu Ende senden
+            loco.views[cls.SLOT_SPEED] = encoder.halves(words)
+        for i in range(size):
+            words[i] = table[base + i]
+        loco.packets[cls.SLOT_SPEED] = None   # Bytes bei Bedarf neu erzeugen
+        if not cls.layout_dirty:
+            pos = loco.offsets[cls.SLOT_SPEED]
+            for i in range(size):
+                cls.wordbuffer[pos + i] = words[i]
+        return True
+
+    # Bytes eines Slots, ggf. neu erzeugt (Fahrstufe aus der Tabelle)
+    @classmethod
+    def packet_of(cls, loco, slot):
+        packet = loco.packets[slot]
+        if packet is None:
+            packet = cls.slot_packet(loco, slot)
+            loco.packets[slot] = packet
+        return packet
+
+    # Refresh-Zyklus aus den Slots aller Loks zusammensetzen, liefert eine
+    # memoryview auf den belegten Teil des Wortpuffers
+    # PACKING = "word":       jedes Paket beginnt auf einer Wortgrenze (wie prepare()),
+    #                         geänderte Slots werden nur an ihrer Stelle ersetzt
+    # PACKING = "continuous": Pakete lückenlos hintereinander (BITPACKER)
+    # PACKING = "byte":       Längenbyte + Bytes je Paket (BYTEPACKER), Präambel und Trennbits
+    #                         erzeugt der BITGENERATOR
+    @classmethod
     def buffering(cls):
-        buffer = []
-        l, w = cls.generate_instructions()
-        buffer = cls.make_buffer(l, w)
-        if buffer == []:
-            buffer = cls.IDLE
+        if cls.streaming(cls.wordbuffer):
+            cls.spare_buffer()
+        cls.encode_dirty()
+        if cls.PACKING != "word":
+            cls.assemble_continuous()
+        elif cls.layout_dirty:
+            cls.assemble_words()
+        if cls.wordcount == 0:
+            return cls.idle_words
+        return memoryview(cls.wordbuffer)[:cls.wordcount]
+
+    # True: feed() steht mitten in diesen Worten (Wortpuffer oder Slot-Worte), sie dürfen nicht an Ort
+    # und Stelle überschrieben werden, sonst ginge ein halb altes, halb neues Paket aufs Gleis
+    @classmethod
+    def streaming(cls, words):
+        return words is cls.feed_source and cls.feed_pos < len(cls.feed_words)
 
-        return buffer
+    # buffering() während feed() aus dem Wortpuffer sendet (z.B. direkter Aufruf zwischen zwei feed()):
+    # im zweiten Wortpuffer weiterarbeiten, feed_words behält den alten bis zum Ende des Zyklus
+    @classmethod
+    def spare_buffer(cls):
+        spare = cls.spare_wordbuffer
+        view = cls.spare_wordview
+        if spare is None or len(spare) != len(cls.wordbuffer):
+            spare = encoder.wordbuffer(len(cls.wordbuffer))
+            view = encoder.halves(spare)
+        if cls.PACKING == "word" and not cls.layout_dirty:
+            for i in range(cls.wordcount):      # Slots werden an ihrer Stelle ersetzt
+                spare[i] = cls.wordbuffer[i]
+        cls.spare_wordbuffer = cls.wordbuffer
+        cls.spare_wordview = cls.wordview
+        cls.wordbuffer = spare
+        cls.wordview = view
+        cls.buffer_dirty = True     # ringbuffer zeigt noch auf den alten Puffer
+
+    # ungültige Slots aller Loks neu kodieren
+    @classmethod
+    def encode_dirty(cls):
+        for loco in cls.dirty_locos:
+            cls.encode_slots(loco)
+        cls.dirty_locos = []
+
+    # Wortpuffer aus den kodierten Slots neu aufbauen
+    @classmethod
+    def assemble_words(cls):
+        size = 0
+        packet_bits = 0
+        count = 0
+        for loco in cls.locos:
+            for slot in range(len(loco.slots)):
+                words = loco.slots[slot]
+                if words is not None and not loco.skipped & (1 << slot):
+                    size += len(words)
+                    packet_bits += cls.packer.bits(len(cls.packet_of(loco, slot)))
+                    count += 1
+        if len(cls.wordbuffer) < size:
+            cls.wordbuffer = encoder.wordbuffer(size + cls.WORDBUFFER_RESERVE)
+            cls.wordview = encoder.halves(cls.wordbuffer)
+        pos = 0
+        for loco in cls.locos:
+            for slot in range(len(loco.slots)):
+                words = loco.slots[slot]
+                if words is not None and not loco.skipped & (1 << slot):
+                    loco.offsets[slot] = pos
+                    for word in words:
+                        cls.wordbuffer[pos] = word
+                        pos += 1
+        cls.wordcount = pos
+        cls.layout_dirty = False
+        cls.bit_report = {"packets": count, "words": pos, "bits": pos * 32,
+                          "packet_bits": packet_bits, "padding_bits": pos * 32 - packet_bits}
+
+    # Pakete aus den Slots lückenlos packen (BITPACKER oder BYTEPACKER)
+    @classmethod
+    def assemble_continuous(cls):
+        lengths = []
+        for loco in cls.locos:
+            for slot in range(len(loco.slots)):
+                if loco.slots[slot] is not None and not loco.skipped & (1 << slot):
+                    lengths.append(len(cls.packet_of(loco, slot)))
+        size = cls.packer.words(lengths)
+        if len(cls.wordbuffer) < size:
+            cls.wordbuffer = encoder.wordbuffer(size + cls.WORDBUFFER_RESERVE)
+            cls.wordview = encoder.halves(cls.wordbuffer)
+        cls.packer.begin(cls.wordbuffer, 0, cls.wordview)
+        for loco in cls.locos:
+            for slot in range(len(loco.slots)):
+                if loco.slots[slot] is not None and not loco.skipped & (1 << slot):
+                    cls.packer.append(cls.packet_of(loco, slot))
+        cls.wordcount = cls.packer.finish()
+        cls.layout_dirty = True   # Lage der Pakete ist nicht wortweise
+        cls.bit_report = cls.packer.report()
+
+    # Bitbilanz des letzten Refresh-Zyklus
+    # packets, words, bits (= words * 32), packet_bits (Präambel, Daten, Trennbits), padding_bits
+    @classmethod
+    def bit_accounting(cls):
+        return cls.bit_report
     
 
     #
@@ -700,71 +1469,228 @@ class ELECTRICAL:
                 print()
         return buffer
 
+    # einzelnes Paket (Bytes ohne XOR) als Worte für den BITGENERATOR, [] bei ungültiger Länge
+    @classmethod
+    def packet_words(cls, packet):
+        if cls.PACKING == "byte":
+            if not 2 <= len(packet) <= 5:
+                return []
+            packer = bytepacker(cls.PREAMBLE)
+            words = encoder.wordbuffer(packer.words([len(packet)]))
+            packer.begin(words)
+            packer.append(packet)
+            packer.finish()
+            return list(words)
+        l, w = cls.prepare(packet)
+        return cls.make_buffer([l], [w])
+
+    # einmalig zu sendende Worte: Zubehör, POM (2x, dann nochmals mit 5 x RESET)
+    @classmethod
+    def oneshot_words(cls):
+        words = cls.accessory_buffer
+        cls.accessory_buffer = []
+        if cls.pom_buffer != []:
+            words = words + cls.pom_buffer + cls.pom_buffer
+            for i in range(5):
+                cls.pom_buffer += cls.reset_words
+            words = words + cls.pom_buffer
+            cls.pom_buffer = []
+        return words
+
+    # Worte im ringbuffer (RESET/IDLE nach dem Einschalten) vor dem nächsten Zyklus senden
+    @classmethod
+    def feed_sequence(cls):
+        cls.feed_words = cls.ringbuffer
+        cls.feed_source = None
+        cls.feed_pos = 0
+        cls.ringbuffer = []
+
+    # nächsten Zyklus für send2track() bereitstellen: einmalige Worte, dann Refresh
+    @classmethod
+    def next_cycle(cls):
+        if cls.SCHEDULER == "edf":
+            cls.next_scheduled()
+            return
+        cls.refresh_tick()
+        if cls.buffer_dirty:
+            cls.ringbuffer = cls.buffering()
+            cls.buffer_dirty = False
+        buffer = cls.ringbuffer
+        if len(buffer) == 0:
+            buffer = cls.idle_words
+        oneshot = cls.oneshot_words()
+        if oneshot != []:
+            if DEBUG:
+                print("Accessory/POM signal:", [bin(word) for word in oneshot])
+            cls.keep_oneshot(oneshot)
+            buffer = oneshot + list(buffer)
+        if DEBUG:
+            print("Operation Mode Track signal:", [bin(word) for word in buffer])
+        cls.feed_words = buffer
+        cls.feed_source = cls.wordbuffer if buffer is cls.ringbuffer and cls.wordcount else None
+        cls.feed_pos = 0
+
+    # einmalige Worte merken, die feed() ab jetzt in die FIFO schreibt (vorher steht der Rest von feed_words an)
+    @classmethod
+    def keep_oneshot(cls, oneshot):
+        cls.last_oneshot = oneshot
+        cls.oneshot_end = cls.put_count + len(cls.feed_words) - cls.feed_pos + len(oneshot)
+
+    # ms seit cls.epoch, Zeitbasis für LOCO.deadlines
+    @classmethod
+    def clock_ms(cls):
+        return utime.ticks_diff(utime.ticks_ms(), cls.epoch)
+
+    # epoch um 'shift' ms vorstellen, Termine und Zeitpunkte entsprechend verschieben: ticks_diff()
+    # gilt nur für eine halbe Periode der ticks (~6 Tage), danach wäre clock_ms() negativ und die
+    # Reihenfolge der Termine falsch. Lange überfällige Termine bleiben bei -EPOCH_SHIFT_MS stehen.
+    @classmethod
+    def shift_epoch(cls, shift):
+        cls.epoch = utime.ticks_add(cls.epoch, shift)
+        for loco in cls.locos:
+            deadlines = loco.deadlines
+            for slot in range(len(deadlines)):
+                deadlines[slot] = max(deadlines[slot] - shift, -cls.EPOCH_SHIFT_MS)
+        for entry in cls.urgent:
+            entry[3] = max(entry[3] - shift, -cls.EPOCH_SHIFT_MS)
+
+    # geänderten Slot in die Vorrang-Spur stellen (bzw. Wiederholungen neu beginnen)
+    @classmethod
+    def urge(cls, loco, slot):
+        for entry in cls.urgent:
+            if entry[0] is loco and entry[1] == slot:
+                entry[2] = cls.URGENT_REPEATS
+                return
+        cls.urgent.append([loco, slot, cls.URGENT_REPEATS, cls.clock_ms()])
+
+    # "edf": nächstes Paket wählen
+    # 1. einmalige Worte (Zubehör, POM)
+    # 2. Vorrang-Spur: geänderte Slots, reihum je einmal, bis URGENT_REPEATS erreicht ist
+    # 3. Refresh: Slot mit dem frühesten Termin (Fahrstufe alle REFRESH_SPEED_MS,
+    #    Funktionsgruppen alle REFRESH_FUNCTION_MS)
+    @classmethod
+    def next_scheduled(cls):
+        cls.feed_pos = 0
+        cls.feed_source = None
+        oneshot = cls.oneshot_words()
+        if oneshot != []:
+            cls.keep_oneshot(oneshot)
+            cls.feed_words = oneshot
+            return
+        cls.encode_dirty()
+        cls.buffer_dirty = False
+        now = cls.clock_ms()
+        if now >= cls.EPOCH_SHIFT_MS:
+            cls.shift_epoch(now)
+            now = 0
+        report = cls.schedule_report
+        loco = None
+        while cls.urgent:
+            entry = cls.urgent.pop(0)
+            if cls.loco_index.get(entry[0].address) is not entry[0] or entry[0].slots[entry[1]] is None:
+                continue    # Lok inzwischen entfernt
+            loco, slot = entry[0], entry[1]
+            if entry[2] == cls.URGENT_REPEATS:
+                report["latency_max_ms"] = max(report["latency_max_ms"], now - entry[3])
+            entry[2] -= 1
+            if entry[2] > 0:
+                cls.urgent.append(entry)
+            report["urgent"] += 1
+            break
+        if loco is None:
+            due = 0
+            for candidate in cls.locos:
+                deadlines = candidate.deadlines
+                slots = candidate.slots
+                skips = candidate.skips
+                for s in range(len(slots)):
+                    if slots[s] is not None and skips[s] != 255 and (loco is None or deadlines[s] < due):
+                        loco, slot, due = candidate, s, deadlines[s]
+            if loco is None:
+                cls.feed_words = cls.idle_words
+                return
+            report["late_max_ms"] = max(report["late_max_ms"], now - due)
+        if slot == cls.SLOT_SPEED:
+            loco.deadlines[slot] = now + cls.REFRESH_SPEED_MS
+        elif cls.FUNCTION_REFRESH == "decay" or slot >= cls.SLOT_HIGH:
+            period = cls.function_period(loco, slot)
+            if period == 0:
+                loco.skips[slot] = 255    # ruht bis zur nächsten Änderung
+            loco.deadlines[slot] = now + cls.REFRESH_FUNCTION_MS * period
+        else:
+            loco.deadlines[slot] = now + cls.REFRESH_FUNCTION_MS
+        report["packets"] += 1
+        if cls.PACKING == "byte":
+            cls.packer.begin(cls.packet_buffer, 0, cls.packet_view)
+            cls.packer.append(cls.packet_of(loco, slot))
+            cls.feed_words = memoryview(cls.packet_buffer)[:cls.packer.finish()]
+        else:
+            cls.feed_words = loco.slots[slot]   # Slot-Worte, auf Wortgrenzen (auch bei "continuous")
+            cls.feed_source = cls.feed_words
+
+    # TX-FIFO nachfüllen: nur so viele Worte, wie Platz ist, ohne zu blockieren;
+    # der Zyklus wird beim nächsten Aufruf ab feed_pos fortgesetzt
+    @classmethod
+    def feed(cls):
+        free = cls.statemachine.fifo_depth - cls.statemachine.tx_fifo()
+        while free > 0:
+            if cls.feed_pos >= len(cls.feed_words):
+                cls.next_cycle()
+            words = cls.feed_words
+            pos = cls.feed_pos
+            end = min(pos + free, len(words))
+            if not DEBUG:
+                state = machine.disable_irq()
+            start = utime.ticks_us()
+            for i in range(pos, end):
+                cls.statemachine.put(words[i])
+            duration = utime.ticks_diff(utime.ticks_us(), start)
+            if not DEBUG:
+                machine.enable_irq(state)
+            cls.irq_off_max_us = max(cls.irq_off_max_us, duration)
+            cls.put_count += end - pos
+            cls.feed_pos = end
+            free -= end - pos
+
     #
     @classmethod
     def send2track(cls):
         try:
+            if cls.short_tripped:
+                cls.short_tripped = False
+                if not cls.SHORT_RETRY:
+                    cls.power_off()
+                    raise(RuntimeError("!!! KURZSCHLUSS !!!"))
+                cls.short_backoff()
+            if cls.retry_at is not None:
+                if utime.ticks_diff(utime.ticks_ms(), cls.retry_at) < 0:
+                    return          # Gleis aus, Wartezeit läuft
+                cls.resume_power()
+            elif cls.resumed_at is not None and utime.ticks_diff(utime.ticks_ms(), cls.resumed_at) > cls.SHORT_STABLE_MS:
+                cls.resumed_at = None
+                cls.retry_count = 0
+                cls.retry_delay_ms = cls.SHORT_RETRY_MS
             if cls.power_state == True:
                 if (utime.ticks_ms() - cls.messtimer > 100):
                     cls.chk_short()
                     cls.messtimer = utime.ticks_ms()
-                     
-                if cls.buffer_dirty:
-                    buffer = cls.buffering()
-                    cls.ringbuffer = buffer
-                else:
-                    buffer = cls.ringbuffer
-                if buffer == []:
-                    buffer = cls.IDLE
-                
-                if not DEBUG:
-                    state = machine.disable_irq()
-
-                if cls.accessory_buffer != []:
-                    if DEBUG:
-                        print("Accessory signal: ", end="")
-                    for word in cls.accessory_buffer:
-                        if DEBUG:
-                            print("["+bin(word)+"]", end=" ")
-                        cls.statemachine.put(word)
-                    cls.accessory_buffer = []
-                    if DEBUG:
-                        print()
- 
-                if cls.pom_buffer != []:
-                    if DEBUG:
-                        print("POM signal: ", end="")
-
-                    for n in range(2):
-                        for word in cls.pom_buffer:
-                            if DEBUG:
-                                print("["+bin(word)+"]", end=" ")
-                            cls.statemachine.put(word)
-                    
-                    for i in range(5):
-                        cls.pom_buffer.append(cls.RESET[0])
-                        cls.pom_buffer.append(cls.RESET[1])
-                        
-                    for word in cls.pom_buffer:
-                        if DEBUG:
-                            print("["+bin(word)+"]", end=" ")
-                        cls.statemachine.put(word)
-                    if DEBUG:
-                        print()
-                    
-                    cls.pom_buffer = []
-                    
-                if DEBUG:
-                    print("Operation Mode Track signal:", end=" ")
-                for word in buffer:
-                    if DEBUG:
-                        print("["+bin(word)+"]", end=" ")
-                    cls.statemachine.put(word)
-                if DEBUG:
-                    print()
-                if not DEBUG:
-                    machine.enable_irq(state)
-                cls.buffer_dirty = False
+
+                if cls.feeder is not None:
+                    # DMA sendet den Zyklus selbst, nur Änderungen übergeben
+                    if cls.feeder.cycles != cls.dma_cycles:
+                        cls.dma_cycles = cls.feeder.cycles
+                        cls.refresh_tick()
+                    if cls.buffer_dirty or cls.accessory_buffer != [] or cls.pom_buffer != []:
+                        if cls.buffer_dirty:
+                            cls.ringbuffer = cls.buffering()
+                        buffer = cls.ringbuffer
+                        if len(buffer) == 0:
+                            buffer = cls.idle_words
+                        cls.feeder.submit(buffer, cls.oneshot_words())
+                        cls.buffer_dirty = False
+                    return
+
+                cls.feed()
 
         except KeyboardInterrupt:
             raise(KeyboardInterrupt("SIGINT"))
@@ -788,55 +1714,191 @@ class OPERATIONS(ELECTRICAL):
         
     @classmethod
     def ctrl_loco(cls, address=3, use_long_address=False, speedsteps=28, name=""):
-        cls.active_loco = LOCO(address, use_long_address, speedsteps)
-        index = cls.search(cls.active_loco.address)
+        if cls.post(cls.ctrl_loco, (address, use_long_address, speedsteps, name), True):
+            return
+        loco = cls.find_loco(address)
 
-        if index == None:
-            cls.locos.append(cls.active_loco)
-        else:
-            if (name != ""):
-                cls.active_loco.name = name
-            else:
-                cls.active_loco.name = cls.locos[index].name
-                
-            if cls.active_loco.speedsteps != cls.locos[index].speedsteps or \
-               cls.active_loco.use_long_address != cls.locos[index].use_long_address or \
-               cls.active_loco.name != cls.locos[index].name:
-                
-                cls.active_loco.current_speed = cls.locos[index].current_speed
-                cls.active_loco.functions = cls.locos[index].functions
-                cls.locos.remove(cls.locos[index])
-                cls.locos.append(cls.active_loco)
+        if loco == None:
+            if cls.loco_pool:
+                loco = cls.loco_pool.pop()
+                loco.reset(address, use_long_address, speedsteps, name)
             else:
-                cls.active_loco = cls.locos[index]
+                loco = LOCO(address, use_long_address, speedsteps, name)
+            cls.locos.append(loco)
+            cls.loco_index[address] = loco
+            cls.invalidate(loco)
+            cls.relayout()
+        else:
+            if (name == ""):
+                name = loco.name
+            if address > 127:
+                use_long_address = True
+
+            if speedsteps != loco.speedsteps or \
+               use_long_address != loco.use_long_address or \
+               name != loco.name:
+                # geänderte Lok: Fahrzustand und Funktionen bleiben, sie rückt ans Ende des Refresh
+                cls.drop_speed_table(loco)
+                loco.speedsteps = speedsteps
+                loco.use_long_address = use_long_address
+                loco.name = name
+                cls.locos.remove(loco)
+                cls.locos.append(loco)
+                cls.invalidate(loco)
+                cls.relayout()
+        cls.active_loco = loco
+        cls.attach_speed_table(cls.active_loco)
 
     @classmethod
     def update_name(cls, name=""):
-        index = cls.search(cls.active_loco.address)
-        if index != None:
-            cls.locos[index].name = name
+        if cls.post(cls.update_name, (name,), True):
+            return
+        loco = cls.find_loco(cls.active_loco.address)
+        if loco != None:
+            loco.name = name
 
     @classmethod
     def update_speedsteps(cls, speedsteps=28):
-        index = cls.search(cls.active_loco.address)
-        if index != None:
-            cls.locos[index].speedsteps = speedsteps
+        if cls.post(cls.update_speedsteps, (speedsteps,), True):
+            return
+        loco = cls.find_loco(cls.active_loco.address)
+        if loco != None:
+            loco.speedsteps = speedsteps
+            cls.invalidate(loco, cls.ALL_SLOTS if loco.combined else cls.SLOT_SPEED)
+            cls.drop_speed_table(loco)
+            cls.attach_speed_table(loco)
+
+    # kombinierten Befehl (RP 9.2.1: Speed, Direction and Functions) für die aktive Lok
+    # erlauben; nur wirksam bei 128 Fahrstufen, der Decoder muss den Befehl kennen
+    @classmethod
+    def update_combined(cls, combined=True):
+        if cls.post(cls.update_combined, (combined,), True):
+            return
+        loco = cls.find_loco(cls.active_loco.address)
+        if loco != None and loco.combined != combined:
+            loco.combined = combined
+            cls.drop_speed_table(loco)
+            cls.invalidate(loco)
+            cls.attach_speed_table(loco)
+
+    # Lok aus dem Refresh entfernen; ein Mitglied einer Traktion verlässt sie (CV19 = 0 wie bei dissolve_consist())
+    @classmethod
+    def remove_loco(cls, address):
+        if cls.post(cls.remove_loco, (address,), True):
+            return cls.find_loco(address) == None
+        if address in cls.consists:
+            return cls.dissolve_consist(address)
+        loco = cls.loco_index.pop(address, None)
+        if loco != None:
+            consist = cls.consists.get(loco.consist)
+            if consist != None:
+                consist.members = [member for member in consist.members if member[0] != address]
+                cls.pom_multi(address, 19, 0)
+            cls.locos.remove(loco)
+            if loco == cls.active_loco:
+                cls.active_loco = None
+            cls.release_loco(loco)
+            cls.relayout()
+            return True
+        return False
+
+    # Mehrfachtraktion (Advanced Consist): die Mitglieder erhalten per POM die Traktionsadresse
+    # (CV19) und werden danach nur noch mit Funktionen refresht, gefahren wird die Traktion wie
+    # eine Lok mit der kurzen Adresse 'address' (wird aktive Lok).
+    # members: Lokadressen aktiver Loks oder (Adresse, umgekehrt), umgekehrt = True: Lok fährt
+    # in der Traktion rückwärts (CV19 Bit 7)
+    @classmethod
+    def ctrl_consist(cls, address, members, speedsteps=28, name=""):
+        if cls.post(cls.ctrl_consist, (address, members, speedsteps, name), True):
+            return cls.find_consist(address) != None
+        if not 1 <= address <= 127:
+            return False
+        if address in cls.consists:
+            cls.dissolve_consist(address)
+        elif address in cls.loco_index:
+            return False    # Adresse gehört einer Lok
+        consist = CONSIST(address, name)
+        for member in members:
+            if type(member) == int:
+                member = (member, False)
+            loco = cls.find_loco(member[0])
+            if loco == None or loco.consist or member[0] == address:
+                continue
+            loco.consist = address
+            cls.drop_speed_table(loco)
+            cls.invalidate(loco)
+            consist.members.append((member[0], bool(member[1])))
+            cls.pom_multi(member[0], 19, address | (0x80 if member[1] else 0))
+        cls.relayout()
+        cls.consists[address] = consist
+        cls.ctrl_loco(address, False, speedsteps, name)
+        return True
+
+    # Traktion auflösen: CV19 der Mitglieder löschen, sie übernehmen Fahrstufe und Richtung der Traktion
+    @classmethod
+    def dissolve_consist(cls, address):
+        if cls.post(cls.dissolve_consist, (address,), True):
+            return cls.find_consist(address) == None
+        consist = cls.consists.pop(address, None)
+        if consist == None:
+            return False
+        head = cls.find_loco(address)
+        for member, reverse in consist.members:
+            loco = cls.find_loco(member)
+            if loco != None and loco.consist == address:
+                loco.consist = 0
+                if head != None:
+                    loco.set_speed(head.direction ^ reverse, head.fs)
+                cls.invalidate(loco)
+            cls.pom_multi(member, 19, 0)
+        cls.remove_loco(address)
+        return True
+
+    # Traktion mit dieser Adresse oder None
+    @classmethod
+    def find_consist(cls, address):
+        return cls.consists.get(address)
 
+    # Lok in den Pool zurückgeben; ihre Einträge in der Vorrang-Spur ("edf") verwerfen, sonst
+    # würden sie nach reset() unter der neuen Adresse gesendet
+    @classmethod
+    def release_loco(cls, loco):
+        cls.drop_speed_table(loco)
+        if loco.dirty:
+            cls.dirty_locos.remove(loco)
+            loco.dirty = 0
+        cls.urgent = [entry for entry in cls.urgent if entry[0] is not loco]
+        if len(cls.loco_pool) < cls.LOCO_POOL:
+            cls.loco_pool.append(loco)
+
+    # aktive Lok mit dieser Adresse oder None
+    @classmethod
+    def find_loco(cls, address):
+        return cls.loco_index.get(address)
+
+    # Index in locos (wie bisher), besser find_loco() verwenden
     @classmethod
     def search(cls, address):
-        for i in range(len(cls.locos)):
-            if cls.locos[i].address == address:
-                return i
-        return None
+        loco = cls.loco_index.get(address)
+        if loco == None:
+            return None
+        return cls.locos.index(loco)
 
     #
     @classmethod
     def end(cls):
+        cls.stop_thread()
         cls.emergency_stop()
         if cls.power_state == True:
             cls.power_off()
         utime.sleep_ms(100)
+        for loco in cls.locos:
+            cls.release_loco(loco)
         cls.locos = []
+        cls.loco_index = {}
+        cls.consists = {}
+        cls.relayout()
+        cls.stop_sampler()
         cls.device = None
         cls.active_loco = None
         cls = None
@@ -847,10 +1909,14 @@ class OPERATIONS(ELECTRICAL):
         cls.power_on()
         cls.chk_short()
         utime.sleep_ms(100)
+        if cls.THREADED:
+            cls.start_thread()
     
     # run this in a infinitive loop
     @classmethod
     def loop(cls):
+        if cls.threaded():   # Core 1 sendet selbst
+            return
         if cls.power_state == False:
             raise(RuntimeError("Power is off"))
         cls.send2track()    # scheduler: Funktion liefert die DCC-Instruktionen an das Gleis
@@ -859,36 +1925,21 @@ class OPERATIONS(ELECTRICAL):
     #
     @classmethod
     def get_function_group_index(cls, function_nr):
-        if function_nr < 5:
-            function_group = 0
-        elif function_nr < 9:
-            function_group = 1
-        else:
-            function_group = 2
-        return function_group
+        return cls.FUNCTION_GROUP[function_nr]
     
     # Shift für die Funktionsbytes    
     #
     @classmethod
     def get_function_shift(cls, function_nr):
-        if function_nr == 0:
-            function_shift = 4
-        else:
-            function_shift = ((function_nr - 1) % 4)
-        return function_shift
+        return cls.FUNCTION_SHIFT[function_nr]
 
     # Funktionscode
     #
     @classmethod
     def function_control(cls, funktion=0):
-        f =  0b10000000
-        if 0 <= funktion <= 4:
-            pass
-        elif 5 <= funktion <= 8:
-            f |= 0b110000
-        elif 9 <= funktion <= 12:
-            f |= 0b100000
-        return f
+        if 0 <= funktion <= cls.FUNCTION_MAX:
+            return cls.FUNCTION_GROUPS[cls.FUNCTION_GROUP[funktion]][0]
+        return 0b10000000
 
     #
     @classmethod
@@ -906,56 +1957,90 @@ class OPERATIONS(ELECTRICAL):
     #
     @classmethod
     def get_function(cls, function_nr):
+        cls.sync()
         status = False
-        if 0 <= function_nr <= 12:
-            function_group = cls.get_function_group_index(function_nr)
-            status = (cls.active_loco.functions[function_group] & (1 << cls.get_function_shift(function_nr))) != 0 
+        if 0 <= function_nr <= cls.FUNCTION_MAX:
+            status = (cls.active_loco.functions & (1 << function_nr)) != 0
         return status
         
     # Funktionsbits setzen und an Lok senden
     #
     @classmethod
     def set_function(cls, function_nr, status = True):
-        if 0 <= function_nr <= 12:
-            function_group = cls.get_function_group_index(function_nr)
-            instruction_prefix = cls.function_control(function_nr)
+        if cls.post(cls.set_function, (function_nr, status)):
+            return
+        if 0 <= function_nr <= cls.FUNCTION_MAX:
+            function_group = cls.FUNCTION_GROUP[function_nr]
+            if function_group + 1 >= cls.SLOT_HIGH:
+                cls.active_loco.expand()
+            cls.active_loco.extended |= 1 << (function_group + 1)   # Slot ab jetzt belegt
             if status == True:
-                cls.active_loco.functions[function_group] |= ((1 << cls.get_function_shift(function_nr)) | instruction_prefix)
+                cls.active_loco.functions |= 1 << function_nr
             else:
-                cls.active_loco.functions[function_group] &= (~(1 << cls.get_function_shift(function_nr)) | instruction_prefix)
+                cls.active_loco.functions &= ~(1 << function_nr)
+            if not cls.combined_covers(cls.active_loco, 1 + function_group):
+                cls.invalidate(cls.active_loco, 1 + function_group)
+            if function_nr == 0 and cls.active_loco.speedsteps == 14:
+                cls.invalidate(cls.active_loco, cls.SLOT_SPEED)   # Licht im Fahrbefehl
+            elif cls.uses_combined(cls.active_loco) and function_nr < cls.combined_functions(cls.active_loco):
+                cls.invalidate(cls.active_loco, cls.SLOT_SPEED)   # Funktion im kombinierten Befehl
         cls.buffer_dirty = True
         
     # fahre mit 14 oder 28/128 FS (128 bevorzugt)
     #
     @classmethod
     def drive(cls, richtung, fahrstufe):  # Fahrstufen
-        cls.active_loco.current_speed = {"Dir": richtung, "FS": fahrstufe}
-        cls.buffer_dirty = True
+        if cls.post(cls.drive, (richtung, fahrstufe)):
+            return
+        cls.active_loco.set_speed(richtung, fahrstufe)
+        cls.invalidate(cls.active_loco, cls.SLOT_SPEED)
         cls.loop()
         
     #
     @classmethod
     def speed(cls, speed=None):
+        cls.sync()
         if speed != None:
-            if speed != cls.active_loco.current_speed["FS"]:
-                cls.drive(cls.active_loco.current_speed["Dir"], speed)
-        return cls.active_loco.current_speed["FS"]
+            if speed != cls.active_loco.fs:
+                cls.drive(cls.active_loco.direction, speed)
+                cls.sync()
+        return cls.active_loco.fs
         
     #
     @classmethod
     def direction(cls, direction=None):
+        cls.sync()
         if direction != None:
-            if direction != cls.active_loco.current_speed["Dir"]:
-                cls.drive(direction, cls.active_loco.current_speed["FS"])
-        return cls.active_loco.current_speed["Dir"]
+            if direction != cls.active_loco.direction:
+                cls.drive(direction, cls.active_loco.fs)
+                cls.sync()
+        return cls.active_loco.direction
 
 
+    # Zubehördecoder mit dieser Adresse oder None
+    @classmethod
+    def find_accessory(cls, addr):
+        return cls.accessory_index.get(addr)
+
+    # Index in accessories (wie bisher), besser find_accessory() verwenden
     @classmethod
     def search_accessory(cls, addr):
-        for i in range(len(cls.accessories)):
-            if cls.accessories[i].address == addr:
-                return i
-        return None
+        device = cls.accessory_index.get(addr)
+        if device == None:
+            return None
+        return cls.accessories.index(device)
+
+    # Zubehördecoder eintragen bzw. Zustand übernehmen
+    @classmethod
+    def register_accessory(cls, device):
+        known = cls.accessory_index.get(device.address)
+        if known != None:
+            known.D = device.D
+            known.R = device.R
+            known.aspect = device.aspect
+        else:
+            cls.accessories.append(device)
+            cls.accessory_index[device.address] = device
 
     # Basic accessory command:
     # Param: address per output (4 per board)
@@ -963,50 +2048,22 @@ class OPERATIONS(ELECTRICAL):
     #        R = Direction normal (0) or diverging (1)
     @classmethod
     def ctrl_accessory_basic(cls, address=1, D=0, R=0):
-        byte2 = 0b10000000
-        device = ACCESSORY(address, D, R)
-        i = cls.search_accessory(device.address)
-        if(i != None):
-            cls.accessories[i].D = D
-            cls.accessories[i].R = R
-        else:
-            cls.accessories.append(device)
-  
-        address = address + 3 & 0b0000011111111111
-        
-        byte1 = ((address >> 2) & 0x3f) | byte2
-  
-        byte2 |= (address & 0b11) << 1
-        byte2 |= ~(address & 0b11100000000) >> 4 & 0b11110000
-        byte2 |= (D << 3)
-        byte2 |= R
-        
-        l, w = cls.prepare([byte1, byte2])
-        cls.accessory_buffer = cls.make_buffer([l], [w])
+        if cls.post(cls.ctrl_accessory_basic, (address, D, R)):
+            return
+        device = ACCESSORY(address, R=R, D=D)
+        cls.register_accessory(device)
+        cls.accessory_buffer = cls.packet_words(cls.accessory_packet(device))
         cls.loop()
     
     #
     @classmethod
     def ctrl_accessory_extended(cls, address=1, aspects=0):
-        b1 = 0b10000000
-        b2 = 0b01110001
-        b3 = 0b00000000
-
+        if cls.post(cls.ctrl_accessory_extended, (address, aspects)):
+            return
         device = ACCESSORY(address, 0, 1, True)
-        i = cls.search_accessory(device.address)
-        if(i != None):
-            cls.accessories[i]["D"] = D
-            cls.accessories[i]["R"] = R
-        else:
-            cls.accessories.append(device)
-
-        b = address + 3 & 0b0000011111111111
-        byte1 = ((b >> 2) & 0x3f) | b1
-        byte2 = ~(b >> 3) & 0b01110000 | b2 | (b << 1) & 0b00000110
-        byte3 = aspects & 0xff  # set aspects
-            
-        l, w = cls.prepare([byte1, byte2, byte3])
-        cls.accessory_buffer = cls.make_buffer([l], [w])
+        device.aspect = aspects & 0xff
+        cls.register_accessory(device)
+        cls.accessory_buffer = cls.packet_words(cls.accessory_packet(device))
         cls.loop()
         
 
@@ -1015,6 +2072,8 @@ class OPERATIONS(ELECTRICAL):
     # {preamble} 10AAAAAA 0 1AAA1AA0 0 (1110CCVV 0 VVVVVVVV 0 DDDDDDDD) 0 EEEEEEEE
     @classmethod
     def pom_accessory(cls, address=0, cv=0, value=0): # Diese Grundeinstellung resultiert in einem Fehler
+        if cls.post(cls.pom_accessory, (address, cv, value)):
+            return
         if address == 0:
             return
         if type(cv) != int: # must not set more then 1 byte at once!
@@ -1067,10 +2126,7 @@ class OPERATIONS(ELECTRICAL):
 
         if DEBUG:
             print(instructions)
-        l, w = cls.prepare(instructions)
-        if DEBUG:
-            print(l, w)
-        cls.pom_buffer = cls.make_buffer([l], [w])
+        cls.pom_buffer = cls.packet_words(instructions)
         if DEBUG:
             print(cls.pom_buffer)
         cls.loop()
@@ -1078,44 +2134,147 @@ class OPERATIONS(ELECTRICAL):
     # Multifunction decoder
     @classmethod
     def pom_multi(cls, address=0, cv=0, value=0): # Diese Grundeinstellung resultiert in einem Fehler
+        if cls.post(cls.pom_multi, (address, cv, value)):
+            return
         if address == 0 or cv == 0:
             return []
+        cls.pom_buffer = cls.pom_buffer + cls.packet_words(cls.pom_multi_packet(address, cv, value))   # mehrere POM vor dem nächsten Zyklus
+        cls.loop()
+
+    # POM-Befehl (Bytes ohne XOR) "CV schreiben" für einen Multifunction decoder
+    @classmethod
+    def pom_multi_packet(cls, address, cv, value):
         cv -= 1
-        byte1 = address& 0x7f
+        if address > 127:
+            instructions = [192 | (address // 256), address & 0xff]
+        else:
+            instructions = [address & 0x7f]
         byte2 = 0b11101100 | ((cv >> 8) & 0x3) # CV Bit 8-9
         byte3 = cv & 0xff
         byte4 = value & 0xff
-        instructions = [byte1, byte2, byte3, byte4]
-        
-        l, w = cls.prepare(instructions)
-        cls.pom_buffer = cls.make_buffer([l], [w])
-        cls.loop()
+        instructions += [byte2, byte3, byte4]
+        return instructions
+
+# ----------------------------------------------------------------
+
+# Mehrfachtraktion: Traktionsadresse und Mitglieder (Lokadresse, umgekehrt)
+class CONSIST:
+    __slots__ = ("address", "members", "name")
+
+    def __init__(self, address, name=""):
+        self.address = address
+        self.members = []
+        self.name = name
 
 # ----------------------------------------------------------------
 
+# Zustand kompakt in einem Integer (flags):
+#   Bit 0: R, Bit 1: D, Bit 2: Signal (erweiterter Zubehördecoder), Bit 3: zeitgesteuert
 class ACCESSORY:
+    __slots__ = ("address", "flags", "aspect", "name")
+
     # new accessory
     def __init__(self, address=1, R=0, D=0, signal = False, timed = False, name=""):
         self.address = address
-        self.R = R
-        self.D = D
-        self.signal = signal
-        self.timed = timed
+        self.flags = (R & 1) | (D & 1) << 1 | (4 if signal else 0) | (8 if timed else 0)
+        self.aspect = 0
         self.name = name
-        
+
+    @property
+    def R(self):
+        return self.flags & 1
+
+    @R.setter
+    def R(self, value):
+        self.flags = (self.flags & ~1) | (value & 1)
+
+    @property
+    def D(self):
+        return (self.flags >> 1) & 1
+
+    @D.setter
+    def D(self, value):
+        self.flags = (self.flags & ~2) | (value & 1) << 1
+
+    @property
+    def signal(self):
+        return (self.flags & 4) != 0
+
+    @property
+    def timed(self):
+        return (self.flags & 8) != 0
+
+# Fahrzustand als ein Integer: speed = (Fahrstufe + 1) << 1 | Richtung
+# Funktionen als Bitmaske: Bit n = Fn
 class LOCO:
+    __slots__ = ("address", "use_long_address", "speedsteps", "name", "speed", "functions",
+                 "slots", "views", "packets", "offsets", "dirty", "speed_table", "speed_view", "speed_filled", "speed_size", "deadlines",
+                 "ages", "skips", "skipped", "combined", "extended", "consist")
+    SLOTS = const(11)                           # Fahrstufe + 10 Funktionsgruppen (ELECTRICAL.FUNCTION_GROUPS)
+    BASE_SLOTS = const(4)                       # Fahrstufe, F0-F4, F5-F8, F9-F12, die übrigen erst mit expand()
+
     # new_loco
     def __init__(self, address=None, use_long_address=False, speedsteps=28, name=""):
+        # vorkodierte Pakete je Slot: Fahrstufe, F0-F4, F5-F8, F9-F12 (F13-F20 ... F61-F68 nach expand())
+        self.slots = [None] * self.BASE_SLOTS   # Worte (array) je Slot
+        self.views = [None] * self.BASE_SLOTS   # 16-Bit-Sicht je Slot (PACKETENCODER.halves())
+        self.packets = [None] * self.BASE_SLOTS # Bytes je Slot (ohne XOR)
+        self.offsets = [0] * self.BASE_SLOTS    # Lage im Wortpuffer
+        self.deadlines = [0] * self.BASE_SLOTS  # nächster Refresh je Slot (SCHEDULER = "edf")
+        self.ages = bytearray(self.BASE_SLOTS)  # Sendungen seit der letzten Änderung ("decay", Gruppen ab F13)
+        self.skips = bytearray(self.BASE_SLOTS) # Zyklen bis zum nächsten Senden, 255 = ruht
+        self.skipped = 0                        # Bitmaske der Slots, die im aktuellen Zyklus fehlen ("decay", ab F13)
+        self.dirty = 0                          # Bitmaske ungültiger Slots
+        self.speed_table = None                 # vorkodierte Fahrstufen-Pakete (nur aktive Loks)
+        self.speed_view = None                  # 16-Bit-Sicht auf speed_table
+        self.speed_filled = None                # Eintrag schon kodiert?
+        self.speed_size = 0                     # Worte je Eintrag
         if address != None:
-            self.address = address
-            if(self.address > 127):
-                self.use_long_address = True
-            else:
-                self.use_long_address = use_long_address
-            self.current_speed = {"Dir": 1, "FS": 0}
-            self.speedsteps = speedsteps
-            self.functions = [0b10000000, 0b10110000, 0b10100000]
-            self.name = name
+            self.reset(address, use_long_address, speedsteps, name)
+
+    # (wieder-)verwenden, z.B. aus dem Pool; die Wortpuffer der Slots bleiben erhalten
+    def reset(self, address, use_long_address=False, speedsteps=28, name=""):
+        self.address = address
+        if(self.address > 127):
+            self.use_long_address = True
+        else:
+            self.use_long_address = use_long_address
+        self.speedsteps = speedsteps
+        self.name = name
+        self.speed = 3                          # vorwärts, Fahrstufe 0
+        self.functions = 0
+        self.dirty = 0
+        self.skipped = 0
+        self.combined = False                   # kombinierter Befehl erlaubt (update_combined)
+        self.extended = 0                       # Bitmaske der benutzten Funktions-Slots (ab F13, Traktionen)
+        self.consist = 0                        # Traktionsadresse (CV19), 0 = keine Traktion
+        for slot in range(len(self.deadlines)):
+            self.deadlines[slot] = 0
+            self.ages[slot] = 0
+            self.skips[slot] = 0
+
+    # Slots der Feature Expansion (F13-F68) anlegen, erst wenn eine dieser Funktionen geschaltet wird
+    def expand(self):
+        grow = self.SLOTS - len(self.slots)
+        if grow > 0:
+            self.slots += [None] * grow
+            self.views += [None] * grow
+            self.packets += [None] * grow
+            self.offsets += [0] * grow
+            self.deadlines += [0] * grow
+            self.ages += bytearray(grow)
+            self.skips += bytearray(grow)
+
+    @property
+    def fs(self):
+        return (self.speed >> 1) - 1
+
+    @property
+    def direction(self):
+        return self.speed & 1
+
+    def set_speed(self, direction, fs):
+        self.speed = (fs + 1) << 1 | (1 if direction else 0)
 
         
 # ------------------------------------------------------------------
\ No newline at end of file
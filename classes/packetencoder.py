@@ -0,0 +1,284 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Paket-Encoder: schreibt DCC-Pakete als 32-Bit-Worte für den BITGENERATOR
+# direkt in ein vorher angelegtes array('I')
+#
+# Bitstrom je Paket (wie ELECTRICAL.prepare()):
+#   {Padding-Einsen} {Präambel} 0 [Byte 1] 0 [Byte 2] ... 0 [XOR] 1
+# Das Padding füllt links mit Einsen bis zur Wortgrenze auf.
+#
+# Im Gegensatz zu prepare() entsteht dabei keine beliebig lange Ganzzahl:
+# die Bits werden in 16-Bit-Hälften gesammelt (max. 25 Bit im Akkumulator)
+# und über eine 16-Bit-Sicht (halves()) in den Wortpuffer geschrieben. Ein
+# 32-Bit-Wert wird nie gebildet (auf MicroPython ist jede Ganzzahl ab 2^30
+# ein Objekt im Heap).
+#
+# Die Sicht kostet auf MicroPython ein uctypes-Objekt im Heap. Wer abwechselnd
+# in mehrere Puffer schreibt, legt sie deshalb einmal je Puffer an und gibt sie
+# mit (encode(..., view=...), begin(..., view=...)); ohne view wird nur die
+# Sicht des zuletzt benutzten Puffers wiederverwendet. Der uctypes-Zweig von
+# halves() läuft nur auf dem pico (der Host hat memoryview.cast()).
+#
+# ----------------------------------------------------------------------
+
+import sys
+from array import array
+from micropython import const
+try:
+    import uctypes
+except ImportError:     # CPython (Host): memoryview.cast()
+    uctypes = None
+
+HIGH = 1 if sys.byteorder == "little" else 0    # Index der oberen Hälfte eines Wortes in halves()
+
+
+class PACKETENCODER:
+
+    PREAMBLE = const(14)          # Präambel f. Operation Mode
+    view_buffer = None            # Puffer des letzten encode() und seine 16-Bit-Sicht
+    view = None
+
+    # leeren Wortpuffer anlegen
+    @classmethod
+    def wordbuffer(cls, size):
+        return array('I', [0] * size)
+
+    # 16-Bit-Sicht auf einen Wortpuffer: Wort i = view[2 * i + HIGH] << 16 | view[2 * i + 1 - HIGH]
+    @classmethod
+    def halves(cls, buffer):
+        view = memoryview(buffer)
+        if hasattr(view, "cast"):
+            return view.cast("B").cast("H")
+        # MicroPython: memoryview kennt kein cast()
+        return uctypes.struct(uctypes.addressof(buffer),
+                              {"h": (uctypes.ARRAY | 0, uctypes.UINT16 | 2 * len(buffer))}).h
+
+    # Anzahl der Worte für ein Paket mit 'length' Bytes (ohne XOR)
+    @classmethod
+    def words(cls, length, preamble=PREAMBLE):
+        bits = preamble + (length + 1) * 9 + 1
+        return (bits + 32 - bits % 32) // 32
+
+    # Paket (Bytes ohne XOR) ab buffer[pos] schreiben, liefert die Anzahl der Worte
+    # view: halves(buffer), falls schon vorhanden
+    @classmethod
+    def encode(cls, packet, buffer, pos=0, preamble=PREAMBLE, view=None):
+        err = 0
+        for byte in packet:
+            err ^= byte
+        bits = preamble + (len(packet) + 1) * 9 + 1
+        lead = preamble + 32 - bits % 32    # Padding + Präambel
+        if view is None:
+            if buffer is not cls.view_buffer:
+                cls.view = cls.halves(buffer)
+                cls.view_buffer = buffer
+            view = cls.view
+        start = pos
+        while lead >= 32:
+            view[2 * pos] = 0xffff
+            view[2 * pos + 1] = 0xffff
+            pos += 1
+            lead -= 32
+        half = -1
+        if lead >= 16:
+            half = 0xffff
+            lead -= 16
+        acc = (1 << lead) - 1
+        n = lead
+        for i in range(len(packet) + 1):
+            acc = (acc << 9) | (packet[i] if i < len(packet) else err)  # 0 + Byte
+            n += 9
+            if n >= 16:
+                n -= 16
+                if half < 0:
+                    half = acc >> n
+                else:
+                    view[2 * pos + HIGH] = half
+                    view[2 * pos + 1 - HIGH] = acc >> n
+                    pos += 1
+                    half = -1
+                acc &= (1 << n) - 1
+        # Abschluss-Bit, die Bitzahl ist jetzt ein Vielfaches von 32
+        view[2 * pos + HIGH] = half
+        view[2 * pos + 1 - HIGH] = (acc << 1) | 1
+        return pos + 1 - start
+
+
+# Fortlaufende Packung: die Pakete werden ohne Auffüllen auf Wortgrenzen
+# hintereinander gehängt, jedes mit der vollen Präambel:
+#   {Präambel} 0 [Byte 1] 0 ... 0 [XOR] 1 {Präambel} 0 [Byte 1] ...
+# Erst am Ende des Zyklus wird mit Einsen bis zur Wortgrenze aufgefüllt, diese
+# verlängern die Präambel des ersten Pakets im nächsten Durchlauf.
+#
+# packer = BITPACKER()
+# packer.begin(buffer)
+# packer.append([3, 0b01110100])
+# words = packer.finish()
+class BITPACKER:
+
+    def __init__(self, preamble=PACKETENCODER.PREAMBLE):
+        self.preamble = preamble
+        self.buffer = None
+        self.view = None            # 16-Bit-Sicht auf buffer (PACKETENCODER.halves())
+        self.begin(None)
+
+    # neuen Zyklus ab buffer[pos] beginnen, view: halves(buffer), falls schon vorhanden
+    def begin(self, buffer, pos=0, view=None):
+        if view is not None:
+            self.view = view
+        elif buffer is not self.buffer:
+            self.view = None if buffer is None else PACKETENCODER.halves(buffer)
+        self.buffer = buffer
+        self.start = pos
+        self.pos = pos
+        self.half = -1
+        self.acc = 0
+        self.n = 0
+        self.packets = 0
+        self.packet_bits = 0    # Präambel + Daten + Trennbits aller Pakete
+        self.padding_bits = 0   # Auffüllen bis zur Wortgrenze
+
+    # Anzahl Bits eines Pakets mit 'length' Bytes (ohne XOR)
+    def bits(self, length):
+        return self.preamble + (length + 1) * 9 + 1
+
+    # Anzahl der Worte für Pakete mit den angegebenen Längen (ohne XOR)
+    def words(self, lengths):
+        bits = 0
+        for length in lengths:
+            bits += self.bits(length)
+        return (bits + 31) // 32
+
+    # 'count' Bits (max. 9) aus 'value' anhängen
+    def _push(self, value, count):
+        self.acc = (self.acc << count) | value
+        self.n += count
+        if self.n >= 16:
+            self.n -= 16
+            if self.half < 0:
+                self.half = self.acc >> self.n
+            else:
+                self.view[2 * self.pos + HIGH] = self.half
+                self.view[2 * self.pos + 1 - HIGH] = self.acc >> self.n
+                self.pos += 1
+                self.half = -1
+            self.acc &= (1 << self.n) - 1
+
+    # Paket (Bytes ohne XOR) anhängen
+    def append(self, packet):
+        ones = self.preamble
+        while ones > 0:
+            count = min(ones, 9)
+            self._push((1 << count) - 1, count)
+            ones -= count
+        err = 0
+        for byte in packet:
+            err ^= byte
+            self._push(byte, 9)     # 0 + Byte
+        self._push(err, 9)
+        self._push(1, 1)
+        self.packets += 1
+        self.packet_bits += self.bits(len(packet))
+
+    # Zyklus abschließen, liefert die Anzahl der geschriebenen Worte
+    def finish(self):
+        while self.n > 0 or self.half >= 0:
+            count = min(16 - self.n, 9)
+            self.padding_bits += count
+            self._push((1 << count) - 1, count)
+        return self.pos - self.start
+
+    # Bitbilanz des letzten Zyklus
+    def report(self):
+        words = self.pos - self.start
+        return {"packets": self.packets, "words": words, "bits": words * 32,
+                "packet_bits": self.packet_bits, "padding_bits": self.padding_bits}
+
+
+# Byte-Packung für das Programm BITGENERATOR.dccbyte: je Paket ein Längenbyte N
+# (Bytes inkl. XOR), dann die N Bytes. Präambel, Trenn- und Endbits erzeugt die
+# StateMachine, am Ende wird mit Füllbytes 0 bis zur Wortgrenze aufgefüllt
+# (jedes Füllbyte sendet eine '1', verlängert also nur die nächste Präambel):
+#   [N] [Byte 1] ... [XOR] [N] [Byte 1] ... [XOR] {0 ...}
+#
+# packer = BYTEPACKER()
+# packer.begin(buffer)
+# packer.append([3, 0b01110100])
+# words = packer.finish()
+class BYTEPACKER:
+
+    def __init__(self, preamble=PACKETENCODER.PREAMBLE):
+        self.preamble = preamble    # nur für die Bitbilanz, die Präambel erzeugt die StateMachine
+        self.buffer = None
+        self.view = None            # 16-Bit-Sicht auf buffer (PACKETENCODER.halves())
+        self.begin(None)
+
+    # neuen Zyklus ab buffer[pos] beginnen, view: halves(buffer), falls schon vorhanden
+    def begin(self, buffer, pos=0, view=None):
+        if view is not None:
+            self.view = view
+        elif buffer is not self.buffer:
+            self.view = None if buffer is None else PACKETENCODER.halves(buffer)
+        self.buffer = buffer
+        self.start = pos
+        self.pos = pos
+        self.half = -1
+        self.acc = 0
+        self.n = 0
+        self.packets = 0
+        self.packet_bits = 0    # Präambel + Daten + Trennbits aller Pakete (auf dem Gleis)
+        self.padding_bits = 0   # Füllbytes, je eine '1' auf dem Gleis
+
+    # Anzahl Bits eines Pakets mit 'length' Bytes (ohne XOR) auf dem Gleis
+    def bits(self, length):
+        return self.preamble + (length + 1) * 9 + 1
+
+    # Anzahl der Worte für Pakete mit den angegebenen Längen (ohne XOR)
+    def words(self, lengths):
+        size = 0
+        for length in lengths:
+            size += length + 2      # Längenbyte + Daten + XOR
+        return (size + 3) // 4
+
+    # ein Byte anhängen
+    def _push(self, byte):
+        self.acc = (self.acc << 8) | byte
+        self.n += 1
+        if self.n == 2:
+            if self.half < 0:
+                self.half = self.acc
+            else:
+                self.view[2 * self.pos + HIGH] = self.half
+                self.view[2 * self.pos + 1 - HIGH] = self.acc
+                self.pos += 1
+                self.half = -1
+            self.acc = 0
+            self.n = 0
+
+    # Paket (Bytes ohne XOR) anhängen
+    def append(self, packet):
+        self._push(len(packet) + 1)
+        err = 0
+        for byte in packet:
+            err ^= byte
+            self._push(byte)
+        self._push(err)
+        self.packets += 1
+        self.packet_bits += self.bits(len(packet))
+
+    # Zyklus abschließen, liefert die Anzahl der geschriebenen Worte
+    def finish(self):
+        while self.n > 0 or self.half >= 0:
+            self.padding_bits += 1
+            self._push(0)
+        return self.pos - self.start
+
+    # Bitbilanz des letzten Zyklus
+    def report(self):
+        words = self.pos - self.start
+        return {"packets": self.packets, "words": words, "bits": words * 32,
+                "packet_bits": self.packet_bits, "padding_bits": self.padding_bits}
@@ -64,6 +64,7 @@
 #
 import machine
 from classes.bitgenerator import BITGENERATOR as bitgenerator
+from classes.currentsampler import CURRENTSAMPLER as currentsampler
 from micropython import const
 import utime
 
@@ -114,6 +115,8 @@ class ELECTRICAL_SM:
         self.power = machine.Pin(self.POWER_PIN, machine.Pin.OUT)
         self.dir_pin = machine.Pin(self.DIR_PIN, machine.Pin.OUT)
         self.analog_in = machine.ADC(machine.Pin(self.ACK_PIN))
+        self.current_table = currentsampler.table(self.calibration)   # Rohwert -> mA
+        self.current_weights = currentsampler.weights(self.CURRENT_SMOOTHING)
         self.power_state = self.power.value()
         self.ack_committed = False
         self.buffer_dirty = False
@@ -124,7 +127,7 @@ class ELECTRICAL_SM:
         self.power_on_cycle = 20
         
         self.statemachine = bitgenerator(self.dir_pin)
-        self.statemachine.begin()
+        self.statemachine.begin(idle=False)   # keine IDLE-Pakete bei leerer FIFO
 
         self.messtimer = utime.ticks_ms()
         
@@ -154,18 +157,28 @@ class ELECTRICAL_SM:
         self.power_state = True
         self.chk_short()
 
+    # Rohwert (0..65535) -> mA, ganzzahlig aus der Tabelle
     def raw2mA(self, analog_value):
+        return currentsampler.to_mA(self.current_table, analog_value)
+
+    # Kalibrierung: Rohwert -> mA (float), nur für die Tabelle
+    def calibration(self, analog_value):
         analog_value = analog_value * self.AREF_VOLT / 65535  # ADC mappt auf 0..65535
         analog_value /= self.LMD18200_SENS_SHUNT  # Rsense
         return (analog_value / self.LMD18200_SENS_AMPERE_PER_AMPERE) - self.LMD18200_QUIESCENT_CURRENT  # lt. Datenblatt 377 µA / A +/- 10 %
 
     def get_current(self):
+        k, k1 = self.current_weights
+        shift = currentsampler.FILTER_SHIFT
+        half = 1 << (shift - 1)
+        read = self.analog_in.read_u16
         analog_value = 0
         max_value = 0
         for i in range(0, self.DENOISE_SAMPLES):
-            analog_value = (self.analog_in.read_u16() - analog_value) * self.CURRENT_SMOOTHING + analog_value * (1 - self.CURRENT_SMOOTHING)
-            max_value = max(analog_value, max_value)
-        return round(self.raw2mA(max_value))
+            analog_value = (read() * k + analog_value * k1 + half) >> shift
+            if analog_value > max_value:
+                max_value = analog_value
+        return self.raw2mA(max_value)
     
     def chk_short(self):
         if self.get_current() > self.SHORT: # Kurzschluss (ggf. im Servicemode
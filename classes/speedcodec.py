@@ -0,0 +1,107 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Fahrstufen-Codes für 14, 28 und 128 Fahrstufen (NMRA RP 9.2 / 9.2.1) als Tabellen
+#
+# Fahrstufe -1 = Notstop, 0 = Stop, 1 .. 14/28/126 = Fahrstufe
+# Werte über der höchsten Fahrstufe werden auf diese begrenzt.
+#
+#   14 FS:  01DCSSSS              C = FL (Licht), SSSS: 0 Stop, 1 Notstop, 2..15 = FS 1..14
+#   28 FS:  01DCSSSS              CSSSS: 00000 Stop, 00001 Notstop, 00010 .. 11111 = FS 1..28
+#                                 (C ist das niederwertigste Bit der Fahrstufe + 3)
+#  128 FS:  00111111 DSSSSSSS     SSSSSSS: 0 Stop, 1 Notstop, 2..127 = FS 1..126
+#  kombiniert (RP 9.2.1, Speed, Direction and Functions):
+#            00111100 DSSSSSSS FFFFFFFF [FFFFFFFF ...]   F7..F0, [F15..F8, F23..F16, F31..F24]
+#
+#   D = 1: vorwärts, D = 0: rückwärts
+#
+# ----------------------------------------------------------------------
+
+from micropython import const
+
+# Index = Fahrstufe + 1
+_STEPS14 = bytes([0b0001, 0b0000] + [s + 1 for s in range(1, 15)])
+_STEPS28 = bytes([0b00001, 0b00000] + [((s + 3) & 1) << 4 | (s + 3) >> 1 for s in range(1, 29)])
+_STEPS128 = bytes([1, 0] + [s + 1 for s in range(1, 127)])
+
+
+class SPEEDCODEC:
+
+    STEPS14 = _STEPS14
+    STEPS28 = _STEPS28
+    STEPS128 = _STEPS128
+    INSTRUCTION_128 = const(0b00111111)   # Advanced Operation: 128 Speed Step Control
+    INSTRUCTION_COMBINED = const(0b00111100)   # Advanced Operation: Speed, Direction and Functions
+
+    # höchster Fahrstufenwert der Tabelle
+    @classmethod
+    def top(cls, speedsteps):
+        if speedsteps == 14:
+            return 14
+        if speedsteps == 28:
+            return 28
+        return 126
+
+    # Index in die Tabelle: Notstop = 0, Stop = 1, ...
+    @classmethod
+    def index(cls, speedsteps, speed):
+        if speed < -1:
+            speed = 0
+        return min(speed, cls.top(speedsteps)) + 1
+
+    # 01DCSSSS für 14 Fahrstufen, C = FL
+    @classmethod
+    def encode14(cls, direction, speed, fl=0):
+        return 0b01000000 | (direction & 1) << 5 | (fl & 1) << 4 | _STEPS14[cls.index(14, speed)]
+
+    # 01DCSSSS für 28 Fahrstufen
+    @classmethod
+    def encode28(cls, direction, speed):
+        return 0b01000000 | (direction & 1) << 5 | _STEPS28[cls.index(28, speed)]
+
+    # DSSSSSSS für 128 Fahrstufen (nach dem Befehlsbyte 00111111)
+    @classmethod
+    def encode128(cls, direction, speed):
+        return (direction & 1) << 7 | _STEPS128[cls.index(128, speed)]
+
+    # Fahrbefehl als Liste von Bytes (ohne Adresse), [] bei unbekannter Fahrstufenzahl
+    @classmethod
+    def instruction(cls, speedsteps, direction, speed, fl=0):
+        if speedsteps == 128:
+            return [cls.INSTRUCTION_128, cls.encode128(direction, speed)]
+        if speedsteps == 28:
+            return [cls.encode28(direction, speed)]
+        if speedsteps == 14:
+            return [cls.encode14(direction, speed, fl)]
+        return []
+
+    # kombinierter Befehl (Bytes ohne Adresse): 128 Fahrstufen und function_bytes (1..4) Bytes
+    # der Funktionsmaske (Bit n = Fn)
+    @classmethod
+    def instruction_combined(cls, direction, speed, functions, function_bytes=1):
+        instruction = [cls.INSTRUCTION_COMBINED, cls.encode128(direction, speed)]
+        for i in range(function_bytes):
+            instruction.append((functions >> (8 * i)) & 0xff)
+        return instruction
+
+    # Fahrbefehl (Bytes ohne Adresse) -> (Richtung, Fahrstufe, FL), FL nur bei 14 FS und kombiniertem Befehl
+    @classmethod
+    def decode(cls, speedsteps, instruction):
+        if instruction[0] == cls.INSTRUCTION_COMBINED:
+            code = instruction[1]
+            return code >> 7, _STEPS128.index(code & 0x7f) - 1, instruction[2] & 1
+        if speedsteps == 128:
+            code = instruction[-1]
+            return code >> 7, _STEPS128.index(code & 0x7f) - 1, 0
+        code = instruction[0]
+        if speedsteps == 28:
+            cssss = code & 0x1f
+            if cssss == 0b10000:    # Stop (I)
+                cssss = 0
+            elif cssss == 0b10001:  # Notstop (I)
+                cssss = 1
+            return (code >> 5) & 1, _STEPS28.index(cssss) - 1, 0
+        return (code >> 5) & 1, _STEPS14.index(code & 0x0f) - 1, (code >> 4) & 1
@@ -0,0 +1,56 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Host-Emulation: Ersatzmodule für machine, rp2, utime, _thread und micropython,
+# damit OPERATIONS und SERVICEMODE unter CPython (z.B. auf einem Linux-PC)
+# laufen, profiliert und getestet werden können.
+#
+# Verwendung:
+#
+#   import host
+#   host.install()
+#   from classes.operationmode import OPERATIONS as OP
+#
+# Die Zeit läuft im Host-Betrieb virtuell: sleep_ms() und blockierende
+# StateMachine.put()-Aufrufe warten nicht wirklich, sondern stellen die Uhr
+# (utime) vor. Mit host.utime.REALTIME = True wird tatsächlich gewartet.
+#
+# ----------------------------------------------------------------------
+
+import sys
+
+from host import machine, micropython, rp2, utime, _thread
+
+MODULES = {
+    "_thread": _thread,
+    "machine": machine,
+    "micropython": micropython,
+    "rp2": rp2,
+    "utime": utime,
+}
+
+
+# Ersatzmodule in sys.modules eintragen, wenn es kein echtes machine-Modul gibt oder
+# es weder Pin noch ADC kennt (MicroPython-Unix-Port); auf dem pico ist install()
+# wirkungslos. Liefert True, wenn die Ersatzmodule aktiv sind.
+def install():
+    if sys.modules.get("machine") is not machine:
+        try:
+            import machine as real
+        except ImportError:
+            real = None
+        if real is not None and real is not machine and hasattr(real, "Pin") and hasattr(real, "ADC"):
+            return False
+    for name, module in MODULES.items():
+        sys.modules[name] = module
+    return True
+
+
+# alle simulierten Zustände zurücksetzen (Uhr, ADC-Skripte, Statemachines)
+def reset():
+    utime.reset()
+    machine.reset()
+    rp2.reset()
@@ -0,0 +1,33 @@
+#
+# "pico Lo" - Host-Emulation
+#
+# Ersatz für das MicroPython-Modul _thread (Core 1)
+#
+# Entspricht dem _thread des Hosts. Solange ein mit start_new_thread()
+# gestarteter Thread läuft, warten sleep*() wirklich: sonst würde ein Thread,
+# der in einer Schleife auf den anderen wartet, die virtuelle Uhr davonlaufen
+# lassen und der andere müsste die ganze Zeit simulieren.
+#
+
+import sys
+
+_host = sys.modules.get("_thread")
+if _host is None or _host.__name__ != "_thread" or hasattr(_host, "_HOST_EMULATION"):
+    import importlib
+    _host = importlib.import_module("_thread")
+
+globals().update({name: value for name, value in vars(_host).items() if not name.startswith("__")})
+
+_HOST_EMULATION = True
+
+from host import utime as _utime
+
+
+def start_new_thread(function, args, kwargs={}):
+    def run():
+        _utime.threads(1)
+        try:
+            function(*args, **kwargs)
+        finally:
+            _utime.threads(-1)
+    return _host.start_new_thread(run, ())
@@ -0,0 +1,200 @@
+#
+# "pico Lo" - Host-Emulation
+#
+# Ersatz für das MicroPython-Modul machine (RP2040)
+#
+# ADC-Messwerte lassen sich je Pin vorgeben:
+#
+#   machine.ADC.script(27, [1200, 1300, 1250])     # Folge, danach letzter Wert
+#   machine.ADC.script(27, lambda t_us: 1200)      # Funktion der (virtuellen) Zeit
+#
+# Timer-Callbacks laufen, wenn die Uhr in sleep*() vorgestellt wird.
+#
+
+from host import utime
+
+_irq_state = 1
+_irq_off_since = 0
+irq_off_count = 0   # Anzahl disable_irq()-Aufrufe
+irq_off_max_us = 0  # längste Sperrzeit in µs
+irq_off_total_us = 0
+
+
+def reset():
+    global _irq_state, _irq_off_since, irq_off_count, irq_off_max_us, irq_off_total_us
+    _irq_state = 1
+    _irq_off_since = 0
+    irq_off_count = 0
+    irq_off_max_us = 0
+    irq_off_total_us = 0
+    ADC.scripts = {}
+    Pin.states = {}
+    utime.hooks.clear()
+
+
+def disable_irq():
+    global _irq_state, _irq_off_since, irq_off_count
+    state = _irq_state
+    if state:
+        _irq_off_since = utime.now_us()
+        irq_off_count += 1
+    _irq_state = 0
+    return state
+
+
+def enable_irq(state=1):
+    global _irq_state, irq_off_max_us, irq_off_total_us
+    if state and not _irq_state:
+        duration = utime.now_us() - _irq_off_since
+        irq_off_total_us += duration
+        irq_off_max_us = max(irq_off_max_us, duration)
+    _irq_state = state
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def idle():
+    pass
+
+
+def reset_cause():
+    return 1
+
+
+def unique_id():
+    return b"HOST0001"
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    states = {}  # Pin-Nummer -> Pegel, gemeinsam für alle Pin-Objekte
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        if isinstance(id, Pin):
+            id = id.id
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self.value(value)
+        elif id not in Pin.states:
+            Pin.states[id] = 0
+
+    def init(self, mode=-1, pull=-1, value=None):
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def value(self, x=None):
+        if x is None:
+            return Pin.states.get(self.id, 0)
+        Pin.states[self.id] = 1 if x else 0
+
+    def __call__(self, x=None):
+        return self.value(x)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(not self.value())
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self.handler = handler
+
+    def __repr__(self):
+        return f"Pin({self.id})"
+
+
+class ADC:
+    CORE_TEMP = 4
+    DEFAULT = 0       # Messwert ohne Vorgabe
+
+    scripts = {}      # Kanal/Pin -> Liste oder Funktion
+
+    def __init__(self, pin):
+        if isinstance(pin, Pin):
+            pin = pin.id
+        self.id = pin
+        self.reads = 0
+
+    # Messwerte für einen Pin vorgeben (nur Host)
+    @classmethod
+    def script(cls, pin, samples):
+        if isinstance(pin, Pin):
+            pin = pin.id
+        if not callable(samples):
+            samples = list(samples)
+        cls.scripts[pin] = samples
+
+    def read_u16(self):
+        self.reads += 1
+        samples = ADC.scripts.get(self.id)
+        if samples is None:
+            return ADC.DEFAULT
+        if callable(samples):
+            return int(samples(utime.now_us())) & 0xffff
+        if len(samples) > 1:
+            return samples.pop(0) & 0xffff
+        if samples:
+            return samples[0] & 0xffff
+        return ADC.DEFAULT
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+    MAX_CATCH_UP = 1000   # höchstens so viele Callbacks je advance()
+
+    def __init__(self, id=-1, mode=PERIODIC, freq=-1, period=-1, callback=None):
+        self.callback = None
+        if callback is not None:
+            self.init(mode=mode, freq=freq, period=period, callback=callback)
+
+    def init(self, mode=PERIODIC, freq=-1, period=-1, callback=None):
+        self.mode = mode
+        self.period = period if period > 0 else (1000 // freq if freq > 0 else 1000)
+        self.callback = callback
+        self.due_us = utime.now_us() + self.period * 1000
+        if self._run not in utime.hooks:
+            utime.hooks.append(self._run)
+
+    # Callback auslösen (nur Host)
+    def fire(self):
+        if self.callback is not None:
+            self.callback(self)
+
+    # fällige Callbacks nach advance() nachholen
+    def _run(self):
+        now = utime.now_us()
+        for i in range(self.MAX_CATCH_UP):
+            if self.callback is None or self.due_us > now:
+                break
+            self.due_us += self.period * 1000
+            if self.mode == Timer.ONE_SHOT:
+                callback = self.callback
+                self.deinit()
+                callback(self)
+            else:
+                self.fire()
+        else:
+            self.due_us = now + self.period * 1000
+
+    def deinit(self):
+        self.callback = None
+        if self._run in utime.hooks:
+            utime.hooks.remove(self._run)
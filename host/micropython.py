@@ -0,0 +1,27 @@
+#
+# "pico Lo" - Host-Emulation
+#
+# Ersatz für das MicroPython-Modul micropython
+#
+
+
+def const(value):
+    return value
+
+
+# Code-Emitter gibt es auf dem Host nicht, die Funktionen bleiben unverändert
+def native(f):
+    return f
+
+
+def viper(f):
+    return f
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+# Callbacks werden auf dem Host sofort ausgeführt
+def schedule(func, arg):
+    func(arg)
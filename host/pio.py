@@ -0,0 +1,189 @@
+#
+# "pico Lo" - Host-Emulation
+#
+# PIO-Assembler und -Simulator für rp2.asm_pio / rp2.StateMachine
+#
+# Der Assembler führt den Rumpf eines @asm_pio-Programms wie MicroPython aus
+# (die Befehlsnamen werden vorübergehend in die globals der Funktion gelegt)
+# und erzeugt eine Liste von Befehlen. Der Simulator arbeitet diese Befehle
+# taktgenau ab: jeder Befehl dauert 1 + Delay Takte, blockierende Befehle
+# (pull, out mit Autopull) warten auf Daten in der TX-FIFO.
+#
+# Unterstützt: jmp, out, pull, push, in_, mov, set, nop, irq, label,
+# wrap_target, wrap; kein side-set, kein wait.
+#
+
+# Quellen/Ziele (Werte wie im MicroPython-Assembler)
+PINS = 0
+X = 1
+Y = 2
+NULL = 3
+PINDIRS = 4
+PC = 5
+STATUS = 5
+ISR = 6
+OSR = 7
+EXEC = 8
+INVERT = 0x100
+REVERSE = 0x200
+
+# Sprungbedingungen
+ALWAYS = 0
+NOT_X = 1
+X_DEC = 2
+NOT_Y = 3
+Y_DEC = 4
+X_NOT_Y = 5
+PIN = 6
+NOT_OSRE = 7
+
+# Flags
+NOBLOCK = 0x01
+BLOCK = 0x20
+IFEMPTY = 0x40
+CLEAR = 0x40
+REL = 0x10
+
+
+class Instruction:
+    def __init__(self, op, args):
+        self.op = op
+        self.args = args
+        self.delay = 0
+
+    def __getitem__(self, delay):
+        if not 0 <= delay <= 31:
+            raise ValueError("Delay 0..31")
+        self.delay = delay
+        return self
+
+    def side(self, value):
+        raise NotImplementedError("side-set wird nicht emuliert")
+
+    def __repr__(self):
+        return "%s%r[%d]" % (self.op, self.args, self.delay)
+
+
+class Program:
+    def __init__(self):
+        self.instructions = []
+        self.labels = {}
+        self.wrap_target = 0
+        self.wrap = None
+
+    def _emit(self, op, *args):
+        instruction = Instruction(op, args)
+        self.instructions.append(instruction)
+        if len(self.instructions) > 32:
+            raise RuntimeError("PIO-Programm zu lang (max. 32 Befehle)")
+        return instruction
+
+    # Namen, die im Programmrumpf verfügbar sind
+    def names(self):
+        program = self
+
+        def label(name):
+            program.labels[name] = len(program.instructions)
+
+        def wrap_target():
+            program.wrap_target = len(program.instructions)
+
+        def wrap():
+            program.wrap = len(program.instructions) - 1
+
+        def jmp(cond, target=None):
+            if target is None:
+                cond, target = ALWAYS, cond
+            return program._emit("jmp", cond, target)
+
+        def out(dest, bits):
+            return program._emit("out", dest, bits)
+
+        def in_(src, bits):
+            return program._emit("in", src, bits)
+
+        def pull(value=0, value2=0):
+            flags = value | value2
+            return program._emit("pull", bool(flags & IFEMPTY), not flags & NOBLOCK)
+
+        def push(value=0, value2=0):
+            flags = value | value2
+            return program._emit("push", bool(flags & IFEMPTY), not flags & NOBLOCK)
+
+        def mov(dest, src):
+            return program._emit("mov", dest, src)
+
+        def set(dest, value):
+            return program._emit("set", dest, value)
+
+        def nop():
+            return program._emit("mov", Y, Y)
+
+        def irq(mod, index=None):
+            if index is None:
+                mod, index = 0, mod
+            return program._emit("irq", mod, index)
+
+        def wait(*args):
+            raise NotImplementedError("wait wird nicht emuliert")
+
+        return {
+            "label": label, "wrap_target": wrap_target, "wrap": wrap, "jmp": jmp, "out": out,
+            "in_": in_, "pull": pull, "push": push, "mov": mov, "set": set, "nop": nop, "irq": irq,
+            "wait": wait,
+            "pins": PINS, "x": X, "y": Y, "null": NULL, "pindirs": PINDIRS, "pc": PC, "status": STATUS,
+            "isr": ISR, "osr": OSR, "exec": EXEC,
+            "invert": lambda v: v | INVERT, "reverse": lambda v: v | REVERSE,
+            "not_x": NOT_X, "x_dec": X_DEC, "not_y": NOT_Y, "y_dec": Y_DEC, "x_not_y": X_NOT_Y,
+            "pin": PIN, "not_osre": NOT_OSRE,
+            "noblock": NOBLOCK, "block": BLOCK, "ifempty": IFEMPTY, "iffull": IFEMPTY,
+            "clear": CLEAR, "rel": lambda v: v | REL,
+        }
+
+    def finish(self):
+        if self.wrap is None:
+            self.wrap = len(self.instructions) - 1
+        for instruction in self.instructions:
+            if instruction.op == "jmp" and not isinstance(instruction.args[1], int):
+                name = instruction.args[1]
+                if name not in self.labels:
+                    raise ValueError("unbekanntes Label " + str(name))
+                instruction.args = (instruction.args[0], self.labels[name])
+
+
+# Programmrumpf ausführen und assemblieren
+def assemble(function):
+    program = Program()
+    names = program.names()
+    gl = function.__globals__
+    saved = {}
+    for name in names:
+        if name in gl:
+            saved[name] = gl[name]
+        gl[name] = names[name]
+    try:
+        function()
+    finally:
+        for name in names:
+            if name in saved:
+                gl[name] = saved[name]
+            else:
+                del gl[name]
+    program.finish()
+    return program
+
+
+# einzelnen Befehl (Text wie bei StateMachine.exec()) assemblieren
+def assemble_text(text):
+    program = Program()
+    names = program.names()
+    instruction = eval(text, {}, names)
+    program.finish()
+    return instruction
+
+
+def _reverse32(value):
+    result = 0
+    for i in range(32):
+        result = (result << 1) | (value >> i) & 1
+    return result
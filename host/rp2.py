@@ -0,0 +1,620 @@
+#
+# "pico Lo" - Host-Emulation
+#
+# Ersatz für das MicroPython-Modul rp2
+#
+# @asm_pio assembliert das Programm (host/pio.py), die StateMachine führt es
+# taktgenau aus (Takt = freq) und bildet die TX-FIFO (4 Worte, 8 bei
+# FIFO_JOIN_TX) nach. Gerechnet wird in virtueller Zeit: die StateMachine
+# läuft bei jedem Zugriff (put, tx_fifo, ...) bis zur aktuellen Zeit weiter.
+# Ist die FIFO voll, "blockiert" put(), d.h. die virtuelle Uhr wird bis zum
+# Freiwerden eines Platzes vorgestellt; die Wartezeit wird in stall_us summiert.
+# Die Pegel der set-/out-Pins landen in machine.Pin.states, mit sm.trace = []
+# (oder rp2.TRACE = True) werden alle Pegelwechsel als (µs, Pegel der set-Pins)
+# aufgezeichnet.
+#
+# DMA: ein Kanal, dessen Schreibadresse die TX-FIFO einer StateMachine ist,
+# füllt diese beim Abarbeiten selbständig nach (DREQ-Taktung). Am Ende eines
+# Transfers wird der IRQ-Handler sofort aufgerufen - zum Zeitpunkt, an dem der
+# Transfer auf der Hardware geendet hätte.
+#
+
+from host import utime, machine, pio
+
+ONE_US = 116     # Dauer eines 1-Bits (2 x 58 µs)
+ZERO_US = 200    # Dauer eines 0-Bits (2 x 100 µs)
+MASK = 0xffffffff
+
+TRACE = False       # True: neue StateMachines zeichnen Pegelwechsel auf (trace)
+
+_bootsel = False
+statemachines = {}  # id -> zuletzt angelegte StateMachine
+_event_us = None    # Zeitpunkt des gerade nachgebildeten Hardware-Ereignisses
+
+PIO_BASE = (0x50200000, 0x50300000)
+PIO_TXF0 = 0x010
+
+
+def reset():
+    global _bootsel, _event_us
+    _bootsel = False
+    _event_us = None
+    statemachines.clear()
+    DMA._claimed = 0
+
+
+# aktuelle Zeit, innerhalb eines nachgebildeten Ereignisses dessen Zeitpunkt
+def _now():
+    return utime.now_us() if _event_us is None else _event_us
+
+
+def bootsel_button():
+    return 1 if _bootsel else 0
+
+
+# BOOTSEL-Taste simulieren (nur Host)
+def press_bootsel(state=True):
+    global _bootsel
+    _bootsel = state
+
+
+class PIO:
+    IN_LOW = 0
+    IN_HIGH = 1
+    OUT_LOW = 2
+    OUT_HIGH = 3
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+    IRQ_SM0 = 0x100
+    IRQ_SM1 = 0x200
+    IRQ_SM2 = 0x400
+    IRQ_SM3 = 0x800
+
+    def __init__(self, id):
+        self.id = id
+
+    def state_machine(self, id, *args, **kw):
+        return StateMachine(self.id * 4 + id, *args, **kw)
+
+    def remove_program(self, program=None):
+        pass
+
+
+# PIO-Programm: assembliert wie unter MicroPython beim Dekorieren
+class PIOProgram:
+    def __init__(self, function, config):
+        self.function = function
+        self.config = config
+        self.__name__ = function.__name__
+        self.program = pio.assemble(function)
+
+    def __len__(self):
+        return len(self.program.instructions)
+
+    def __repr__(self):
+        return f"<PIOProgram {self.__name__}>"
+
+
+def asm_pio(**config):
+    def decorator(function):
+        return PIOProgram(function, config)
+    return decorator
+
+
+# Dauer eines 32-Bit-Wortes der Bit-Programme (dccbit) auf dem Gleis in µs
+def word_us(word):
+    ones = bin(word & MASK).count("1")
+    return ones * ONE_US + (32 - ones) * ZERO_US
+
+
+def _pin_id(pin):
+    if pin is None:
+        return None
+    return pin.id if isinstance(pin, machine.Pin) else pin
+
+
+def _count(init):
+    if init is None:
+        return 0
+    if isinstance(init, (tuple, list)):
+        return len(init)
+    return 1
+
+
+class StateMachine:
+    def __init__(self, id, program=None, freq=-1, **kw):
+        self.id = id
+        self.words = []        # alle geschriebenen Worte
+        self.execs = []        # alle exec()-Anweisungen
+        self.stall_us = 0      # Wartezeit blockierender put()-Aufrufe
+        self.underruns = 0     # FIFO leergelaufen, während Daten erwartet wurden
+        self.irqs = 0          # ausgelöste IRQs (irq-Befehl)
+        self.trace = [] if TRACE else None   # [] -> Pegelwechsel der set-Pins aufzeichnen
+        self.program = None
+        self._active = False
+        self._fifo = []
+        self._rx = []
+        self._handler = None
+        self._dma = None       # DMA-Kanal, der die TX-FIFO füllt
+        statemachines[id] = self
+        if program is not None:
+            self.init(program, freq, **kw)
+
+    def init(self, program, freq=-1, **kw):
+        config = dict(program.config)
+        for key in kw:
+            if kw[key] is not None:
+                config[key] = kw[key]
+        self.program = program
+        self.freq = freq if freq > 0 else machine.freq()
+        self.kw = kw
+        self.fifo_depth = 8 if config.get("fifo_join") == PIO.JOIN_TX else 4
+        self.autopull = config.get("autopull", False)
+        self.pull_thresh = config.get("pull_thresh", 32) or 32
+        self.out_shiftdir = config.get("out_shiftdir", PIO.SHIFT_LEFT)
+        self.in_shiftdir = config.get("in_shiftdir", PIO.SHIFT_LEFT)
+        self.set_base = _pin_id(config.get("set_base"))
+        self.set_count = _count(config.get("set_init"))
+        self.out_base = _pin_id(config.get("out_base"))
+        self.out_count = _count(config.get("out_init"))
+        self.in_base = _pin_id(config.get("in_base")) or 0
+        self.jmp_pin = _pin_id(config.get("jmp_pin"))
+        self._period_ns = 1000000000 // self.freq
+        self._fifo = []
+        self._rx = []
+        self.x = 0
+        self.y = 0
+        self.isr = 0
+        self.isr_count = 0
+        self.osr = 0
+        self.osr_count = 32    # leer
+        self.pc = 0
+        self._ns = utime.now_us() * 1000   # Beginn des nächsten Befehls
+        self._stalled = False
+        self._starving = False
+        self._consumed = 0
+        self._levels = 0
+        init = config.get("set_init")
+        if init is not None and self.set_base is not None:
+            init = init if isinstance(init, (tuple, list)) else (init,)
+            levels = 0
+            for i in range(len(init)):
+                levels |= (init[i] & 1) << i
+            self._write_pins(self.set_base, self.set_count, levels)
+
+    # ------------------------------------------------------------------ Simulator
+
+    def _write_pins(self, base, count, value):
+        if base is None:
+            return
+        for i in range(count):
+            machine.Pin.states[(base + i) % 32] = (value >> i) & 1
+        if base == self.set_base:
+            if value != self._levels and self.trace is not None:
+                self.trace.append((self._ns / 1000, value))
+            self._levels = value
+
+    def _read_pins(self):
+        value = 0
+        states = machine.Pin.states
+        for i in range(32):
+            if states.get((self.in_base + i) % 32, 0):
+                value |= 1 << i
+        return value
+
+    def _starve(self):
+        if not self._starving and self._consumed:
+            self.underruns += 1
+        self._starving = True
+
+    # Wort aus der FIFO ins OSR, der DMA füllt den freien Platz nach
+    def _pull_word(self):
+        self.osr = self._fifo.pop(0)
+        self.osr_count = 0
+        self._consumed += 1
+        self._starving = False
+        self._feed(self._ns / 1000)
+
+    def _source(self, src):
+        kind = src & 0xff
+        if kind == pio.PINS:
+            value = self._read_pins()
+        elif kind == pio.X:
+            value = self.x
+        elif kind == pio.Y:
+            value = self.y
+        elif kind == pio.ISR:
+            value = self.isr
+        elif kind == pio.OSR:
+            value = self.osr
+        else:               # null, status
+            value = 0
+        if src & pio.INVERT:
+            value = ~value & MASK
+        if src & pio.REVERSE:
+            value = pio._reverse32(value)
+        return value
+
+    def _irq(self, mod, index):
+        flag = index & 7
+        if index & pio.REL:
+            flag = (flag & 4) | ((flag + self.id) & 3)
+        if mod & pio.CLEAR:
+            return
+        self.irqs += 1
+        if flag < 4:
+            target = statemachines.get((self.id & ~3) + flag)
+            if target is not None and target._handler is not None:
+                target._handler(target)
+
+    # einen Befehl ausführen; False: blockiert (wartet auf Daten)
+    def _execute(self, ins, timed=True):
+        op = ins.op
+        a = ins.args
+        program = self.program.program
+        next_pc = program.wrap_target if self.pc == program.wrap else self.pc + 1
+        if op == "jmp":
+            cond = a[0]
+            if cond == pio.ALWAYS:
+                take = True
+            elif cond == pio.NOT_X:
+                take = self.x == 0
+            elif cond == pio.X_DEC:
+                take = self.x != 0
+                self.x = (self.x - 1) & MASK
+            elif cond == pio.NOT_Y:
+                take = self.y == 0
+            elif cond == pio.Y_DEC:
+                take = self.y != 0
+                self.y = (self.y - 1) & MASK
+            elif cond == pio.X_NOT_Y:
+                take = self.x != self.y
+            elif cond == pio.PIN:
+                take = machine.Pin.states.get(self.jmp_pin, 0) == 1
+            else:           # not_osre
+                take = self.osr_count < self.pull_thresh
+                if not take:
+                    self._starve()
+            if take:
+                next_pc = a[1]
+        elif op == "out":
+            dest, bits = a
+            bits = bits or 32
+            if self.autopull and self.osr_count >= self.pull_thresh:
+                if not self._fifo:
+                    self._starve()
+                    return False
+                self._pull_word()
+            if self.out_shiftdir == PIO.SHIFT_LEFT:
+                value = self.osr >> (32 - bits)
+                self.osr = (self.osr << bits) & MASK
+            else:
+                value = self.osr & ((1 << bits) - 1)
+                self.osr >>= bits
+            self.osr_count = min(32, self.osr_count + bits)
+            if dest == pio.PINS:
+                self._write_pins(self.out_base, self.out_count, value)
+            elif dest == pio.X:
+                self.x = value
+            elif dest == pio.Y:
+                self.y = value
+            elif dest == pio.PC:
+                next_pc = value
+            elif dest == pio.ISR:
+                self.isr = value
+                self.isr_count = bits
+        elif op == "pull":
+            ifempty, block = a
+            if ifempty and self.osr_count < self.pull_thresh:
+                pass
+            elif self.autopull and self.osr_count == 0:
+                pass        # mit Autopull: kein pull bei vollem OSR
+            elif self._fifo:
+                self._pull_word()
+            elif block:
+                self._starve()
+                return False
+            else:
+                self._starve()
+                self.osr = self.x
+                self.osr_count = 0
+        elif op == "push":
+            self._rx.append(self.isr)
+            self.isr = 0
+            self.isr_count = 0
+        elif op == "in":
+            src, bits = a
+            bits = bits or 32
+            value = self._source(src) & ((1 << bits) - 1)
+            if self.in_shiftdir == PIO.SHIFT_LEFT:
+                self.isr = ((self.isr << bits) | value) & MASK
+            else:
+                self.isr = (self.isr >> bits) | (value << (32 - bits)) & MASK
+            self.isr_count = min(32, self.isr_count + bits)
+        elif op == "mov":
+            dest, src = a
+            value = self._source(src)
+            if dest == pio.PINS:
+                self._write_pins(self.out_base, self.out_count, value)
+            elif dest == pio.X:
+                self.x = value
+            elif dest == pio.Y:
+                self.y = value
+            elif dest == pio.PC:
+                next_pc = value
+            elif dest == pio.ISR:
+                self.isr = value
+                self.isr_count = 0
+            elif dest == pio.OSR:
+                self.osr = value
+                self.osr_count = 0
+        elif op == "set":
+            dest, value = a
+            if dest == pio.PINS:
+                self._write_pins(self.set_base, self.set_count, value)
+            elif dest == pio.X:
+                self.x = value & 0x1f
+            elif dest == pio.Y:
+                self.y = value & 0x1f
+        elif op == "irq":
+            self._irq(a[0], a[1])
+        if timed:
+            self.pc = next_pc
+            self._ns += (1 + ins.delay) * self._period_ns
+        return True
+
+    def _step(self):
+        if self.autopull and self.osr_count >= self.pull_thresh and self._fifo:
+            self._pull_word()       # Autopull im Hintergrund
+        if not self._execute(self.program.program.instructions[self.pc]):
+            self._stalled = True
+
+    # bis zur Zeit 'now' (µs) arbeiten; die Simulation selbst kostet keine virtuelle Zeit
+    def _drain(self, now):
+        if not self._active or self.program is None:
+            return
+        limit = now * 1000
+        utime.freeze()
+        try:
+            while not self._stalled and self._ns <= limit:
+                self._step()
+        finally:
+            utime.thaw()
+
+    # weiterlaufen, bis ein Wort aus der FIFO geholt wurde; liefert die Zeit in µs
+    def _run_until_pull(self):
+        consumed = self._consumed
+        utime.freeze()
+        try:
+            for i in range(1000000):
+                if self._consumed != consumed:
+                    return (self._ns + 999) // 1000
+                if self._stalled:
+                    break
+                self._step()
+        finally:
+            utime.thaw()
+        raise RuntimeError("StateMachine holt keine Daten - put() würde ewig blockieren")
+
+    # neue Daten zum Zeitpunkt t (µs): blockierte StateMachine läuft weiter
+    def _wake(self, t):
+        if self._stalled:
+            self._stalled = False
+            self._ns = max(self._ns, int(t * 1000))
+
+    # DMA schreibt, solange die FIFO Platz hat (t = Zeitpunkt des freien Platzes)
+    def _feed(self, t):
+        global _event_us
+        dma = self._dma
+        while dma is not None and dma._ready() and len(self._fifo) < self.fifo_depth:
+            saved = _event_us
+            _event_us = max(t, dma._armed_us)
+            try:
+                word = dma._transfer()
+            finally:
+                _event_us = saved
+            self._fifo.append(word)
+            self.words.append(word)
+            self._wake(max(t, dma._armed_us))
+            dma = self._dma
+
+    def _push(self, word):
+        now = utime.now_us()
+        self._drain(now)
+        while len(self._fifo) >= self.fifo_depth:
+            if not self._active:
+                raise RuntimeError("StateMachine inaktiv, FIFO voll - put() würde ewig blockieren")
+            wait = max(0, self._run_until_pull() - now)
+            self.stall_us += wait
+            utime.advance(wait)
+            now = utime.now_us()
+            self._drain(now)
+        self._fifo.append(word)
+        self.words.append(word)
+        self._wake(now)
+
+    # ------------------------------------------------------------------ API
+
+    def put(self, value, shift=0):
+        if isinstance(value, int):
+            self._push((value << shift) & MASK)
+        else:
+            for word in value:
+                self._push((word << shift) & MASK)
+
+    def active(self, value=None):
+        if value is None:
+            return 1 if self._active else 0
+        now = utime.now_us()
+        if value and not self._active:
+            self._ns = max(self._ns, now * 1000)
+        elif not value:
+            self._drain(now)
+        self._active = bool(value)
+
+    def exec(self, instruction):
+        self.execs.append(instruction)
+        self._execute(pio.assemble_text(instruction), timed=False)
+
+    # wie SM_RESTART: Schieberegister-Zähler, Delay und Blockade zurücksetzen,
+    # Sprung an den Programmanfang; die FIFO bleibt erhalten
+    def restart(self):
+        self._drain(utime.now_us())
+        self.isr = 0
+        self.isr_count = 0
+        self.osr_count = 32
+        self.pc = 0
+        self._stalled = False
+        self._ns = max(self._ns, utime.now_us() * 1000)
+
+    def tx_fifo(self):
+        self._drain(utime.now_us())
+        return len(self._fifo)
+
+    def rx_fifo(self):
+        self._drain(utime.now_us())
+        return len(self._rx)
+
+    def get(self, buf=None, shift=0):
+        self._drain(utime.now_us())
+        return (self._rx.pop(0) >> shift) if self._rx else 0
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        self._handler = handler
+
+    # DMA-Kanal an die TX-FIFO hängen (nur Host, von DMA.config() benutzt)
+    def _attach(self, dma):
+        self._dma = dma
+
+    def _detach(self, dma):
+        if self._dma is dma:
+            self._dma = None
+
+    # Aufzeichnung löschen (nur Host)
+    def clear(self):
+        self.words = []
+        self.execs = []
+        self.stall_us = 0
+        self.underruns = 0
+        self.irqs = 0
+        if self.trace is not None:
+            self.trace = []
+
+
+# DMA-Kanal (MicroPython >= 1.21)
+# Nachgebildet wird nur der Weg Speicher -> TX-FIFO einer StateMachine:
+# write = Adresse der TXF-Register (PIO_BASE + PIO_TXF0 + 4 * sm) oder die StateMachine
+class DMA:
+    _claimed = 0
+    CHANNELS = 12
+
+    def __init__(self):
+        if DMA._claimed >= DMA.CHANNELS:
+            raise OSError("keine freien DMA-Kanäle")
+        self.channel = DMA._claimed
+        DMA._claimed += 1
+        self.read = None
+        self.write = 0
+        self.count = 0
+        self.ctrl = self.pack_ctrl()
+        self.transfers = 0     # alle übertragenen Worte (nur Host)
+        self._target = None
+        self._pos = 0
+        self._active = False
+        self._armed_us = 0
+        self._handler = None
+        self.hard = False      # irq(hard=...), nur Host
+
+    # Bits des CTRL-Registers (RP2040 Datenblatt 2.5.7)
+    def pack_ctrl(self, default=None, **kw):
+        value = {"enable": True, "high_pri": False, "size": 2, "inc_read": True, "inc_write": True,
+                 "ring_size": 0, "ring_sel": False, "chain_to": self.channel if hasattr(self, "channel") else 0,
+                 "treq_sel": 0x3f, "irq_quiet": True, "bswap": False, "sniff_en": False}
+        if default is not None:
+            value.update(DMA.unpack_ctrl(default))
+        for key in kw:
+            if key not in value:
+                raise TypeError("unbekanntes Feld " + key)
+            value[key] = kw[key]
+        return (int(value["enable"]) | int(value["high_pri"]) << 1 | value["size"] << 2 |
+                int(value["inc_read"]) << 4 | int(value["inc_write"]) << 5 | value["ring_size"] << 6 |
+                int(value["ring_sel"]) << 10 | value["chain_to"] << 11 | value["treq_sel"] << 15 |
+                int(value["irq_quiet"]) << 21 | int(value["bswap"]) << 22 | int(value["sniff_en"]) << 23)
+
+    @staticmethod
+    def unpack_ctrl(value):
+        return {"enable": value & 1, "high_pri": (value >> 1) & 1, "size": (value >> 2) & 3,
+                "inc_read": (value >> 4) & 1, "inc_write": (value >> 5) & 1, "ring_size": (value >> 6) & 15,
+                "ring_sel": (value >> 10) & 1, "chain_to": (value >> 11) & 15, "treq_sel": (value >> 15) & 0x3f,
+                "irq_quiet": (value >> 21) & 1, "bswap": (value >> 22) & 1, "sniff_en": (value >> 23) & 1,
+                "busy": (value >> 24) & 1}
+
+    def config(self, read=None, write=None, count=None, ctrl=None, trigger=False):
+        if read is not None:
+            if isinstance(read, int):
+                raise ValueError("Host-DMA liest nur aus Puffern")
+            self.read = read
+            self._pos = 0
+        if write is not None:
+            self.write = write
+        if count is not None:
+            self.count = count
+        if ctrl is not None:
+            self.ctrl = ctrl
+        if trigger:
+            self.active(1)
+
+    def _statemachine(self):
+        if isinstance(self.write, StateMachine):
+            return self.write
+        for pio in range(len(PIO_BASE)):
+            offset = self.write - PIO_BASE[pio] - PIO_TXF0
+            if 0 <= offset < 16 and offset % 4 == 0:
+                return statemachines.get(pio * 4 + offset // 4)
+        raise ValueError("Host-DMA schreibt nur in die TX-FIFO einer StateMachine")
+
+    def active(self, value=None):
+        if value is None:
+            return 1 if self._active else 0
+        outside = _event_us is None   # nicht aus einem IRQ-Handler während _feed()
+        if outside and self._target is not None:
+            self._target._drain(utime.now_us())
+        if value:
+            self._active = True
+            self._armed_us = _now()
+            self._target = self._statemachine()
+            self._target._attach(self)
+            if outside:
+                self._target._feed(utime.now_us())
+        else:
+            self._active = False
+
+    def irq(self, handler=None, hard=False):
+        self._handler = handler
+        self.hard = hard
+
+    def close(self):
+        self.active(0)
+        if self._target is not None:
+            self._target._detach(self)
+            self._target = None
+        self._handler = None
+
+    def _ready(self):
+        return self._active and self.count > 0
+
+    # ein Wort übertragen, am Ende des Transfers den IRQ auslösen
+    def _transfer(self):
+        word = self.read[self._pos] & 0xffffffff
+        if self.ctrl & 0x10:   # inc_read
+            self._pos += 1
+        self.count -= 1
+        self.transfers += 1
+        if self.count == 0:
+            self._active = False
+            if self._handler is not None and not (self.ctrl >> 21) & 1:
+                self._handler(self)
+        return word
@@ -0,0 +1,121 @@
+#
+# "pico Lo" - Host-Emulation
+#
+# Ersatz für das MicroPython-Modul utime
+#
+# Die Uhr ist die monotone Uhr des Hosts plus einer Verschiebung (_skew_us),
+# die von sleep*() und von blockierenden Hardware-Zugriffen (StateMachine.put)
+# vorgestellt wird. So laufen Tests schnell, die DCC-Zeiten bleiben aber
+# nachvollziehbar.
+#
+
+import time as _time
+
+REALTIME = False   # True: sleep*() wartet wirklich
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_skew_us = 0
+_frozen = 0         # Verschachtelungstiefe von freeze()
+_frozen_real = 0    # Host-Uhr bei freeze()
+_threads = 0        # laufende Threads (host._thread), dann wartet sleep*() wirklich
+hooks = []          # nach jedem advance() aufgerufen, z.B. für machine.Timer
+
+
+if hasattr(_time, "perf_counter_ns"):
+    def _real_us():
+        return _time.perf_counter_ns() // 1000
+else:
+    # MicroPython Unix-Port: ticks_us() läuft erst nach ~18 Minuten über
+    def _real_us():
+        return _time.ticks_us()
+
+
+def _now_us():
+    if _frozen:
+        return _frozen_real + _skew_us
+    return _real_us() + _skew_us
+
+
+# Uhr anhalten, z.B. während der Simulation einer StateMachine: deren
+# Rechenzeit auf dem Host soll nicht als Zeit auf dem pico zählen (nur Host)
+def freeze():
+    global _frozen, _frozen_real
+    if _frozen == 0:
+        _frozen_real = _real_us()
+    _frozen += 1
+
+
+def thaw():
+    global _frozen, _skew_us
+    _frozen -= 1
+    if _frozen == 0:
+        _skew_us -= _real_us() - _frozen_real
+
+
+# Anzahl laufender Threads ändern (nur Host)
+def threads(delta):
+    global _threads
+    _threads += delta
+
+
+# virtuelle Zeit vorstellen (nur Host)
+def advance(us):
+    global _skew_us
+    if us > 0:
+        if REALTIME or _threads:
+            _time.sleep(us / 1000000)
+        else:
+            _skew_us += int(us)
+        for hook in list(hooks):
+            hook()
+
+
+# fortlaufende Zeit in µs ohne Überlauf (nur Host)
+def now_us():
+    return _now_us()
+
+
+def reset():
+    global _skew_us, _frozen
+    _skew_us = 0
+    _frozen = 0
+
+
+def ticks_us():
+    return _now_us() & _TICKS_MAX
+
+
+def ticks_ms():
+    return (_now_us() // 1000) & _TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & _TICKS_MAX
+    if diff >= _TICKS_PERIOD // 2:
+        diff -= _TICKS_PERIOD
+    return diff
+
+
+def sleep_us(us):
+    advance(us)
+
+
+def sleep_ms(ms):
+    advance(ms * 1000)
+
+
+def sleep(seconds):
+    advance(seconds * 1000000)
+
+
+def time():
+    return _time.time() + _skew_us // 1000000
@@ -248,9 +248,10 @@ def text_of(input_buffer):
     return s
 
 def show_fn():
-    for f in range(0, 13):
+    for f in range(0, op.FUNCTION_MAX + 1):
         print(f"{'F' if op.get_function(f) else 'f'}{f:<4}", end="")
-    print()
+        if f % 13 == 12 or f == op.FUNCTION_MAX:
+            print()
     
 def show_accessories():
     if (len(op.accessories) == 0):
@@ -273,11 +274,30 @@ def show_locos():
         loco = op.locos[i]
         print(f"Addr: {loco.address:>5} | ", end="")
         print(f"{loco.speedsteps:3} Fahrstufen | ", end="")
-        print(f"FS {loco.current_speed["FS"]:>3} {'vorw.' if loco.current_speed["Dir"]==1 else 'rückw.':<6} | ", end="")
+        print(f"FS {loco.fs:>3} {'vorw.' if loco.direction==1 else 'rückw.':<6} | ", end="")
         print(loco.name)
         show_fn()
         print()
         
+# Strom der letzten {sec} Sekunden: min, max, Mittelwert, Perzentile
+def show_current(sec=0):
+    sec = sec if sec > 0 else 1
+    stats = op.current_telemetry(sec * 1000)
+    if stats == None:
+        print("Keine Messwerte")
+        return
+    print(f"Strom {sec} s ({stats['count']} Werte): min {stats['min']} mA, max {stats['max']} mA, "
+          f"Mittel {stats['mean']} mA, p50 {stats['p50']} mA, p90 {stats['p90']} mA, p99 {stats['p99']} mA")
+
+# Sekundenwerte der letzten {sec} Sekunden
+def show_current_history(sec=0):
+    history = op.current_history(sec if sec > 0 else 10)
+    if len(history) == 0:
+        print("Keine Messwerte")
+        return
+    for t, low, high, mean in history:
+        print(f"{t:>8} s | min {low:>5} mA | max {high:>5} mA | Mittel {mean:>5} mA")
+
 def get_loco():
     global loco, use_long_address, speedsteps
     clear_input_buffer()
@@ -300,6 +320,12 @@ def process_input_buffer():
             pom_loco()
         elif cmd == 'A' or cmd == 'a':
             pom_acc()
+        elif cmd == 'i':
+            show_current(value_of(input_buffer))
+            return True
+        elif cmd == 'I':
+            show_current_history(value_of(input_buffer))
+            return True
         elif not (cmd == 'l' or cmd == 'L' or cmd == 'w' or cmd == 'W' or cmd == 't' or cmd == 'T') and loco == None:
             print("no loco")
             return True
@@ -361,10 +387,8 @@ def process_input_buffer():
                         if loco == value:
                             print(f"Aktive Lok kann nicht aus Liste entfernt werden")
                         else:
-                            for l in op.locos:
-                                if l.address == value:
-                                    op.locos.remove(l)
-                                    print(f"Keine Pakete mehr an Lok {value} senden")
+                            if op.remove_loco(value):
+                                print(f"Keine Pakete mehr an Lok {value} senden")
 
                 elif cmd == 'f' or cmd == 'F':
                     if len(input_buffer) == 1:
@@ -395,10 +419,10 @@ def process_input_buffer():
                     if len(input_buffer) == 1:
                         show_accessories()
                     else:
-                        i = op.search_accessory(value)
-                        if i != None:
+                        acc = op.find_accessory(value)
+                        if acc != None:
                             print(f"Weiche {value} umlegen")
-                            r = op.accessories[i].R
+                            r = acc.R
                             r = 1 if r == 0 else 0
                             op.ctrl_accessory_basic(value, 1, r)
 
@@ -476,6 +500,9 @@ f o. F | Welche Funktionen sind eingeschaltet?
 w{nnn} | Weiche geradeaus {nnn} = Weichenadresse
 W{nnn} | Weiche abzweigend {nnn} = Weichenadresse
        |
+i{nnn} | Strom der letzten {nnn} Sekunden (min, max, Mittel, Perzentile)
+I{nnn} | Strom je Sekunde der letzten {nnn} Sekunden
+       |
 q o. Q | Beenden
 -------+---------------------------------------------------------------------
        |
@@ -574,6 +601,7 @@ def response(col=0, line=0, s=""):
 spoll = select.poll()
 spoll.register(sys.stdin, select.POLLIN)
 
+# OP.THREADED = True    # Refresh und Befehle auf Core 1, Eingabe und Display bremsen das Gleissignal nicht
 op = OP()
 op.begin()
 current_A = op.get_current()
@@ -0,0 +1,53 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# Tests mit der Host-Emulation (CPython):
+#
+#   python3 -m pytest -q
+#
+# Jeder Test beginnt mit zurückgesetzter Emulation (Uhr, ADC, Statemachines),
+# Einstellungen von ELECTRICAL/OPERATIONS und der Motortreiber werden nach dem
+# Test wiederhergestellt.
+#
+# ----------------------------------------------------------------------
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import host
+host.install()
+
+import pytest
+
+import classes.operationmode as om
+from classes.operationmode import ELECTRICAL, OPERATIONS as OP
+
+
+def settings():
+    return [(cls, {name: value for name, value in vars(cls).items() if name.isupper()})
+            for cls in (ELECTRICAL, OP)]
+
+
+@pytest.fixture(autouse=True)
+def emulation():
+    saved = settings()
+    motordriver = om.motordriver
+    host.reset()
+    yield
+    OP.stop_thread()
+    OP.stop_sampler()
+    OP.stop_dma()
+    for cls, values in saved:
+        for name in [name for name in vars(cls) if name.isupper() and name not in values]:
+            delattr(cls, name)
+        for name, value in values.items():
+            setattr(cls, name, value)
+    om.motordriver = motordriver
+    host.reset()
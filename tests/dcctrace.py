@@ -0,0 +1,85 @@
+#
+# "pico Lo" - Digitalsteuerung mit RPI pico
+#
+# (c) 2024-25 Thomas Borrmann
+# Lizenz: GPLv3 (sh. https://www.gnu.org/licenses/gpl-3.0.html.en)
+#
+# DCC-Dekoder für die Tests: Bitstrom aus Worten (Bit-Programme) oder aus der
+# Pegelaufzeichnung einer StateMachine (rp2.TRACE), daraus die Pakete.
+#
+# ----------------------------------------------------------------------
+
+ONE_US = 58     # Halbbit einer '1'
+ZERO_US = 100   # Halbbit einer '0'
+
+
+# Bits der Worte (MSB zuerst) als Zeichenkette
+def word_bits(words):
+    return "".join("{:032b}".format(word) for word in words)
+
+
+# Halbbits einer Pegelaufzeichnung: [(high, Dauer µs), ...], high = Pegel & hi_mask
+def halves(trace, hi_mask=1):
+    return [((trace[i][1] & hi_mask) != 0, trace[i + 1][0] - trace[i][0]) for i in range(len(trace) - 1)]
+
+
+# längstes Halbbit einer Pegelaufzeichnung in µs (Gleichspannung auf dem Gleis?)
+def longest_half(trace, hi_mask=1):
+    return max(duration for high, duration in halves(trace, hi_mask))
+
+
+# Bits einer Pegelaufzeichnung, None für jedes Halbbit mit falscher Dauer
+def trace_bits(trace, hi_mask=1):
+    h = halves(trace, hi_mask)
+    bits = []
+    i = 0
+    while i + 1 < len(h) and not (h[i][0] and h[i][1] in (ONE_US, ZERO_US) and h[i + 1][1] == h[i][1]):
+        i += 1
+    while i + 1 < len(h):
+        (high, first), (low, second) = h[i], h[i + 1]
+        if high and not low and first == second == ONE_US:
+            bits.append(1)
+        elif high and not low and first == second == ZERO_US:
+            bits.append(0)
+        else:
+            bits.append(None)
+            i += 1
+            continue
+        i += 2
+    return bits
+
+
+# Pakete eines Bitstroms (Zeichenkette oder Liste aus 0, 1, None): [(Präambel-Einsen, (Bytes inkl. XOR)), ...]
+# das letzte, unvollständige Paket fehlt
+def packets(bits):
+    if isinstance(bits, str):
+        bits = [int(bit) for bit in bits]
+    result = []
+    i = 0
+    n = len(bits)
+    while i < n:
+        ones = 0
+        while i < n and bits[i] != 0:
+            ones = 0 if bits[i] is None else ones + 1
+            i += 1
+        i += 1      # Startbit
+        packet = []
+        while i + 9 <= n and None not in bits[i:i + 9]:
+            packet.append(int("".join(str(bit) for bit in bits[i:i + 8]), 2))
+            i += 9
+            if bits[i - 1] == 1:
+                result.append((ones, tuple(packet)))
+                break
+        else:
+            if i + 9 > n:
+                break
+            i += 1
+    return result
+
+
+# XOR über alle Bytes eines Pakets = 0
+def valid(packet):
+    err = 0
+    for byte in packet:
+        err ^= byte
+    return len(packet) >= 3 and err == 0
@@ -0,0 +1,141 @@
+#
+# Gleissignal der PIO-Programme (Pegelaufzeichnung der emulierten StateMachine)
+#
+import pytest
+import rp2
+import utime
+
+import classes.operationmode as om
+from classes.operationmode import OPERATIONS as OP
+from classes.packetencoder import PACKETENCODER as encoder, BYTEPACKER as bytepacker
+
+from dcctrace import longest_half, trace_bits, packets, valid
+
+HI_MASK = {"LMD18200T": 1, "DRV8871": 2}     # Pegel der ersten Hälfte jedes Bits
+
+
+@pytest.fixture
+def trace():
+    rp2.TRACE = True
+    yield
+    rp2.TRACE = False
+
+
+def run(ms):
+    for i in range(ms // 5):
+        OP.loop()
+        utime.sleep_ms(5)
+
+
+@pytest.mark.parametrize("packing", ["word", "continuous", "byte"])
+@pytest.mark.parametrize("model", ["LMD18200T", "DRV8871"])
+def test_track_signal(trace, model, packing):
+    om.motordriver = model
+    OP.PACKING = packing
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_loco(3, False, 128)
+    OP.drive(1, 10)
+    OP.ctrl_loco(1000, True, 28)
+    OP.set_function(0)
+    run(600)
+    OP.ctrl_accessory_basic(12, 1, 1)
+    run(200)
+    sm = rp2.statemachines[0]
+    sm.tx_fifo()
+    found = packets(trace_bits(sm.trace, HI_MASK[model]))
+    assert len(found) > 20
+    for ones, packet in found[1:]:
+        assert ones >= OP.PREAMBLE
+        assert valid(packet)
+    found = set(packet for ones, packet in found)
+    assert (3, 0b00111111, 0b10001011, 3 ^ 0b00111111 ^ 0b10001011) in found     # 128 Fahrstufen, vorwärts 10
+    assert (0xc3, 0xe8, 0b10010000, 0xc3 ^ 0xe8 ^ 0b10010000) in found           # F0 an
+    assert any(len(packet) == 3 and packet[0] & 0xc0 == 0x80 for packet in found)  # Zubehör
+    assert longest_half(sm.trace[1:], HI_MASK[model]) <= 100     # ohne den Pegel vor dem Start
+    OP.power_off()
+
+
+# FIFO mitten im Paket leer (CPU zu spät): das Byte-Programm darf nicht mit Pegel high in out() stehen bleiben
+@pytest.mark.parametrize("model", ["LMD18200T", "DRV8871"])
+def test_byte_program_underrun_mid_packet(trace, model):
+    om.motordriver = model
+    OP.PACKING = "byte"
+    OP.__init__()
+    generator = OP.statemachine
+    generator.begin()
+    packer = bytepacker()
+    words = encoder.wordbuffer(packer.words([3, 2]))
+    packer.begin(words)
+    packer.append([3, 0b00111111, 0b10001011])     # Längenbyte + 3 Bytes im 1. Wort, XOR im 2.
+    packer.append([0xff, 0x00])
+    packer.finish()
+    generator.put(words[0])
+    utime.sleep_ms(30)
+    generator.tx_fifo()
+    for word in words[1:]:
+        generator.put(word)
+    for word in OP.idle_words * 4:
+        generator.put(word)
+    utime.sleep_ms(60)
+    generator.tx_fifo()
+    sm = rp2.statemachines[0]
+    assert longest_half(sm.trace[1:], HI_MASK[model]) <= 100
+    found = [packet for ones, packet in packets(trace_bits(sm.trace, HI_MASK[model]))]
+    assert (3, 0b00111111, 0b10001011) in found             # Einsen statt Trennbit + XOR: Paket ungültig
+    assert [packet for packet in found if valid(packet)] == [(0xff, 0x00, 0xff)] * 5
+    generator.end()
+
+
+# Nothalt: Broadcast-Nothalt spätestens first_packet_max_us nach dem Aufruf auf dem Gleis
+@pytest.mark.parametrize("refresh", ["put", "dma"])
+@pytest.mark.parametrize("packing", ["word", "byte"])
+def test_emergency_stop_bound(trace, refresh, packing):
+    OP.REFRESH = refresh
+    OP.PACKING = packing
+    OP.__init__()
+    OP.begin()
+    for address in (3, 4, 5):
+        OP.ctrl_loco(address, False, 128)
+        OP.drive(1, 20)
+    run(400)
+    sm = rp2.statemachines[0]
+    sm.tx_fifo()
+    begin = utime.now_us()
+    OP.emergency_stop()
+    report = OP.estop_report
+    run(100)
+    sm.tx_fifo()
+    # Präambel + 3 Bytes, im ungünstigsten Fall alles '0'-Bits
+    end = begin + report["first_packet_max_us"] + (OP.PREAMBLE + 28) * 200
+    window = [entry for entry in sm.trace if begin <= entry[0] <= end]
+    found = [packet for ones, packet in packets(trace_bits(window))]
+    assert (0, 0b01000001, 0b01000001) in found
+    OP.power_off()
+
+
+# Zubehör-Befehl unmittelbar vor dem Nothalt: flush() verwirft die FIFO, der Befehl muss trotzdem aufs Gleis
+@pytest.mark.parametrize("refresh", ["put", "dma"])
+@pytest.mark.parametrize("scheduler", ["cycle", "edf"])
+def test_emergency_stop_keeps_accessory(trace, refresh, scheduler):
+    OP.REFRESH = refresh
+    OP.SCHEDULER = scheduler
+    OP.__init__()
+    OP.begin()
+    for address in (3, 4, 5):
+        OP.ctrl_loco(address, False, 128)
+        OP.drive(1, 20)
+    run(400)
+    OP.ctrl_accessory_basic(12, 1, 1)
+    while OP.accessory_buffer:          # übernommen, aber noch nicht (ganz) gesendet
+        OP.loop()
+        utime.sleep_us(100)
+    OP.emergency_stop()
+    run(200)
+    sm = rp2.statemachines[0]
+    sm.tx_fifo()
+    found = [packet for ones, packet in packets(trace_bits(sm.trace))]
+    accessory = OP.accessory_packet(OP.accessory_index[12])
+    assert tuple(accessory) + (accessory[0] ^ accessory[1],) in found
+    assert (0, 0b01000001, 0b01000001) in found
+    OP.power_off()
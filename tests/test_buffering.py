@@ -0,0 +1,135 @@
+#
+# inkrementeller Refresh-Zyklus (buffering()) gegen den kompletten Neuaufbau
+#
+import random
+
+import pytest
+import utime
+
+from classes.operationmode import OPERATIONS as OP
+from classes.packetencoder import PACKETENCODER as encoder, BITPACKER as bitpacker, BYTEPACKER as bytepacker
+
+
+# kompletter Rebuild: alle Slots aller Loks ungültig (wie benchmarks/bench_dcc.py)
+def rebuild():
+    for loco in OP.locos:
+        OP.invalidate(loco)
+    OP.relayout()
+    return list(OP.buffering())
+
+
+# Zyklus direkt aus generate_packets() (PACKING = "word")
+def from_packets():
+    words = []
+    for packet in OP.generate_packets():
+        if 2 <= len(packet) <= 5:
+            buffer = encoder.wordbuffer(4)
+            words += buffer[:encoder.encode(packet, buffer, 0, OP.PREAMBLE)]
+    return words or list(OP.idle_words)
+
+
+def step(r, addresses):
+    choice = r.random()
+    if choice < 0.1 or not addresses:
+        address = r.randrange(1, 10000)
+        if address not in addresses:
+            addresses.append(address)
+        OP.ctrl_loco(address, address > 127, r.choice((14, 28, 128)))
+    elif choice < 0.25:
+        OP.ctrl_loco(r.choice(addresses), False, r.choice((14, 28, 128)))
+    elif OP.active_loco is None:
+        return
+    elif choice < 0.45:
+        OP.drive(r.randrange(2), r.randrange(-1, 127))
+    elif choice < 0.65:
+        OP.set_function(r.randrange(OP.FUNCTION_MAX + 1), r.random() < 0.5)
+    elif choice < 0.7:
+        OP.emergency_stop()
+    elif choice < 0.75:
+        OP.update_speedsteps(r.choice((14, 28, 128)))
+    elif choice < 0.8:
+        OP.update_combined(r.random() < 0.5)
+    elif choice < 0.85:
+        address = r.choice(addresses)
+        OP.remove_loco(address)
+        addresses.remove(address)
+
+
+@pytest.mark.parametrize("packing", ["word", "continuous", "byte"])
+def test_incremental_matches_rebuild(packing):
+    OP.PACKING = packing
+    OP.__init__()
+    OP.begin()
+    r = random.Random(packing)
+    addresses = []
+    for n in range(1500):
+        step(r, addresses)
+        incremental = list(OP.buffering())
+        assert incremental == rebuild(), n
+        if packing == "word":
+            assert incremental == from_packets(), n
+    OP.power_off()
+
+
+@pytest.mark.parametrize("packing", ["continuous", "byte"])
+def test_packed_cycle_contains_all_packets(packing):
+    OP.PACKING = packing
+    OP.__init__()
+    OP.begin()
+    for address in (3, 4, 1000, 2000):
+        OP.ctrl_loco(address, address > 127, 128)
+        OP.drive(1, address % 100)
+        OP.set_function(0)
+    words = list(OP.buffering())
+    cycle = [p for p in OP.generate_packets() if 2 <= len(p) <= 5]
+    packer = bytepacker(OP.PREAMBLE) if packing == "byte" else bitpacker(OP.PREAMBLE)
+    buffer = encoder.wordbuffer(packer.words([len(p) for p in cycle]))
+    packer.begin(buffer)
+    for packet in cycle:
+        packer.append(packet)
+    assert words == list(buffer[:packer.finish()])
+    OP.power_off()
+
+
+def test_expansion_slots_allocated_lazily():
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_loco(3)
+    OP.set_function(12)
+    loco = OP.find_loco(3)
+    assert len(loco.slots) == len(loco.deadlines) == len(loco.skips) == loco.BASE_SLOTS
+    OP.set_function(13)
+    assert len(loco.slots) == len(loco.packets) == len(loco.ages) == loco.SLOTS
+    assert [0b11011110, 0b00000001] in [p[1:] for p in OP.generate_packets()]     # F13-F20
+    assert list(OP.buffering()) == rebuild()
+    OP.power_off()
+
+
+# buffering() zwischen zwei feed(): die Worte, die feed() gerade sendet, bleiben unverändert
+@pytest.mark.parametrize("scheduler", ["cycle", "edf"])
+@pytest.mark.parametrize("packing", ["word", "continuous"])
+def test_buffering_keeps_words_being_fed(scheduler, packing):
+    OP.SCHEDULER = scheduler
+    OP.PACKING = packing
+    OP.__init__()
+    OP.begin()
+    for address in range(3, 13):
+        OP.ctrl_loco(address, False, 128)
+        OP.drive(1, address)
+    for i in range(5000):
+        OP.feed()
+        if OP.feed_source is not None and 0 < OP.feed_pos < len(OP.feed_words):
+            break
+        utime.sleep_us(200)
+    else:
+        pytest.fail("feed() nie mitten in einem Puffer")
+    words = OP.feed_words
+    before = list(words)
+    for address in range(3, 13):
+        loco = OP.find_loco(address)
+        loco.set_speed(0, 100)
+        OP.invalidate(loco, OP.SLOT_SPEED)
+    cycle = list(OP.buffering())
+    assert list(words) == before
+    assert cycle == rebuild()
+    OP.power_off()
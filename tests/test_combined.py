@@ -0,0 +1,58 @@
+#
+# Kombinierter Befehl (RP 9.2.1 "Speed, Direction and Functions", 0x3C) gegen die Norm
+#
+from classes.operationmode import OPERATIONS as OP
+from classes.speedcodec import SPEEDCODEC as speedcodec
+
+
+def start(address, speedsteps=128):
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_loco(address, address > 127, speedsteps)
+    OP.update_combined(True)
+    for function in (0, 3, 6, 9, 15):
+        OP.set_function(function, True)
+    OP.drive(1, 50)
+    OP.encode_dirty()
+    return OP.find_loco(address)
+
+
+# 00111100 DSSSSSSS F7..F0 [F15..F8]
+def test_combined_short_address():
+    loco = start(3)
+    speed = OP.packet_of(loco, OP.SLOT_SPEED)
+    assert speed == [3, 0b00111100, 0x80 | 51, 0b01001001, 0b10000010]
+    assert speedcodec.decode(128, speed[1:]) == (1, 50, 1)
+    assert [OP.slot_packet(loco, slot) for slot in (1, 2, 3)] == [[], [], []]   # F0-F12 im Fahrbefehl
+    OP.power_off()
+
+
+# lange Adresse: nur F0-F7 (max. 5 Bytes ohne XOR), F5-F8 und F9-F12 bleiben eigene Pakete
+def test_combined_long_address():
+    loco = start(1000)
+    speed = OP.packet_of(loco, OP.SLOT_SPEED)
+    assert speed == [0xc0 | 1000 >> 8, 1000 & 0xff, 0b00111100, 0x80 | 51, 0b01001001]
+    assert OP.slot_packet(loco, 1) == []
+    assert OP.slot_packet(loco, 2) == [0xc0 | 1000 >> 8, 1000 & 0xff, 0b10110010]      # 1011 F8 F7 F6 F5
+    assert OP.slot_packet(loco, 3) == [0xc0 | 1000 >> 8, 1000 & 0xff, 0b10100001]      # 1010 F12 F11 F10 F9
+    OP.power_off()
+
+
+def test_combined_estop_and_off():
+    loco = start(3)
+    OP.drive(0, -1)
+    OP.encode_dirty()
+    assert OP.packet_of(loco, OP.SLOT_SPEED)[1:3] == [0b00111100, 0b00000001]
+    OP.update_combined(False)
+    OP.encode_dirty()
+    assert OP.packet_of(loco, OP.SLOT_SPEED) == [3, 0b00111111, 0b00000001]
+    assert OP.slot_packet(loco, 1) == [3, 0b10010100]                                 # 100 F0 F4 F3 F2 F1
+    OP.power_off()
+
+
+# nur bei 128 Fahrstufen
+def test_combined_needs_128_steps():
+    loco = start(3, 28)
+    assert len(OP.packet_of(loco, OP.SLOT_SPEED)) == 2
+    assert OP.slot_packet(loco, 1) == [3, 0b10010100]
+    OP.power_off()
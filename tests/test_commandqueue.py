@@ -0,0 +1,94 @@
+#
+# COMMANDQUEUE und Refresh auf Core 1 (THREADED): Reihenfolge, volle Warteschlange, wait=True
+#
+import _thread
+
+import utime
+
+from classes.commandqueue import COMMANDQUEUE as commandqueue
+from classes.operationmode import OPERATIONS as OP
+
+
+def test_queue_order_and_full():
+    queue = commandqueue(4)
+    assert queue.get() is None
+    assert [queue.put(i) for i in range(4)] == [True, True, True, False]   # ein Platz bleibt frei
+    assert len(queue) == 3 and queue.posted == 3
+    assert queue.get() == 0
+    assert queue.put(3)
+    assert [queue.get() for i in range(4)] == [1, 2, 3, None]
+    assert len(queue) == 0
+
+
+def test_queue_single_producer_single_consumer():
+    queue = commandqueue(8)
+    count = 1000
+    received = []
+    done = []
+
+    def consumer():
+        while len(received) < count:
+            item = queue.get()
+            if item is None:
+                continue
+            received.append(item)
+        done.append(True)
+
+    _thread.start_new_thread(consumer, ())
+    for i in range(count):
+        while not queue.put(i):
+            pass
+    while not done:
+        utime.sleep_ms(1)
+    assert received == list(range(count))
+
+
+def start():
+    OP.THREADED = True
+    OP.__init__()
+    OP.begin()
+    assert OP.threaded()
+
+
+def test_threaded_reads_see_own_commands():
+    start()
+    OP.ctrl_loco(3, False, 128)
+    for step in range(1, 60):
+        OP.drive(step % 2, step)
+        assert OP.speed() == step
+        assert OP.direction() == step % 2
+        OP.set_function(step % 13, True)
+        assert OP.get_function(step % 13)
+    OP.end()
+
+
+def test_threaded_post_full_queue_and_wait():
+    start()
+    OP.ctrl_loco(3, False, 128)
+    expected = {}
+    for i in range(3 * OP.QUEUE_SIZE):      # mehr Aufrufe, als in die Warteschlange passen
+        OP.set_function(i % 29, i % 2 == 0)
+        expected[i % 29] = i % 2 == 0
+    queue = OP.queue
+    assert queue.posted > OP.QUEUE_SIZE
+    assert OP.post(OP.update_name, ("Lok 3",), True)
+    assert queue.done == queue.posted
+    assert OP.find_loco(3).name == "Lok 3"
+    assert all(OP.get_function(nr) == status for nr, status in expected.items())
+    OP.end()
+
+
+# Vorrang-Spur ("edf"): Einträge einer entfernten Lok gelten nicht für die nächste Lok aus dem Pool
+def test_release_drops_urgent_entries():
+    OP.SCHEDULER = "edf"
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_loco(3, False, 128)
+    OP.drive(1, 10)
+    loco = OP.find_loco(3)
+    assert any(entry[0] is loco for entry in OP.urgent)
+    OP.remove_loco(3)
+    assert not any(entry[0] is loco for entry in OP.urgent)
+    OP.ctrl_loco(4, False, 128)
+    assert OP.find_loco(4) is loco          # aus dem Pool
+    OP.power_off()
@@ -0,0 +1,93 @@
+#
+# Mehrfachtraktion (CV19): Traktionsadresse setzen, Mitglied entfernen, Traktion auflösen
+#
+import rp2
+import pytest
+import utime
+
+from classes.operationmode import OPERATIONS as OP
+
+from dcctrace import trace_bits, packets
+
+
+@pytest.fixture
+def trace():
+    rp2.TRACE = True
+    yield
+    rp2.TRACE = False
+
+
+def run(ms):
+    for i in range(ms // 5):
+        OP.loop()
+        utime.sleep_ms(5)
+
+
+def with_xor(packet):
+    err = 0
+    for byte in packet:
+        err ^= byte
+    return tuple(packet) + (err,)
+
+
+# Pakete seit dem letzten Aufruf
+def sent():
+    sm = rp2.statemachines[0]
+    sm.tx_fifo()
+    found = [packet for ones, packet in packets(trace_bits(sm.trace))]
+    sm.trace.clear()
+    return found
+
+
+def consist():
+    OP.__init__()
+    OP.begin()
+    run(300)                            # Einschaltsequenz
+    OP.ctrl_loco(3, False, 28)
+    OP.ctrl_loco(1000, True, 128)
+    OP.ctrl_consist(10, [3, (1000, True)])
+    OP.drive(1, 12)
+    run(200)
+
+
+def test_consist_sets_cv19(trace):
+    consist()
+    found = sent()
+    assert with_xor(OP.pom_multi_packet(3, 19, 10)) in found
+    assert with_xor(OP.pom_multi_packet(1000, 19, 10 | 0x80)) in found
+    assert OP.find_loco(3).consist == OP.find_loco(1000).consist == 10
+    assert OP.find_consist(10).members == [(3, False), (1000, True)]
+    assert not [packet for packet in found if packet[0] == 3 and packet[1] & 0xc0 == 0x40]    # keine eigene Fahrstufe
+    OP.power_off()
+
+
+def test_dissolve_clears_cv19(trace):
+    consist()
+    sent()
+    assert OP.dissolve_consist(10)
+    run(200)
+    found = sent()
+    assert with_xor(OP.pom_multi_packet(3, 19, 0)) in found
+    assert with_xor(OP.pom_multi_packet(1000, 19, 0)) in found
+    assert OP.find_consist(10) is None and OP.find_loco(10) is None
+    assert (OP.find_loco(3).direction, OP.find_loco(3).fs) == (1, 12)
+    assert (OP.find_loco(1000).direction, OP.find_loco(1000).fs) == (0, 12)
+    assert OP.find_loco(3).consist == OP.find_loco(1000).consist == 0
+    OP.power_off()
+
+
+# Mitglied entfernen: nur dieses verlässt die Traktion
+def test_remove_member_clears_cv19(trace):
+    consist()
+    sent()
+    assert OP.remove_loco(3)
+    run(200)
+    found = sent()
+    assert with_xor(OP.pom_multi_packet(3, 19, 0)) in found
+    assert with_xor(OP.pom_multi_packet(1000, 19, 0)) not in found
+    assert OP.find_consist(10).members == [(1000, True)]
+    assert OP.find_loco(1000).consist == 10
+    assert OP.dissolve_consist(10)
+    run(200)
+    assert with_xor(OP.pom_multi_packet(3, 19, 0)) not in sent()
+    OP.power_off()
@@ -0,0 +1,53 @@
+#
+# Strommessung ganzzahlig (Filter in 1/4096, Tabelle in 1/16 mA) gegen die bisherige Rechnung mit floats
+#
+import random
+
+import machine
+import pytest
+
+import classes.operationmode as om
+from classes.operationmode import OPERATIONS as OP
+from classes.currentsampler import CURRENTSAMPLER as currentsampler
+
+
+# bisherige Messung: Glättung und Umrechnung mit floats
+def reference(samples):
+    smoothing = OP.CURRENT_SMOOTHING
+    value = 0
+    peak = 0
+    for sample in samples:
+        value = (sample - value) * smoothing + value * (1 - smoothing)
+        peak = max(value, peak)
+    return round(OP.calibration(peak))
+
+
+@pytest.mark.parametrize("driver", ["LMD18200T", "DRV8871"])
+def test_table_matches_calibration(driver):
+    om.motordriver = driver
+    OP.__init__()
+    table = OP.current_table
+    for raw in range(0, 65536, 7):
+        assert abs(OP.raw2mA(raw) - round(OP.calibration(raw))) <= 1
+    assert OP.raw2mA(65535) == currentsampler.to_mA(table, 65535)
+
+
+@pytest.mark.parametrize("driver", ["LMD18200T", "DRV8871"])
+def test_get_current_matches_float_filter(driver):
+    om.motordriver = driver
+    OP.__init__()
+    r = random.Random(22)
+    for run in range(50):
+        level = r.randrange(65536)
+        samples = [min(65535, max(0, int(r.gauss(level, 2000)))) for i in range(OP.DENOISE_SAMPLES)]
+        machine.ADC.script(OP.ACK_PIN, samples + [samples[-1]])
+        assert abs(OP.get_current() - reference(samples)) <= 1
+
+
+def test_filter_weights():
+    k, k1 = currentsampler.weights(OP.CURRENT_SMOOTHING)
+    assert k + k1 + k == 1 << currentsampler.FILTER_SHIFT     # Verstärkung im Gleichgewicht 1/2 wie bisher
+    value = 0
+    for i in range(200):
+        value = (40000 * k + value * k1 + (1 << currentsampler.FILTER_SHIFT - 1)) >> currentsampler.FILTER_SHIFT
+    assert abs(value - 20000) <= 1
@@ -0,0 +1,57 @@
+#
+# FUNCTION_REFRESH = "decay" und Gruppen ab F13: in welchen Zyklen eine Funktionsgruppe gesendet wird
+#
+from classes.operationmode import OPERATIONS as OP
+
+
+def start(policy):
+    OP.FUNCTION_REFRESH = policy
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_loco(3, False, 28)
+    OP.set_function(0, True)        # F0-F4 (Slot 1): an
+    OP.set_function(13, True)       # F13-F20 (Slot 4): an
+    OP.set_function(21, True)
+    OP.set_function(21, False)      # F21-F28 (Slot 5): benutzt, alle aus
+    loco = OP.find_loco(3)
+    OP.encode_dirty()
+    OP.refresh_fully(loco)
+    return loco
+
+
+# Zyklen (ab 0), in denen die Slots gesendet werden
+def sent(loco, slots, cycles):
+    found = {slot: [] for slot in slots}
+    for cycle in range(cycles):
+        OP.refresh_tick()
+        for slot in slots:
+            if not loco.skipped & (1 << slot):
+                found[slot].append(cycle)
+    return found
+
+
+def test_decay_intervals():
+    loco = start("decay")
+    found = sent(loco, (1, 2, 4, 5), 110)
+    assert found[1] == [0, 1, 2, 3, 4, 6, 10, 18, 26, 34, 42, 50, 58, 66, 74, 82, 90, 98, 106]   # bis FUNCTION_PERIOD_MAX
+    assert found[2] == [0, 1, 2, 3, 4, 6, 10, 18, 34, 66, 98]                                     # aus: bis FUNCTION_PERIOD_OFF
+    assert found[4] == [0, 1, 2, 3, 4, 36, 68, 100]                                               # FUNCTION_PERIOD_HIGH
+    assert found[5] == [0, 1, 2, 3, 4]                                                            # aus: ruht
+    OP.power_off()
+
+
+def test_change_restarts_full_refresh():
+    loco = start("decay")
+    sent(loco, (1,), 40)
+    OP.set_function(1, True)
+    assert sent(loco, (1,), 8)[1] == [0, 1, 2, 3, 4, 6]
+    OP.power_off()
+
+
+def test_always_refreshes_low_groups():
+    loco = start("always")
+    found = sent(loco, (1, 2, 3, 4, 5), 70)
+    assert found[1] == found[2] == found[3] == list(range(70))
+    assert found[4] == [0, 1, 2, 3, 4, 36, 68]
+    assert found[5] == [0, 1, 2, 3, 4]
+    OP.power_off()
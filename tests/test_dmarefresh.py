@@ -0,0 +1,59 @@
+#
+# Refresh per DMA (DMAREFRESH): Neustart im harten IRQ, einmalige Pakete genau einmal
+#
+import rp2
+import utime
+
+from classes.operationmode import OPERATIONS as OP
+
+from dcctrace import trace_bits, packets
+
+
+def run(ms):
+    for i in range(ms // 5):
+        OP.loop()
+        utime.sleep_ms(5)
+
+
+def test_rearm_hard_irq_with_prepared_views():
+    OP.REFRESH = "dma"
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_loco(3, False, 128)
+    OP.drive(1, 10)
+    run(100)
+    rp2.statemachines[0].tx_fifo()     # Host: DMA bis jetzt nachziehen
+    feeder = OP.feeder
+    assert feeder.dma.hard
+    cycles = feeder.cycles
+    firsts = list(feeder.firsts)
+    cycleviews = list(feeder.cycleviews)
+    run(100)
+    rp2.statemachines[0].tx_fifo()
+    assert feeder.cycles > cycles
+    assert feeder.firsts == firsts and feeder.cycleviews == cycleviews     # ohne submit() keine neuen Views
+    OP.power_off()
+
+
+def test_oneshot_words_sent_once():
+    rp2.TRACE = True
+    try:
+        OP.REFRESH = "dma"
+        OP.__init__()
+        OP.begin()
+        OP.ctrl_loco(3, False, 128)
+        run(200)
+        OP.ctrl_accessory_basic(12, 1, 1)
+        OP.drive(1, 10)
+        run(100)
+        OP.drive(1, 20)         # neuer Zyklus ohne einmalige Pakete
+        run(200)
+    finally:
+        rp2.TRACE = False
+    sm = rp2.statemachines[0]
+    sm.tx_fifo()
+    found = [packet for ones, packet in packets(trace_bits(sm.trace))]
+    accessory = [packet for packet in found if len(packet) == 3 and packet[0] & 0xc0 == 0x80]
+    assert len(accessory) == 1
+    assert (3, 0b00111111, 0b10010101, 3 ^ 0b00111111 ^ 0b10010101) in found     # Fahrstufe 20
+    OP.power_off()
@@ -0,0 +1,29 @@
+#
+# host.install(): Ersatzmodule nur ohne echtes machine-Modul (bzw. ohne Pin/ADC)
+#
+import sys
+import types
+
+import host
+
+
+def install_with(fake):
+    saved = {name: sys.modules.get(name) for name in host.MODULES}
+    sys.modules["machine"] = fake
+    try:
+        return host.install(), sys.modules["machine"]
+    finally:
+        for name, module in saved.items():
+            sys.modules[name] = module
+
+
+def test_install_keeps_real_machine():
+    real = types.ModuleType("machine")
+    real.Pin = real.ADC = object
+    assert install_with(real) == (False, real)
+
+
+def test_install_replaces_machine_without_pin():
+    unix = types.ModuleType("machine")      # MicroPython-Unix-Port: kein Pin, kein ADC
+    assert install_with(unix) == (True, host.machine)
+    assert host.install()
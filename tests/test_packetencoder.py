@@ -0,0 +1,139 @@
+#
+# PACKETENCODER, BITPACKER und BYTEPACKER gegen prepare() / make_buffer() und den Bitstrom nach NMRA S-9.2
+#
+import random
+
+from classes.operationmode import OPERATIONS as OP
+from classes.packetencoder import PACKETENCODER as encoder, BITPACKER as bitpacker, BYTEPACKER as bytepacker, HIGH
+
+from dcctrace import word_bits, packets
+
+
+def random_packets(count, seed=1):
+    r = random.Random(seed)
+    return [[r.randrange(256) for i in range(r.randrange(2, 6))] for n in range(count)]
+
+
+def xor(packet):
+    err = 0
+    for byte in packet:
+        err ^= byte
+    return err
+
+
+# Bitstrom eines Pakets: Präambel 0 [Byte] ... 0 [XOR] 1
+def reference_bits(packet, preamble):
+    return "1" * preamble + "".join("0{:08b}".format(byte) for byte in packet + [xor(packet)]) + "1"
+
+
+def test_encode_matches_prepare():
+    OP.__init__()
+    for packet in random_packets(500) + [[0xff, 0x00], [0x00, 0x00], [0xc3, 0xe8, 0x3f, 0x90, 0x12]]:
+        count, stream = OP.prepare(list(packet))
+        expected = OP.make_buffer([count], [stream])
+        buffer = encoder.wordbuffer(4)
+        words = encoder.encode(packet, buffer, 0, OP.PREAMBLE)
+        assert words == count == encoder.words(len(packet), OP.PREAMBLE)
+        assert list(buffer[:words]) == expected
+
+
+def test_encode_preambles():
+    for preamble in (10, 14, 20, 23, 40):
+        for packet in random_packets(50, preamble):
+            buffer = encoder.wordbuffer(8)
+            words = encoder.encode(packet, buffer, 1, preamble)
+            bits = word_bits(buffer[1:1 + words])
+            padding = len(bits) - len(reference_bits(packet, preamble))
+            assert 0 <= padding < 32
+            assert bits == "1" * padding + reference_bits(packet, preamble)
+
+
+def test_bitpacker_stream():
+    for preamble in (14, 20):
+        cycle = random_packets(40, preamble)
+        packer = bitpacker(preamble)
+        buffer = encoder.wordbuffer(packer.words([len(p) for p in cycle]))
+        packer.begin(buffer)
+        for packet in cycle:
+            packer.append(packet)
+        words = packer.finish()
+        assert words == len(buffer)
+        expected = "".join(reference_bits(packet, preamble) for packet in cycle)
+        bits = word_bits(buffer)
+        assert bits == expected + "1" * (len(bits) - len(expected))
+        report = packer.report()
+        assert report["packet_bits"] == len(expected)
+        assert report["padding_bits"] == len(bits) - len(expected)
+        assert [packet for ones, packet in packets(bits)] == [tuple(p + [xor(p)]) for p in cycle]
+
+
+def test_bytepacker_layout():
+    cycle = random_packets(40, 7)
+    packer = bytepacker()
+    buffer = encoder.wordbuffer(packer.words([len(p) for p in cycle]))
+    packer.begin(buffer)
+    for packet in cycle:
+        packer.append(packet)
+    words = packer.finish()
+    assert words == len(buffer)
+    data = b"".join(word.to_bytes(4, "big") for word in buffer)
+    expected = b"".join(bytes([len(p) + 1] + p + [xor(p)]) for p in cycle)
+    assert data == expected + bytes(len(data) - len(expected))
+    assert packer.report()["padding_bits"] == len(data) - len(expected)
+
+
+# Sicht ohne memoryview.cast(), wie das uctypes-ARRAY auf dem pico: nur Index-Zugriff auf die
+# 16-Bit-Hälften (der uctypes-Zweig von halves() selbst läuft nur auf der Hardware)
+class HALVES:
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __setitem__(self, index, value):
+        shift = 16 if index & 1 == HIGH else 0
+        word = self.buffer[index >> 1] & ~(0xffff << shift)
+        self.buffer[index >> 1] = word | value << shift
+
+
+def test_encode_with_own_view():
+    for packet in random_packets(100, 3):
+        expected = encoder.wordbuffer(8)
+        words = encoder.encode(packet, expected, 1, OP.PREAMBLE)
+        buffer = encoder.wordbuffer(8)
+        assert encoder.encode(packet, buffer, 1, OP.PREAMBLE, HALVES(buffer)) == words
+        assert list(buffer) == list(expected)
+    cycle = random_packets(20, 4)
+    for packer in (bitpacker(), bytepacker()):
+        results = []
+        for view in (False, True):
+            buffer = encoder.wordbuffer(packer.words([len(p) for p in cycle]))
+            packer.begin(buffer, 0, HALVES(buffer) if view else None)
+            for packet in cycle:
+                packer.append(packet)
+            packer.finish()
+            results.append(list(buffer))
+        assert results[0] == results[1]
+
+
+# Sichten werden je Puffer einmal angelegt: ein weiterer Zyklus mit wechselnden Slot-Puffern,
+# Fahrstufentabellen und Wortpuffer erzeugt keine neue
+def test_views_cached_per_buffer(monkeypatch):
+    for packing in ("word", "continuous"):
+        OP.PACKING = packing
+        OP.__init__()
+        OP.begin()
+        for address in range(3, 8):
+            OP.ctrl_loco(address, False, 28)
+            OP.drive(1, 10)
+        OP.buffering()
+        calls = []
+        halves = encoder.halves
+        monkeypatch.setattr(encoder, "halves", lambda buffer: calls.append(buffer) or halves(buffer))
+        for fs in (11, 12, 11, 12):
+            for address in range(3, 8):
+                OP.ctrl_loco(address, False, 28)
+                OP.drive(1, fs)
+            OP.buffering()
+        assert calls == []
+        monkeypatch.undo()
+        OP.power_off()
@@ -0,0 +1,91 @@
+#
+# Loks und Zubehör nach Adresse: loco_index / accessory_index gegen die Listen, LOCO-Pool
+#
+import random
+
+from classes.operationmode import OPERATIONS as OP, ACCESSORY
+
+
+def consistent():
+    assert OP.loco_index == {loco.address: loco for loco in OP.locos}
+    assert len(OP.loco_index) == len(OP.locos)
+    for index, loco in enumerate(OP.locos):
+        assert OP.find_loco(loco.address) is loco
+        assert OP.search(loco.address) == index
+    assert OP.accessory_index == {device.address: device for device in OP.accessories}
+
+
+def test_loco_lookup():
+    OP.__init__()
+    OP.begin()
+    r = random.Random(8)
+    for i in range(300):
+        address = r.choice((3, 4, 5, 99, 100, 1000, 2000))
+        if r.random() < 0.3:
+            known = OP.find_loco(address) is not None
+            assert OP.remove_loco(address) == known
+            assert OP.find_loco(address) is None
+            assert OP.search(address) is None
+        else:
+            OP.ctrl_loco(address, address > 127, r.choice((14, 28, 128)))
+            assert OP.active_loco is OP.find_loco(address)
+        consistent()
+    OP.power_off()
+
+
+def test_accessory_lookup():
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_accessory_basic(12, 1, 0)
+    OP.ctrl_accessory_basic(7, 0, 1)
+    OP.ctrl_accessory_extended(20, 5)
+    OP.ctrl_accessory_basic(12, 0, 1)       # bekannter Decoder: Zustand übernehmen
+    consistent()
+    assert [device.address for device in OP.accessories] == [12, 7, 20]
+    device = OP.find_accessory(12)
+    assert (device.D, device.R) == (0, 1)
+    assert OP.find_accessory(20).aspect == 5
+    assert OP.search_accessory(7) == 1
+    assert OP.find_accessory(13) is None and OP.search_accessory(13) is None
+    OP.power_off()
+
+
+# entfernte Loks kommen in den Pool und werden für die nächste neue Adresse zurückgesetzt
+def test_loco_pool_reuse():
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_loco(3, False, 128)
+    OP.drive(0, 40)
+    OP.set_function(0, True)
+    OP.set_function(20, True)
+    loco = OP.find_loco(3)
+    assert (loco.direction, loco.fs, loco.functions) == (0, 40, 1 | 1 << 20)
+    assert OP.remove_loco(3)
+    assert OP.loco_pool == [loco]
+    OP.ctrl_loco(1000, True, 28)
+    assert OP.find_loco(1000) is loco and OP.loco_pool == []
+    assert (loco.address, loco.use_long_address, loco.speedsteps) == (1000, True, 28)
+    assert (loco.direction, loco.fs, loco.functions, loco.consist) == (1, 0, 0, 0)
+    assert not OP.get_function(0) and not OP.get_function(20)
+    OP.encode_dirty()
+    assert OP.packet_of(loco, OP.SLOT_SPEED)[:2] == [192 | 1000 // 256, 1000 & 0xff]
+    OP.power_off()
+
+
+def test_loco_pool_limit():
+    OP.__init__()
+    OP.begin()
+    for address in range(3, 3 + OP.LOCO_POOL + 5):
+        OP.ctrl_loco(address)
+    for address in range(3, 3 + OP.LOCO_POOL + 5):
+        OP.remove_loco(address)
+    assert len(OP.loco_pool) == OP.LOCO_POOL and OP.locos == []
+    OP.power_off()
+
+
+def test_accessory_flags():
+    device = ACCESSORY(1, R=1, D=0, signal=True)
+    assert (device.R, device.D, device.signal, device.timed) == (1, 0, True, False)
+    device.D = 1
+    device.R = 0
+    assert (device.R, device.D, device.signal) == (0, 1, True)
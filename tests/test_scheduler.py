@@ -0,0 +1,89 @@
+#
+# SCHEDULER = "edf": Vorrang-Spur, Reihenfolge der Termine, Überlauf der ticks
+#
+import utime
+
+from classes.operationmode import OPERATIONS as OP
+
+
+def edf(count):
+    OP.SCHEDULER = "edf"
+    OP.__init__()
+    OP.begin()
+    for address in range(3, 3 + count):
+        OP.ctrl_loco(address, False, 28)
+        OP.drive(1, address)
+    OP.encode_dirty()
+    return {(loco.address, slot) for loco in OP.locos
+            for slot, words in enumerate(loco.slots) if words is not None}
+
+
+# (Adresse, Slot) des nächsten Pakets, None für einmalige Worte bzw. Idle
+def pick(slots):
+    OP.next_scheduled()
+    for loco in OP.locos:
+        for slot, words in enumerate(loco.slots):
+            if words is not None and words is OP.feed_words:
+                return loco.address, slot
+
+
+def earliest():
+    return min(loco.deadlines[slot] for loco in OP.locos
+               for slot in range(len(loco.slots)) if loco.slots[slot] is not None and loco.skips[slot] != 255)
+
+
+def drain_urgent(slots):
+    while OP.urgent:
+        pick(slots)
+
+
+def test_urgent_first():
+    slots = edf(3)
+    drain_urgent(slots)
+    OP.ctrl_loco(4, False, 28)
+    OP.drive(0, 7)
+    assert [pick(slots) for i in range(OP.URGENT_REPEATS)] == [(4, OP.SLOT_SPEED)] * OP.URGENT_REPEATS
+    assert OP.schedule_report["urgent"] > 0
+
+
+def test_earliest_deadline_first():
+    slots = edf(4)
+    drain_urgent(slots)
+    seen = set()
+    for i in range(400):
+        utime.sleep_ms(5)
+        due = earliest()
+        before = OP.clock_ms()
+        address, slot = pick(slots)
+        period = OP.REFRESH_SPEED_MS if slot == OP.SLOT_SPEED else OP.REFRESH_FUNCTION_MS
+        assert before + period <= OP.loco_index[address].deadlines[slot] <= OP.clock_ms() + period
+        assert due <= earliest()
+        seen.add((address, slot))
+    assert seen == slots
+
+
+# ticks_diff() gilt nur für eine halbe Periode: über den Überlauf hinweg müssen alle Slots
+# weiter an die Reihe kommen
+def test_deadlines_across_ticks_wrap():
+    slots = edf(3)
+    drain_urgent(slots)
+    for hour in range(160):         # > 2^29 ms
+        utime.sleep_ms(3600 * 1000)
+        for i in range(20):
+            pick(slots)
+            utime.sleep_ms(5)
+        assert 0 <= OP.clock_ms() < OP.EPOCH_SHIFT_MS
+    seen = set()
+    for i in range(300):            # > REFRESH_FUNCTION_MS
+        seen.add(pick(slots))
+        utime.sleep_ms(5)
+    assert seen == slots
+
+
+def test_edf_with_dma_reported(capsys):
+    OP.SCHEDULER = "edf"
+    OP.REFRESH = "dma"
+    OP.__init__()
+    OP.begin()
+    assert "edf" in capsys.readouterr().out
+    OP.power_off()
@@ -0,0 +1,179 @@
+#
+# Kurzschluss über den CURRENTSAMPLER: Abschaltung, Wiedereinschalten mit SHORT_RETRY
+#
+from array import array
+
+import machine
+import pytest
+import rp2
+import utime
+
+import classes.operationmode as om
+from classes.operationmode import OPERATIONS as OP
+from classes.currentsampler import CURRENTSAMPLER as currentsampler
+
+from dcctrace import trace_bits, packets
+
+NORMAL = 3000       # Rohwert ~ 100 mA (DRV8871)
+SHORT = 60000       # Rohwert weit über SHORT_TRIP
+
+
+def start(refresh="put", retry=False):
+    om.motordriver = "DRV8871"
+    machine.ADC.script(27, lambda t: NORMAL)
+    OP.REFRESH = refresh
+    OP.SAMPLER = True
+    OP.SHORT_RETRY = retry
+    OP.__init__()
+    OP.begin()
+    OP.ctrl_loco(3, False, 128)
+    OP.drive(1, 10)
+    for i in range(50):
+        OP.loop()
+        utime.sleep_ms(2)
+
+
+# Strom ab jetzt für 'duration_us' (None: dauerhaft) auf SHORT, liefert den Beginn
+def short(duration_us=None):
+    begin = utime.now_us()
+    end = None if duration_us is None else begin + duration_us
+    machine.ADC.script(27, lambda t: SHORT if t >= begin and (end is None or t < end) else NORMAL)
+    return begin
+
+
+def test_trip_cuts_power():
+    start()
+    begin = short()
+    off = None
+    with pytest.raises(RuntimeError):
+        for i in range(200):
+            OP.loop()
+            utime.sleep_us(250)
+            if off is None and not OP.power.value():
+                off = utime.now_us() - begin
+    assert off is not None and off < 20000
+    assert OP.short_report["trips"] == 1
+    assert OP.short_report["mA"] > OP.SHORT_TRIP
+    assert not OP.power_state
+
+
+def test_spike_below_samples_does_not_trip():
+    start()
+    begin = utime.now_us() + 10000
+    machine.ADC.script(27, lambda t: SHORT if begin <= t < begin + 750 else NORMAL)
+    for i in range(100):
+        OP.loop()
+        utime.sleep_us(250)
+    assert OP.short_report["trips"] == 0
+    assert OP.power.value()
+
+
+# Kurzschluss für 100 ms, mit SHORT_RETRY: Pakete ab dem Wiedereinschalten
+def replayed(refresh="put", setup=None):
+    rp2.TRACE = True
+    try:
+        start(refresh, retry=True)
+        if setup is not None:
+            setup()
+            while OP.accessory_buffer or OP.pom_buffer:
+                OP.loop()
+                utime.sleep_ms(2)
+            for i in range(50):
+                OP.loop()
+                utime.sleep_ms(2)
+    finally:
+        rp2.TRACE = False
+    sm = rp2.statemachines[0]
+    begin = short(100000)
+    resumed = None
+    for i in range(2000):
+        OP.loop()
+        utime.sleep_us(500)
+        if resumed is None and OP.short_report["trips"] and OP.power.value():
+            resumed = utime.now_us() - begin
+            sm.tx_fifo()
+            mark = len(sm.trace)
+    assert OP.short_report["trips"] >= 1
+    assert resumed is not None and resumed >= OP.SHORT_RETRY_MS * 1000
+    assert OP.power_state
+    sm.tx_fifo()
+    return [packet for ones, packet in packets(trace_bits(sm.trace[mark:], 2))]
+
+
+def with_xor(packet):
+    err = 0
+    for byte in packet:
+        err ^= byte
+    return tuple(packet) + (err,)
+
+
+@pytest.mark.parametrize("refresh", ["put", "dma"])
+def test_retry_resumes_and_replays(refresh):
+    found = replayed(refresh)
+    assert (3, 0b00111111, 0b10001011, 3 ^ 0b00111111 ^ 0b10001011) in found[:4]   # Fahrstufe sofort wieder
+    assert (0, 0, 0) not in found                                                  # kein RESET
+    OP.power_off()
+
+
+# Basic-Zubehör mit D = 1 nicht wiederholen (Spule), D = 0 und Signalbegriffe schon; CV19 der Traktion wieder schreiben
+def test_replay_accessories_and_consist():
+    def setup():
+        OP.ctrl_loco(1000, True, 128)
+        OP.ctrl_accessory_basic(12, 1, 1)
+        OP.ctrl_accessory_basic(13, 0, 1)
+        OP.ctrl_accessory_extended(20, 5)
+        OP.ctrl_consist(10, [3, (1000, True)])
+    found = replayed(setup=setup)
+    index = OP.accessory_index
+    assert with_xor(OP.accessory_packet(index[12])) not in found
+    assert with_xor(OP.accessory_packet(index[13])) in found
+    assert with_xor(OP.accessory_packet(index[20])) in found
+    assert found.count(with_xor(OP.pom_multi_packet(3, 19, 10))) == 2
+    assert found.count(with_xor(OP.pom_multi_packet(1000, 19, 10 | 0x80))) == 2
+    assert (0, 0, 0) not in found
+    OP.power_off()
+
+
+def test_retry_gives_up():
+    start(retry=True)
+    short()
+    with pytest.raises(RuntimeError):
+        for i in range(40000):
+            OP.loop()
+            utime.sleep_ms(1)
+    assert OP.short_report["trips"] == OP.SHORT_RETRIES + 1
+    assert not OP.power_state
+
+
+def test_sampler_off_by_default():
+    OP.__init__()
+    OP.begin()
+    assert not OP.SAMPLER and not OP.TELEMETRY
+    assert OP.sampler is None
+    OP.power_off()
+
+
+# direkt nach dem Start ist das Fenster leer: get_current() misst selbst statt zu warten
+def test_get_current_before_window_full():
+    om.motordriver = "DRV8871"
+    machine.ADC.script(27, lambda t: NORMAL)
+    OP.SAMPLER = True
+    OP.__init__()
+    OP.begin()
+    OP.stop_sampler()
+    OP.start_sampler()
+    assert not OP.sampler.ready()
+    assert 0 < OP.get_current() <= OP.raw2mA(NORMAL)
+    assert not OP.sampler.ready()
+    OP.power_off()
+
+
+# delay_us zählt die Messungen nach dem Ende des Blocks (IRQ zu spät) mit
+def test_trip_delay_includes_irq_latency():
+    delays = []
+    for late in (0, 5):
+        sampler = currentsampler(27, 4000, 20)
+        sampler.set_trip(20000, 15000, 4, lambda sampler, delay_us: delays.append(delay_us))
+        sampler._scan(array('H', [0] * 10 + [0xfff] * 10), True, late)
+    assert len(delays) == 2
+    assert delays[1] - delays[0] == 5 * 1000000 // 4000
@@ -0,0 +1,52 @@
+#
+# SPEEDCODEC: Fahrstufen-Codes nach NMRA RP 9.2 / 9.2.1, Hin- und Rückweg
+#
+import pytest
+
+from classes.speedcodec import SPEEDCODEC as speedcodec
+
+
+# Fahrstufen-Code direkt nach der Norm: 0 = Stop, 1 = Notstop, danach die Fahrstufen
+def reference(speedsteps, speed):
+    if speed == -1:
+        return 1
+    if speed == 0:
+        return 0
+    if speedsteps == 28:
+        value = speed + 3                       # 4 .. 31, C = niederwertigstes Bit
+        return (value & 1) << 4 | value >> 1
+    return speed + 1
+
+
+@pytest.mark.parametrize("speedsteps", [14, 28, 128])
+def test_codes_match_nmra(speedsteps):
+    top = speedcodec.top(speedsteps)
+    for direction in (0, 1):
+        for speed in range(-1, top + 1):
+            instruction = speedcodec.instruction(speedsteps, direction, speed)
+            if speedsteps == 128:
+                assert instruction == [0b00111111, direction << 7 | reference(128, speed)]
+            else:
+                assert instruction == [0b01000000 | direction << 5 | reference(speedsteps, speed)]
+            assert speedcodec.decode(speedsteps, instruction) == (direction, speed, 0)
+
+
+def test_estop_and_stop_codes():
+    assert speedcodec.instruction(14, 1, -1) == [0b01100001]
+    assert speedcodec.instruction(28, 1, -1) == [0b01100001]
+    assert speedcodec.instruction(128, 1, -1) == [0b00111111, 0b10000001]
+    assert speedcodec.instruction(28, 0, 0) == [0b01000000]
+    # Stop (I) und Notstop (I) mit gesetztem C-Bit bei 28 Fahrstufen
+    assert speedcodec.decode(28, [0b01110000]) == (1, 0, 0)
+    assert speedcodec.decode(28, [0b01110001]) == (1, -1, 0)
+
+
+def test_limits_and_headlight():
+    for speedsteps in (14, 28, 128):
+        top = speedcodec.top(speedsteps)
+        assert speedcodec.instruction(speedsteps, 1, top + 50) == speedcodec.instruction(speedsteps, 1, top)
+        assert speedcodec.instruction(speedsteps, 1, -5) == speedcodec.instruction(speedsteps, 1, 0)
+    assert speedcodec.instruction(14, 1, 7, 1) == [0b01111000]
+    assert speedcodec.decode(14, [0b01111000]) == (1, 7, 1)
+    assert speedcodec.instruction(27, 1, 7) == []
+
@@ -0,0 +1,60 @@
+#
+# CURRENTTELEMETRY: Fenster, Perzentile (Rang-Verfahren), Ringe der Messwerte und Sekundenwerte
+#
+import utime
+
+from classes.operationmode import OPERATIONS as OP
+from classes.currenttelemetry import CURRENTTELEMETRY as currenttelemetry
+
+
+# Messwerte im Abstand von step_ms eintragen, die Uhr des Hosts steht dabei
+def record(telemetry, values, step_ms=1):
+    utime.freeze()
+    for value in values:
+        telemetry.record(value)
+        utime.sleep_ms(step_ms)
+    utime.thaw()
+
+
+def test_stats_nearest_rank():
+    telemetry = currenttelemetry(200, 10)
+    record(telemetry, [100, 10, 90, 20, 80, 30, 70, 40, 60, 50])
+    stats = telemetry.stats(1000, (0, 50, 90, 99, 100))
+    assert stats == {"count": 10, "min": 10, "max": 100, "mean": 55,
+                     "p0": 10, "p50": 50, "p90": 90, "p99": 100, "p100": 100}
+    record(telemetry, range(1, 101))
+    stats = telemetry.stats(100)            # nur die 100 neuen Werte
+    assert (stats["count"], stats["p50"], stats["p90"], stats["p99"]) == (100, 50, 90, 99)
+
+
+def test_window_and_rollover():
+    telemetry = currenttelemetry(10, 10)
+    assert telemetry.stats() is None
+    record(telemetry, range(25), 10)
+    assert telemetry.count == 10
+    assert telemetry.window(1000) == list(range(15, 25))
+    assert telemetry.window(30) == [22, 23, 24]
+    telemetry.clear()
+    assert telemetry.window(1000) == [] and telemetry.history() == []
+
+
+def test_history_per_second():
+    telemetry = currenttelemetry(100, 3)
+    utime.sleep_ms(1000 - utime.ticks_ms() % 1000)
+    for second in range(5):
+        record(telemetry, [second * 10 + i for i in range(4)], 250)
+    history = telemetry.history()
+    assert len(history) == 3                # Ring der Sekundenwerte voll, die laufende Sekunde fehlt noch
+    assert [entry[1:] for entry in history] == [(10, 13, 11), (20, 23, 21), (30, 33, 31)]
+    assert [entry[0] - history[0][0] for entry in history] == [0, 1, 2]
+    assert [entry[1:] for entry in telemetry.history(1)] == [(30, 33, 31)]
+
+
+def test_telemetry_in_mA():
+    OP.__init__()
+    OP.telemetry = currenttelemetry(100, 10)
+    record(OP.telemetry, [1000, 2000, 3000])
+    stats = OP.current_telemetry()
+    assert stats["count"] == 3
+    assert (stats["min"], stats["max"]) == (OP.raw2mA(1000), OP.raw2mA(3000))
+    OP.telemetry = None